@@ -0,0 +1,321 @@
+"""Offline microbenchmarks for the bot's hot paths (no Telegram, no BOT_DB).
+
+Run:
+    python bench.py                          # all cases, all sizes
+    python bench.py --only search_faq        # cases whose name contains the substring
+    python bench.py --json bench.json        # save results
+    python bench.py --compare bench.json     # compare with a previous run (e.g. from another commit)
+
+Data is synthetic and generated from a fixed seed, so runs are comparable between commits.
+New cases: decorate a setup function with @bench(name, sizes); it gets (size, rnd) and
+returns the zero-argument callable (sync or async) to time.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import inspect
+import json
+import logging
+import platform
+import random
+import statistics
+import os
+import sqlite3
+import subprocess
+import tempfile
+import time
+from typing import Any, Callable
+
+import db
+
+SEED = 1234
+ARTICLE_SIZES = [10, 1_000, 10_000]
+REMINDER_SIZES = [1_000, 1_000_000]
+STARTUP_SIZES = [1_000, 100_000]
+
+_WORDS = (
+    "терминал заказ сборка возврат погрузка курьер сборщик смена точка склад доставка "
+    "клиент оплата приложение проверка упаковка срок годности правила безопасность "
+    "выдача маршрут телефон супервайзер инструкция остатки касса"
+).split()
+_ROLES = ["Курьер", "Сборщик"]
+_LANGS = ["RU", "EN", "UZ", "TJ", "KG"]
+_SHOPS = ["Шереметьевская", "Таллинское"]
+
+BenchSetup = Callable[[int, random.Random], Callable[[], Any]]
+_REGISTRY: list[tuple[str, list[int], BenchSetup]] = []
+
+
+def bench(name: str, sizes: list[int]):
+    def deco(fn: BenchSetup) -> BenchSetup:
+        _REGISTRY.append((name, sizes, fn))
+        return fn
+    return deco
+
+
+# ----------------------------
+# Synthetic data
+# ----------------------------
+def _phrase(rnd: random.Random, n: int) -> str:
+    return " ".join(rnd.choice(_WORDS) for _ in range(n))
+
+
+def make_articles(n: int, rnd: random.Random) -> list[dict[str, str]]:
+    out = []
+    for i in range(n):
+        tags = rnd.choice(["", "training", "kb", "links", "support"])
+        if tags in ("training", "kb") and rnd.random() < 0.7:
+            tags += "," + rnd.choice(_ROLES)
+        out.append({
+            "id": str(i + 1),
+            "title": f"{_phrase(rnd, 3).capitalize()} {i}",
+            "body": _phrase(rnd, 25),
+            "tags": tags,
+        })
+    return out
+
+
+def load_articles(n: int, rnd: random.Random) -> None:
+    db.FAQ_ARTICLES[:] = make_articles(n, rnd)
+
+
+def load_users(n: int, rnd: random.Random) -> None:
+    db.users_db.clear()
+    for uid in range(1, n + 1):
+        db.users_db[uid] = (uid, f"user{uid}", rnd.choice(_ROLES), rnd.choice(_SHOPS), rnd.choice(_LANGS), None)
+
+
+# ----------------------------
+# Cases
+# ----------------------------
+@bench("db.search_faq", ARTICLE_SIZES)
+def _search_faq(size: int, rnd: random.Random):
+    load_articles(size, rnd)
+    queries = [_phrase(rnd, 2) for _ in range(16)]
+    it = iter(range(1 << 62))
+    return lambda: db.search_faq(queries[next(it) % len(queries)], limit=5)
+
+
+@bench("db.materials_for_role", ARTICLE_SIZES)
+def _materials_for_role(size: int, rnd: random.Random):
+    load_articles(size, rnd)
+    return lambda: db.materials_for_role("Курьер", limit=24)
+
+
+@bench("translations.tr", [1_000])
+def _tr(size: int, rnd: random.Random):
+    from translations import tr
+    load_users(size, rnd)
+    uids = [rnd.randint(1, size) for _ in range(64)]
+    it = iter(range(1 << 62))
+    return lambda: tr("reminder_push", uids[next(it) % len(uids)], text="Проверить терминал")
+
+
+@bench("db.select_users", [1_000, 100_000])
+def _select_users(size: int, rnd: random.Random):
+    load_users(size, rnd)
+    db._rebuild_indexes()
+    return lambda: db.select_users(role="Сборщик", shop="Таллинское", lang="UZ")
+
+
+@bench("db.find_users", [1_000, 100_000])
+def _find_users(size: int, rnd: random.Random):
+    load_users(size, rnd)
+    db._rebuild_indexes()
+    return lambda: db.find_users("user123")
+
+
+@bench("keyboards.main_menu", [1])
+def _main_menu(size: int, rnd: random.Random):
+    from keyboards import main_menu
+    return lambda: main_menu(role="Курьер", user_id=1, lang="RU")
+
+
+@bench("bot._knowledge_kb", ARTICLE_SIZES)
+def _knowledge_kb(size: int, rnd: random.Random):
+    import bot
+    load_articles(size, rnd)
+    load_users(10, rnd)
+    return lambda: bot._knowledge_kb(1, "Курьер", "RU", False)
+
+
+@bench("bot._is_topic_title.miss", ARTICLE_SIZES)
+def _is_topic_title_miss(size: int, rnd: random.Random):
+    import bot
+    load_articles(size, rnd)
+    return lambda: bot._is_topic_title("обычное сообщение пользователя")
+
+
+@bench("bot._is_topic_title.hit", ARTICLE_SIZES)
+def _is_topic_title_hit(size: int, rnd: random.Random):
+    import bot
+    load_articles(size, rnd)
+    title = db.FAQ_ARTICLES[-1]["title"]
+    return lambda: bot._is_topic_title(title)
+
+
+@bench("db.pop_due_reminders", REMINDER_SIZES)
+def _pop_due_reminders(size: int, rnd: random.Random):
+    # очередь на `size` напоминаний, каждый вызов достаёт следующие 10 "созревших";
+    # опустевшую очередь заполняем заново (редкий выброс, на медиану не влияет)
+    def refill() -> None:
+        db.reminders[:] = [db.Reminder(id=i, run_at_ts=float(i), user_id=i % 1000, text="x") for i in range(size)]
+    refill()
+    state = {"now": 0.0}
+
+    async def pop() -> None:
+        if not db.reminders:
+            refill()
+            state["now"] = 0.0
+        state["now"] += 10
+        await db.pop_due_reminders(state["now"] - 1)
+    return pop
+
+
+def make_db_file(users: int, rnd: random.Random) -> str:
+    """SQLite-файл со схемой db.py: `users` пользователей, по напоминанию на 10 из них, 500 отзывов."""
+    path = os.path.join(tempfile.mkdtemp(prefix="bench-"), "bench.db")
+    conn = sqlite3.connect(path)
+    for m in db.MIGRATIONS:
+        if isinstance(m, str):
+            conn.executescript(m)
+    conn.executemany(
+        "INSERT INTO users(user_id, username, role, shop, lang, phone) VALUES(?,?,?,?,?,?)",
+        [(uid, f"user{uid}", rnd.choice(_ROLES), rnd.choice(_SHOPS), rnd.choice(_LANGS), f"+7999{uid:07d}")
+         for uid in range(1, users + 1)],
+    )
+    conn.executemany(
+        "INSERT INTO reminders(user_id, run_at_ts, text) VALUES(?,?,?)",
+        [(uid, time.time() + rnd.randint(60, 86400 * 30), _phrase(rnd, 3)) for uid in range(1, users + 1, 10)],
+    )
+    conn.executemany(
+        "INSERT INTO feedback(user_id, text, created_at) VALUES(?,?,?)",
+        [(rnd.randint(1, users), _phrase(rnd, 8), "2024-01-01T00:00:00+00:00") for _ in range(500)],
+    )
+    conn.execute(f"PRAGMA user_version={db.SCHEMA_VERSION}")
+    conn.commit()
+    conn.close()
+    return path
+
+
+def _startup(size: int, rnd: random.Random, warm: bool):
+    # время до готовности кэшей после рестарта: close_db + init_db на файле с `size` пользователями.
+    # warm — есть актуальный снапшот кэшей, cold — полная загрузка из SQLite.
+    path = make_db_file(size, rnd)
+    state = {"primed": False}
+
+    async def restart() -> None:
+        await db.close_db(snapshot=False)
+        if not warm and os.path.exists(path + ".cache"):
+            os.remove(path + ".cache")
+        await db.init_db(path)
+        if warm and not state["primed"]:
+            # первый (непрогретый) прогон пишет снапшот, дальше init_db читает его
+            await db.save_snapshot()
+            state["primed"] = True
+    return restart
+
+
+# последними: переключают db на файл, остальным кейсам нужен только кэш в памяти
+@bench("db.init_db.cold", STARTUP_SIZES)
+def _startup_cold(size: int, rnd: random.Random):
+    return _startup(size, rnd, warm=False)
+
+
+@bench("db.init_db.warm", STARTUP_SIZES)
+def _startup_warm(size: int, rnd: random.Random):
+    return _startup(size, rnd, warm=True)
+
+
+# ----------------------------
+# Runner
+# ----------------------------
+async def _time_case(fn: Callable[[], Any], min_time: float, max_iter: int) -> dict[str, float]:
+    is_async = inspect.iscoroutinefunction(fn)
+    # один прогон вне замера: прогрев кэшей/ленивой инициализации
+    if is_async:
+        await fn()
+    else:
+        fn()
+    samples: list[float] = []
+    total = 0.0
+    while total < min_time and len(samples) < max_iter:
+        t0 = time.perf_counter()
+        if is_async:
+            await fn()
+        else:
+            fn()
+        dt = time.perf_counter() - t0
+        samples.append(dt)
+        total += dt
+    return {
+        "iterations": len(samples),
+        "median_us": round(statistics.median(samples) * 1e6, 3),
+        "min_us": round(min(samples) * 1e6, 3),
+        "mean_us": round(statistics.fmean(samples) * 1e6, 3),
+    }
+
+
+def _git_rev() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return ""
+
+
+async def run(only: str | None, min_time: float, max_iter: int) -> dict:
+    logging.disable(logging.INFO)
+    await db.init_db(":memory:")
+    results: dict[str, dict] = {}
+    try:
+        for name, sizes, setup in _REGISTRY:
+            if only and only not in name:
+                continue
+            for size in sizes:
+                fn = setup(size, random.Random(SEED))
+                res = await _time_case(fn, min_time, max_iter)
+                key = f"{name}[{size}]"
+                results[key] = res
+                print(f"{key:<40} median {res['median_us']:>12.2f} us   ({res['iterations']} it)")
+    finally:
+        await db.close_db()
+    return {
+        "meta": {"git": _git_rev(), "python": platform.python_version(), "seed": SEED, "ts": int(time.time())},
+        "results": results,
+    }
+
+
+def compare(current: dict, baseline_path: str) -> None:
+    with open(baseline_path, encoding="utf-8") as f:
+        base = json.load(f)
+    print(f"\nvs {baseline_path} ({base.get('meta', {}).get('git') or '?'}):")
+    for key, res in current["results"].items():
+        old = base.get("results", {}).get(key)
+        if not old:
+            print(f"{key:<40} (new)")
+            continue
+        ratio = res["median_us"] / old["median_us"] if old["median_us"] else float("inf")
+        print(f"{key:<40} {old['median_us']:>12.2f} -> {res['median_us']:>12.2f} us  x{ratio:.2f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", help="run cases whose name contains this substring")
+    parser.add_argument("--min-time", type=float, default=0.3, help="seconds per case")
+    parser.add_argument("--max-iter", type=int, default=20_000)
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--compare", help="previous results JSON to compare against")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args.only, args.min_time, args.max_iter))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    main()
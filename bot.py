@@ -12,24 +12,42 @@ Key points:
 from __future__ import annotations
 
 import asyncio
+import csv
+import html
+import io
 import logging
 import os
 import time
-import traceback
 from datetime import datetime, timedelta
+from typing import Iterable
 from zoneinfo import ZoneInfo
 
+from aiohttp import web
 from dotenv import load_dotenv
 
 from aiogram import Bot, Dispatcher, F, Router
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.enums import ContentType
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters import Command, CommandStart
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.storage.memory import MemoryStorage
-from aiogram.types import Message, ReplyKeyboardMarkup, KeyboardButton, LinkPreviewOptions
+from aiogram.types import BufferedInputFile, CallbackQuery, ChatMemberUpdated, FSInputFile, Message, ReplyKeyboardMarkup, KeyboardButton, LinkPreviewOptions
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
 
 import db
+import delivery
+import export
+import logging_setup
+import metrics
+import profiler
+import recurrence
+import tracing
+from concurrency import UserOrderedIsolation
+from digest import DigestScheduler, parse_digest_time
+from loop_monitor import LoopMonitor
 from keyboards import (
     BUTTONS,
     all_btn_texts,
@@ -46,9 +64,11 @@ from keyboards import (
     reminders_menu,
     get_supervisor_contact,
     SUPERVISOR_CONTACT,
+    PageCb,
+    page_kb,
 )
-from states import FeedbackState, FAQState, LanguageState, Register, ReminderState, TrainingAdminState
-from translations import get_user_lang, tr
+from states import DigestTimeState, FeedbackState, FAQState, LanguageState, Register, ReminderState, TrainingAdminState
+from translations import get_user_lang, group_by_lang, parse_lang_variants, pick_variant, tr, tr_lang
 
 
 # -------------------------
@@ -60,6 +80,8 @@ load_dotenv(os.path.join(BASE_DIR, ".env"))
 
 BOT_TOKEN = os.getenv("BOT_TOKEN", "").strip()
 BOT_DB = os.getenv("BOT_DB", "bot.db").strip() or "bot.db"
+# Alternative Bot API server (local Bot API or fake_tg_server.py for load tests). Empty -> api.telegram.org
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "").strip()
 
 def _parse_admin_ids(raw: str) -> set[int]:
     if not raw:
@@ -79,18 +101,77 @@ ADMIN_IDS: set[int] = _parse_admin_ids(os.getenv("ADMIN_IDS", ""))
 TZ = ZoneInfo("Europe/Oslo")
 DAILY_DIGEST_HOUR = 9
 DAILY_DIGEST_MINUTE = 0
-
-
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s | %(levelname)s | %(name)s | %(message)s",
-)
+# Digest missed at DAILY_DIGEST_HOUR:MINUTE (restart, slow tick, new subscribers) is
+# still delivered until this many hours later; delivery ledger keeps DIGEST_LEDGER_DAYS
+DIGEST_CATCHUP_HOURS = float(os.getenv("DIGEST_CATCHUP_HOURS", "12") or 0)
+DIGEST_LEDGER_DAYS = int(os.getenv("DIGEST_LEDGER_DAYS", "7") or 7)
+
+# Update delivery: "polling" (default) or "webhook" (embedded aiohttp server)
+BOT_MODE = os.getenv("BOT_MODE", "polling").strip().lower() or "polling"
+# Public base URL Telegram should call (https://example.com). Empty -> don't call setWebhook
+# (useful for local testing: POST recorded updates straight to WEBAPP_HOST:WEBAPP_PORT).
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL", "").strip()
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook").strip() or "/webhook"
+# Telegram echoes it in X-Telegram-Bot-Api-Secret-Token; requests without it are rejected
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "").strip()
+WEBAPP_HOST = os.getenv("WEBAPP_HOST", "0.0.0.0").strip() or "0.0.0.0"
+WEBAPP_PORT = int(os.getenv("WEBAPP_PORT", "8080") or 8080)
+# Answer Telegram with 200 immediately and run handlers in background tasks
+WEBHOOK_BACKGROUND = os.getenv("WEBHOOK_BACKGROUND", "1").strip() not in {"0", "false", "no"}
+
+# Max handlers running at once across all users; updates of one user are always
+# processed in order. 0 -> aiogram default (unbounded, no per-user ordering).
+UPDATE_CONCURRENCY = int(os.getenv("UPDATE_CONCURRENCY", "64") or 0)
+
+# Prometheus text endpoint: http://METRICS_HOST:METRICS_PORT/metrics (0 -> disabled)
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1").strip() or "127.0.0.1"
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108") or 0)
+
+# Per-update traces (JSONL, rotated). Empty TRACE_FILE -> tracing off.
+# TRACE_SLOW_MS > 0 keeps only updates slower than the threshold (tail latency).
+TRACE_FILE = os.getenv("TRACE_FILE", "").strip()
+TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", "0") or 0)
+TRACE_MAX_BYTES = int(os.getenv("TRACE_MAX_BYTES", str(10 * 1024 * 1024)) or 0)
+
+# Reminders kept in memory: only the next REMINDER_WINDOW_SEC, later ones stay in SQLite
+REMINDER_WINDOW_SEC = float(os.getenv("REMINDER_WINDOW_SEC", "3600") or 3600)
+# A user's reminders due within this many seconds of each other go out as one message
+REMINDER_COALESCE_SEC = float(os.getenv("REMINDER_COALESCE_SEC", "60") or 0)
+
+# Shared queue for bot-initiated sends (reminders > digest > broadcast):
+# global rate (msg/s), min interval between messages to one chat, parallel API calls
+OUTBOUND_RATE = float(os.getenv("OUTBOUND_RATE", "25") or 25)
+OUTBOUND_PER_CHAT_SEC = float(os.getenv("OUTBOUND_PER_CHAT_SEC", "1") or 0)
+OUTBOUND_CONCURRENCY = int(os.getenv("OUTBOUND_CONCURRENCY", "8") or 8)
+
+# Rows per page in /users, /faq_list and the 📋 materials list
+ADMIN_PAGE_SIZE = 20
+
+# /profile <seconds>: upper bound for one sampling run
+PROFILE_MAX_SECONDS = int(os.getenv("PROFILE_MAX_SECONDS", "120") or 120)
+
+# Event loop lag monitor: heartbeat period (0 -> off) and the stall threshold after which
+# the watchdog logs the stack of whatever is holding the loop.
+LOOP_MONITOR_INTERVAL_MS = float(os.getenv("LOOP_MONITOR_INTERVAL_MS", "100") or 0)
+LOOP_STALL_MS = float(os.getenv("LOOP_STALL_MS", "250") or 250)
+
+
+# Logging: records go through a queue, formatting and I/O happen in a background thread.
+# LOG_FORMAT=json -> one JSON object per line (with trace_id when tracing is on).
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").strip() or "INFO"
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").strip().lower() or "text"
+# on_error: identical exceptions (type + raise site) are logged in full once per window
+ERROR_DEDUP_SEC = float(os.getenv("ERROR_DEDUP_SEC", "60") or 0)
+
+logging_setup.setup_logging(LOG_LEVEL, LOG_FORMAT)
 logger = logging.getLogger("bot")
 logger.info("ADMIN_IDS loaded: %s", sorted(ADMIN_IDS))
 
 
 # Canonical values stored in DB (to keep backward compatibility with existing data)
 ROLE_CANON = {"courier": "Курьер", "picker": "Сборщик"}
+# Languages with translations (users.lang)
+LANGS = ("RU", "EN", "UZ", "TJ", "KG")
 # Reverse maps (button text -> canonical RU value)
 _ROLE_TEXT_TO_RU: dict[str, str] = {}
 for _lang, _labels in ROLE_LABELS.items():
@@ -105,6 +186,26 @@ for _lang, _labels in SHOP_LABELS.items():
 
 
 router = Router()
+# strong refs for fire-and-forget tasks started from handlers
+_background_tasks: set[asyncio.Task] = set()
+router.message.middleware(metrics.HandlerMetricsMiddleware())
+router.message.middleware(tracing.HandlerTraceMiddleware())
+router.callback_query.middleware(metrics.HandlerMetricsMiddleware())
+router.callback_query.middleware(tracing.HandlerTraceMiddleware())
+
+loop_monitor = LoopMonitor(
+    interval=LOOP_MONITOR_INTERVAL_MS / 1000.0,
+    stall_threshold=max(LOOP_STALL_MS, 2 * LOOP_MONITOR_INTERVAL_MS) / 1000.0,
+)
+
+# Per-user digest times (default DAILY_DIGEST_HOUR:MINUTE in TZ), fed by scheduler_loop
+digest = DigestScheduler(
+    DAILY_DIGEST_HOUR,
+    DAILY_DIGEST_MINUTE,
+    TZ,
+    catchup_hours=DIGEST_CATCHUP_HOURS,
+    keep_days=DIGEST_LEDGER_DAYS,
+)
 
 
 # -------------------------
@@ -244,7 +345,7 @@ async def set_language(message: Message, state: FSMContext):
         return
 
     lang = (message.text or "").strip().upper()
-    if lang not in {"RU", "EN", "UZ", "TJ", "KG"}:
+    if lang not in LANGS:
         await message.answer(tr("choose_language", message.from_user.id), reply_markup=get_lang_kb())
         return
 
@@ -557,15 +658,11 @@ async def admin_kb_list(message: Message, state: FSMContext):
         await message.answer(tr("admin_no_access", message.from_user.id, id=message.from_user.id))
         return
 
-    items = await db.faq_list(limit=200)
-    if not items:
+    text, kb = await _render_page("faq", message.from_user.id)
+    if not text:
         await message.answer(tr("kb_no_materials", message.from_user.id))
         return
-
-    text = "📋 Материалы (id — заголовок):\n\n"
-    for it in items[:200]:
-        text += f"{it.get('id')}. {it.get('title')}\n"
-    await message.answer(text)
+    await message.answer(text, reply_markup=kb)
 
 
 @router.message(F.text.in_(set(ADMIN_ADD_BTNS.values())))
@@ -830,10 +927,14 @@ async def reminders_add_start(message: Message, state: FSMContext):
 @router.message(ReminderState.minutes)
 async def reminders_set_minutes(message: Message, state: FSMContext):
     txt = (message.text or "").strip()
-    if not txt.isdigit():
+    rule = recurrence.parse_rule(txt)
+    if rule is not None:
+        await state.update_data(minutes=0, rule=rule.text)
+    elif txt.isdigit():
+        await state.update_data(minutes=int(txt), rule=None)
+    else:
         await message.answer(tr("reminder_ask_minutes", message.from_user.id))
         return
-    await state.update_data(minutes=int(txt))
     await state.set_state(ReminderState.text)
     await message.answer(tr("reminder_ask_text", message.from_user.id))
 
@@ -842,7 +943,19 @@ async def reminders_set_minutes(message: Message, state: FSMContext):
 async def reminders_set_text(message: Message, state: FSMContext):
     data = await state.get_data()
     minutes = int(data.get("minutes", 0) or 0)
+    rule = recurrence.parse_rule(data.get("rule") or "")
     txt = (message.text or "").strip()
+    if rule is not None and txt:
+        uid = message.from_user.id
+        # правило считаем в поясе пользователя (тот же, что у дайджеста), по умолчанию — TZ
+        tz_name = db.digest_prefs.get(uid, (None, None))[1] or TZ.key
+        now_ts = time.time()
+        run_at_ts = recurrence.next_fire(rule, now_ts, now_ts, ZoneInfo(tz_name))
+        await db.add_reminder(uid, run_at_ts, txt, rule=rule.text, tz=tz_name)
+        await state.clear()
+        when = datetime.fromtimestamp(run_at_ts, ZoneInfo(tz_name)).strftime("%d.%m %H:%M")
+        await message.answer(tr("reminder_set_recurring", uid, rule=rule.text, when=when))
+        return
     if minutes <= 0 or not txt:
         await message.answer(tr("reminder_ask_minutes", message.from_user.id))
         await state.set_state(ReminderState.minutes)
@@ -853,11 +966,20 @@ async def reminders_set_text(message: Message, state: FSMContext):
     await message.answer(tr("reminder_set", message.from_user.id))
 
 
+@router.message(F.text.in_(all_btn_texts("rem_stop")))
+async def reminders_stop_recurring(message: Message, state: FSMContext):
+    if await _check_banned(message):
+        return
+    n = await db.delete_recurring_reminders(message.from_user.id)
+    await message.answer(tr("reminder_recurring_stopped", message.from_user.id, n=n))
+
+
 @router.message(F.text.in_(all_btn_texts("daily_on")))
 async def daily_on(message: Message, state: FSMContext):
     if await _check_banned(message):
         return
     await db.enable_daily_digest(message.from_user.id, True)
+    await digest.schedule(message.from_user.id)
     await message.answer(tr("daily_on", message.from_user.id))
 
 
@@ -866,9 +988,39 @@ async def daily_off(message: Message, state: FSMContext):
     if await _check_banned(message):
         return
     await db.enable_daily_digest(message.from_user.id, False)
+    digest.unschedule(message.from_user.id)
     await message.answer(tr("daily_off", message.from_user.id))
 
 
+@router.message(F.text.in_(all_btn_texts("daily_time")))
+async def daily_time_start(message: Message, state: FSMContext):
+    if await _check_banned(message):
+        return
+    uid = message.from_user.id
+    digest_time, tz_name = db.digest_prefs.get(uid, (None, None))
+    default_time = f"{DAILY_DIGEST_HOUR:02d}:{DAILY_DIGEST_MINUTE:02d}"
+    current = f"{digest_time or default_time} {tz_name or TZ.key}"
+    await state.set_state(DigestTimeState.time)
+    await message.answer(tr("daily_time_ask", uid, current=current))
+
+
+@router.message(DigestTimeState.time)
+async def daily_time_set(message: Message, state: FSMContext):
+    uid = message.from_user.id
+    parsed = parse_digest_time(message.text or "")
+    if parsed is None:
+        await message.answer(tr("daily_time_bad", uid))
+        return
+    digest_time, tz_name = parsed
+    if tz_name is None:
+        # только время — пояс оставляем прежним
+        tz_name = db.digest_prefs.get(uid, (None, None))[1]
+    await db.set_digest_prefs(uid, digest_time, tz_name)
+    await digest.schedule(uid)
+    await state.clear()
+    await message.answer(tr("daily_time_set", uid, time=digest_time, tz=tz_name or TZ.key))
+
+
 # -------------------------
 # ADMIN COMMANDS
 # -------------------------
@@ -882,31 +1034,184 @@ async def admin_help(message: Message):
         await message.answer(tr("admin_help", message.from_user.id))
 
 
+# -------------------------
+# PAGINATED LISTINGS (/users, /faq_list, 📋 materials)
+# -------------------------
+
+
+def _fmt_page_row(kind: str, row: tuple) -> str:
+    if kind == "users":
+        uid, username, role, shop, lang, phone = (html.escape(str(x)) if x else "" for x in row)
+        return f"{uid} | @{username or '-'} | {role or '-'} | {shop or '-'} | {lang} | {phone or '-'}"
+    return f"{row[0]}. {html.escape(row[1] or '')}"
+
+
+async def _render_page(kind: str, uid: int, after: int | None = None, before: int | None = None):
+    """(text, inline keyboard) for one page; text is empty when there is nothing to show."""
+    rows, has_prev, has_next = await db.list_page(kind, after=after, before=before, limit=ADMIN_PAGE_SIZE)
+    if not rows:
+        return "", None
+    text = "\n".join(_fmt_page_row(kind, r) for r in rows)
+    if kind == "faq":
+        text = "📋 Материалы (id — заголовок):\n\n" + text
+    return text, page_kb(kind, rows[0][0], rows[-1][0], has_prev, has_next)
+
+
+@router.callback_query(PageCb.filter())
+async def admin_page_nav(callback: CallbackQuery, callback_data: PageCb):
+    if not _is_admin(callback.from_user.id):
+        await callback.answer()
+        return
+    # callback_data приходит от клиента — поддельный kind/ключ молча игнорируем
+    if callback_data.kind not in db.PAGES or not all(
+        k is None or type(k) is int for k in (callback_data.after, callback_data.before)
+    ):
+        await callback.answer()
+        return
+    text, kb = await _render_page(callback_data.kind, callback.from_user.id, callback_data.after, callback_data.before)
+    if not text:
+        await callback.answer(tr("admin_page_empty", callback.from_user.id))
+        return
+    try:
+        await callback.message.edit_text(text, reply_markup=kb)
+    except TelegramBadRequest:
+        pass  # "message is not modified" — страница не изменилась
+    await callback.answer()
+
+
+@router.callback_query(F.data.startswith(f"{PageCb.__prefix__}:"))
+async def admin_page_nav_bad(callback: CallbackQuery):
+    # не разобралось в PageCb (ключ не int) — только снять «часики» у кнопки
+    await callback.answer()
+
+
+def _fmt_segments(counts: dict[str, int]) -> str:
+    if not counts:
+        return "—"
+    return ", ".join(f"{html.escape(k) or '—'} {n}" for k, n in sorted(counts.items(), key=lambda kv: -kv[1]))
+
+
 @router.message(Command("stats"))
 async def admin_stats(message: Message):
     if not _is_admin(message.from_user.id):
         return
-    users = len(db.get_all_users())
-    fb = len(db.get_feedback())
-    banned = len(db.banned_users)
-    await message.answer(tr("admin_stats_text", message.from_user.id, users=users, fb=fb, banned=banned))
+    uid = message.from_user.id
+    st = db.get_stats()
+    text = tr("admin_stats_text", uid, users=st["users"], fb=st["feedback"], banned=st["banned"])
+    text += "\n" + tr("admin_stats_more", uid, digest=st["digest"], reminders=st["reminders"], inactive=st["inactive"])
+    text += "\n\n" + tr(
+        "admin_stats_segments", uid,
+        shops=_fmt_segments(st["by_shop"]), roles=_fmt_segments(st["by_role"]), langs=_fmt_segments(st["by_lang"]),
+    )
+    if loop_monitor.lags:
+        lag = loop_monitor.percentiles()
+        text += "\n" + tr(
+            "admin_stats_loop", uid,
+            p50=f"{lag['p50']:.1f}", p95=f"{lag['p95']:.1f}", p99=f"{lag['p99']:.1f}",
+            max=f"{lag['max']:.0f}", stalls=loop_monitor.stalls,
+        )
+    await message.answer(text)
+
+
+async def _send_profile(bot: Bot, chat_id: int, seconds: int, prof: profiler.SamplingProfiler) -> None:
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        profiler.finish(prof)
+    try:
+        doc = BufferedInputFile(
+            prof.collapsed().encode("utf-8"),
+            filename=f"profile-{datetime.now(TZ):%Y%m%d-%H%M%S}.collapsed",
+        )
+        await bot.send_document(chat_id, doc, caption=tr("admin_profile_done", chat_id, seconds=seconds, samples=prof.samples))
+    except Exception as e:
+        logger.error("Profile send error: %s", e)
+
+
+@router.message(Command("profile"))
+async def admin_profile(message: Message):
+    if not _is_admin(message.from_user.id):
+        return
+    parts = (message.text or "").split()
+    seconds = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else 10
+    if not 1 <= seconds <= PROFILE_MAX_SECONDS:
+        await message.answer(tr("admin_format_profile", message.from_user.id, max=PROFILE_MAX_SECONDS))
+        return
+    if profiler.is_running():
+        await message.answer(tr("admin_profile_busy", message.from_user.id))
+        return
+    prof = profiler.start()
+    await message.answer(tr("admin_profile_started", message.from_user.id, seconds=seconds))
+    # ждём окно в фоне: хэндлер не держит очередь апдейтов админа на время замера
+    task = asyncio.create_task(_send_profile(message.bot, message.chat.id, seconds, prof))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
 
 
 @router.message(Command("users"))
 async def admin_users(message: Message):
     if not _is_admin(message.from_user.id):
         return
-    users = db.get_all_users()
-    if not users:
+    text, kb = await _render_page("users", message.from_user.id)
+    if not text:
         await message.answer(tr("admin_users_empty", message.from_user.id))
         return
-    lines = []
-    for u in users[:50]:
-        d = _user_tuple_to_dict(u)
-        lines.append(
-            f"{d['user_id']} | @{d['username'] or '-'} | {d['role'] or '-'} | {d['shop'] or '-'} | {d['lang']} | {d['phone'] or '-'}"
+    await message.answer(text, reply_markup=kb)
+
+
+# Bot API refuses uploads over 50 MB
+EXPORT_MAX_BYTES = 50 * 1024 * 1024
+
+
+async def _send_export(bot: Bot, chat_id: int, kind: str, fmt: str, gz: bool) -> None:
+    path = None
+    try:
+        path, rows = await export.export_to_file(kind, fmt, gz)
+        if os.path.getsize(path) > EXPORT_MAX_BYTES:
+            await bot.send_message(chat_id, tr("admin_export_too_big", chat_id))
+            return
+        name = export.filename(kind, fmt, gz, f"{datetime.now(TZ):%Y%m%d-%H%M%S}")
+        await bot.send_document(
+            chat_id, FSInputFile(path, filename=name), caption=tr("admin_export_done", chat_id, kind=kind, rows=rows)
         )
-    await message.answer("\n".join(lines))
+    except Exception as e:
+        logger.error("Export %s error: %s", kind, e)
+    finally:
+        if path is not None:
+            os.remove(path)
+
+
+@router.message(Command("export_users", "export_feedback"))
+async def admin_export(message: Message):
+    if not _is_admin(message.from_user.id):
+        return
+    cmd, *args = (message.text or "").lower().split()
+    kind = "users" if cmd.startswith("/export_users") else "feedback"
+    fmt = next((a for a in args if a in export.FORMATS), "csv")
+    gz = "gz" in args or "gzip" in args
+    if any(a not in export.FORMATS and a not in ("gz", "gzip") for a in args):
+        await message.answer(tr("admin_format_export", message.from_user.id))
+        return
+    await message.answer(tr("admin_export_started", message.from_user.id))
+    # в фоне: большая выгрузка не держит очередь апдейтов админа
+    task = asyncio.create_task(_send_export(message.bot, message.chat.id, kind, fmt, gz))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+@router.message(Command("find"))
+async def admin_find(message: Message):
+    if not _is_admin(message.from_user.id):
+        return
+    query = (message.text or "").split(maxsplit=1)[1:]
+    if not query or not query[0].strip():
+        await message.answer(tr("admin_format_find", message.from_user.id))
+        return
+    found = db.find_users(query[0], limit=ADMIN_PAGE_SIZE)
+    if not found:
+        await message.answer(tr("admin_user_not_found", message.from_user.id))
+        return
+    await message.answer("\n".join(_fmt_page_row("users", u[:6]) for u in found))
 
 
 @router.message(Command("edit_user"))
@@ -925,7 +1230,7 @@ async def admin_edit_user(message: Message):
         await message.answer(tr("admin_user_not_found", message.from_user.id))
         return
     d = _user_tuple_to_dict(u)
-    if field not in {"role", "shop", "lang", "phone"}:
+    if field not in _EDIT_FIELDS:
         await message.answer(tr("admin_bad_field", message.from_user.id))
         return
     if field == "lang":
@@ -935,26 +1240,63 @@ async def admin_edit_user(message: Message):
     await message.answer(tr("kb_admin_updated", message.from_user.id))
 
 
+_SEGMENT_KEYS = {"shop", "role", "lang"}
+
+
+def _parse_segment_filters(text: str) -> tuple[dict[str, str] | None, str]:
+    """'shop=Таллинское role=picker привет' -> ({'shop': 'Таллинское', 'role': 'Сборщик'}, 'привет').
+
+    Фильтры — ведущие слова key=value; значение без пробелов. Неизвестный ключ -> (None, text).
+    """
+    filters: dict[str, str] = {}
+    rest = text
+    while rest:
+        word, *tail = rest.split(None, 1)
+        key, eq, value = word.partition("=")
+        if not eq:
+            break
+        key = key.lower()
+        if key not in _SEGMENT_KEYS or not value:
+            return None, text
+        if key == "lang":
+            value = value.upper()
+        elif key == "role":
+            value = ROLE_CANON.get(value.lower(), value)
+        filters[key] = value
+        rest = tail[0] if tail else ""
+    return filters, rest
+
+
+async def _run_broadcast(bot: Bot, chat_id: int, items: Iterable[tuple[int, str]]) -> None:
+    try:
+        delivered = await delivery.send_many(bot, items, priority=delivery.BROADCAST)
+        await bot.send_message(chat_id, tr("admin_sent", chat_id, sent=len(delivered)))
+    except Exception as e:
+        logger.error("Broadcast error: %s", e)
+
+
 @router.message(Command("broadcast"))
 async def admin_broadcast(message: Message):
     if not _is_admin(message.from_user.id):
         return
     text = (message.text or "").replace("/broadcast", "", 1).strip()
-    if not text:
+    filters, text = _parse_segment_filters(text)
+    if not text or filters is None:
         await message.answer(tr("admin_format_broadcast", message.from_user.id))
         return
-    users = db.get_all_users()
-    sent = 0
-    for u in users:
-        uid = u[0]
-        if db.is_banned(uid):
-            continue
-        try:
-            await message.bot.send_message(uid, text)
-            sent += 1
-        except Exception:
-            continue
-    await message.answer(tr("admin_sent", message.from_user.id, sent=sent))
+    recipients = db.select_users(**filters) - db.banned_users - db.inactive_users
+    variants = parse_lang_variants(text)
+    groups = group_by_lang(recipients)
+    bodies = {lang: pick_variant(variants, lang) for lang in groups}
+    await message.answer(tr("admin_broadcast_started", message.from_user.id, total=len(recipients)))
+    # в фоне: рассылка под лимитом Telegram идёт минутами и не должна держать очередь апдейтов админа
+    task = asyncio.create_task(_run_broadcast(
+        message.bot,
+        message.chat.id,
+        ((uid, bodies[lang]) for lang, uids in groups.items() for uid in uids),
+    ))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
 
 
 @router.message(Command("cleanup"))
@@ -991,6 +1333,137 @@ async def admin_unban(message: Message):
     await message.answer(tr("admin_unbanned_ok", message.from_user.id))
 
 
+# ---------- bulk: /ban_many, /unban_many, /edit_users ----------
+# Targets: ids in the command, segment filters (shop=… role=… lang=…), or a CSV
+# document with the command as its caption. All rows go to SQLite in one transaction.
+BULK_CSV_MAX_BYTES = 5 * 1024 * 1024
+_EDIT_FIELDS = ("role", "shop", "lang", "phone")
+
+
+class _BadUpload(Exception):
+    """Документ не принят; args[0] — ключ перевода для ответа админу."""
+
+
+async def _read_csv_document(message: Message) -> list[dict[str, str]] | None:
+    """CSV из присланного документа -> строки-словари; None — документа нет.
+
+    С заголовком user_id — колонки по заголовку, без него — id в первой колонке.
+    """
+    doc = message.document
+    if doc is None:
+        return None
+    # размер — до скачивания (без file_size не качаем), и ещё раз по факту
+    if doc.file_size is None or doc.file_size > BULK_CSV_MAX_BYTES:
+        raise _BadUpload("admin_bulk_too_big")
+    data = (await message.bot.download(doc)).getvalue()
+    if len(data) > BULK_CSV_MAX_BYTES:
+        raise _BadUpload("admin_bulk_too_big")
+    try:
+        rows = [r for r in csv.reader(io.StringIO(data.decode("utf-8-sig"))) if r]
+    except (UnicodeDecodeError, csv.Error):
+        # cp1251 из Excel, xlsx, картинка...
+        raise _BadUpload("admin_bulk_bad_csv") from None
+    if not rows:
+        return []
+    header = [h.strip().lower() for h in rows[0]]
+    if "user_id" not in header:
+        return [{"user_id": r[0].strip()} for r in rows]
+    return [{k: v.strip() for k, v in zip(header, r)} for r in rows[1:]]
+
+
+def _bulk_ids(args: str, rows: list[dict[str, str]] | None) -> set[int] | None:
+    """Кому применять: id из CSV, иначе фильтры сегмента, иначе список id. None — формат не подошёл."""
+    if rows is not None:
+        return {int(r["user_id"]) for r in rows if r.get("user_id", "").isdigit()}
+    filters, rest = _parse_segment_filters(args.strip())
+    if filters and not rest.strip():
+        return db.select_users(**filters)
+    tokens = args.replace(",", " ").split()
+    if tokens and all(t.isdigit() for t in tokens):
+        return _parse_admin_ids(args)
+    return None
+
+
+def _edit_value(field: str, value: str) -> str | None:
+    """Значение поля в виде для БД; None — недопустимый язык (tr() его не отрисует)."""
+    if field == "lang":
+        value = value.upper()
+        return value if value in LANGS else None
+    if field == "role":
+        return ROLE_CANON.get(value.lower(), value)
+    return value
+
+
+async def _bulk_args(message: Message) -> tuple[str, list[dict[str, str]] | None] | None:
+    """(аргументы команды, строки CSV | None); None — файл не принят (ответ уже отправлен)."""
+    try:
+        rows = await _read_csv_document(message)
+    except _BadUpload as e:
+        await message.answer(tr(e.args[0], message.from_user.id, mb=BULK_CSV_MAX_BYTES // (1024 * 1024)))
+        return None
+    parts = (message.text or message.caption or "").split(maxsplit=1)
+    return (parts[1] if len(parts) > 1 else ""), rows
+
+
+def _bulk_summary(user_id: int, changed: int, total: int, missing: list[int] | None = None) -> str:
+    text = tr("admin_bulk_done", user_id, changed=changed, total=total)
+    if missing:
+        shown = ", ".join(map(str, sorted(missing)[:ADMIN_PAGE_SIZE]))
+        if len(missing) > ADMIN_PAGE_SIZE:
+            shown += f" … (+{len(missing) - ADMIN_PAGE_SIZE})"
+        text += "\n" + tr("admin_bulk_missing", user_id, ids=shown)
+    return text
+
+
+@router.message(Command("ban_many", "unban_many"))
+async def admin_ban_many(message: Message):
+    if not _is_admin(message.from_user.id):
+        return
+    parsed = await _bulk_args(message)
+    if parsed is None:
+        return
+    ids = _bulk_ids(*parsed)
+    if not ids:
+        await message.answer(tr("admin_format_bulk", message.from_user.id))
+        return
+    if (message.text or message.caption or "").startswith("/ban_many"):
+        changed = await db.ban_users(ids)
+    else:
+        changed = await db.unban_users(ids)
+    await message.answer(_bulk_summary(message.from_user.id, changed, len(ids)))
+
+
+@router.message(Command("edit_users"))
+async def admin_edit_users(message: Message):
+    if not _is_admin(message.from_user.id):
+        return
+    parsed = await _bulk_args(message)
+    if parsed is None:
+        return
+    args, rows = parsed
+    changes: dict[int, dict[str, str | None]] = {}
+    if rows is not None:
+        for r in rows:
+            fields = {f: _edit_value(f, r[f]) for f in _EDIT_FIELDS if r.get(f)}
+            if r.get("user_id", "").isdigit() and fields:
+                changes[int(r["user_id"])] = fields
+    else:
+        parts = args.split(maxsplit=2)
+        if len(parts) == 3 and parts[0].lower() in _EDIT_FIELDS:
+            field = parts[0].lower()
+            value = _edit_value(field, parts[1])
+            changes = {uid: {field: value} for uid in _bulk_ids(parts[2], None) or ()}
+    if any(v is None for fields in changes.values() for v in fields.values()):
+        # один неверный язык — не применяем ничего, как и при ошибке в транзакции
+        await message.answer(tr("admin_bad_lang", message.from_user.id, langs=", ".join(LANGS)))
+        return
+    if not changes:
+        await message.answer(tr("admin_format_edit_users", message.from_user.id))
+        return
+    updated, missing = await db.update_users(changes)  # type: ignore[arg-type]
+    await message.answer(_bulk_summary(message.from_user.id, updated, len(changes), missing))
+
+
 @router.message(Command("set_digest"))
 async def admin_set_digest(message: Message):
     if not _is_admin(message.from_user.id):
@@ -1008,11 +1481,11 @@ async def admin_set_digest(message: Message):
 async def admin_faq_list(message: Message):
     if not _is_admin(message.from_user.id):
         return
-    items = await db.faq_list(limit=50)
-    if not items:
+    text, kb = await _render_page("faq", message.from_user.id)
+    if not text:
         await message.answer(tr("admin_faq_empty", message.from_user.id))
         return
-    await message.answer("\n".join([f"{a['id']}. {a['title']}" for a in items]))
+    await message.answer(text, reply_markup=kb)
 
 
 @router.message(Command("faq_add"))
@@ -1058,11 +1531,29 @@ async def admin_faq_edit(message: Message):
     await message.answer(tr("kb_admin_updated", message.from_user.id) if ok else tr("common_not_found", message.from_user.id))
 
 
+# -------------------------
+# BOT BLOCKED / UNBLOCKED
+# -------------------------
+
+
+@router.my_chat_member(F.chat.type == "private")
+async def on_my_chat_member(event: ChatMemberUpdated):
+    """Пользователь заблокировал бота (kicked) или снова запустил его (member)."""
+    status = event.new_chat_member.status
+    if status in ("kicked", "left"):
+        await db.set_inactive(event.chat.id, True)
+    elif status == "member":
+        await db.set_inactive(event.chat.id, False)
+
+
 # -------------------------
 # ERROR HANDLER
 # -------------------------
 
 
+_error_dedup = logging_setup.ExceptionDeduper(ERROR_DEDUP_SEC)
+
+
 @router.errors()
 async def on_error(event, exception=None):
     """Aiogram 3.x error handler.
@@ -1076,8 +1567,8 @@ async def on_error(event, exception=None):
         # ErrorEvent имеет поле .exception
         exc = getattr(event, "exception", None)
 
-    logger.error("Unhandled exception: %s", exc)
-    traceback.print_exc()
+    if exc is None or _error_dedup.first(exc):
+        logger.error("Unhandled exception: %s", exc, exc_info=exc)
 
     # Не роняем обработчик
     return True
@@ -1088,42 +1579,86 @@ async def on_error(event, exception=None):
 # -------------------------
 
 
-async def scheduler_loop(bot: Bot):
-    """Background loop: reminders + daily digest."""
-    last_digest_sent: dict[int, str] = {}  # user_id -> YYYY-MM-DD
+# Telegram message limit is 4096 chars; leave room for the header
+_REMINDER_BATCH_CHARS = 3800
+
+
+def _reminder_messages(due: list[db.Reminder]) -> list[tuple[int, str]]:
+    """One message per user: a single reminder as is, several — as one list
+    (split only if the list would not fit into one Telegram message)."""
+    by_user: dict[int, list[db.Reminder]] = {}
+    for r in due:
+        by_user.setdefault(r.user_id, []).append(r)
+    out: list[tuple[int, str]] = []
+    for uid, rems in by_user.items():
+        lang = get_user_lang(uid)
+        if len(rems) == 1:
+            out.append((uid, tr_lang("reminder_push", lang, text=rems[0].text)))
+            continue
+        rems.sort(key=lambda r: r.run_at_ts)
+        chunks: list[list[str]] = [[]]
+        size = 0
+        for r in rems:
+            line = f"• {r.text}"
+            if chunks[-1] and size + len(line) > _REMINDER_BATCH_CHARS:
+                chunks.append([])
+                size = 0
+            chunks[-1].append(line)
+            size += len(line) + 1
+        for lines in chunks:
+            out.append((uid, tr_lang("reminder_push_many", lang, n=len(lines), text="\n".join(lines))))
+    return out
 
-    while True:
+
+async def _run_digest(bot: Bot) -> None:
+    try:
+        await digest.tick(lambda items: delivery.send_many(bot, items, priority=delivery.DIGEST))
+    except Exception as e:
+        logger.error("Digest error: %s", e)
+
+
+async def scheduler_loop(bot: Bot, stop: asyncio.Event | None = None):
+    """Background loop: reminders + daily digest. stop.set() -> exits after the current tick."""
+    stop = stop or asyncio.Event()
+    digest_task: asyncio.Task | None = None
+    expected_wakeup = time.monotonic()
+
+    while not stop.is_set():
+        metrics.SCHEDULER_LAG.observe(max(0.0, time.monotonic() - expected_wakeup))
         try:
             now_ts = time.time()
-            due = await db.pop_due_reminders(now_ts)
-            for r in due:
-                try:
-                    await bot.send_message(r.user_id, tr("reminder_push", r.user_id, text=r.text))
-                except Exception:
-                    continue
-
-            # Daily digest: once per day at configured time (Oslo)
-            now_local = datetime.now(TZ)
-            if now_local.hour == DAILY_DIGEST_HOUR and now_local.minute == DAILY_DIGEST_MINUTE:
-                today = now_local.date().isoformat()
-                digest_users = db.get_daily_digest_users()
-                digest_text = db.get_daily_digest_message()
-                for uid in digest_users:
-                    if last_digest_sent.get(uid) == today:
-                        continue
-                    if db.is_banned(uid):
-                        continue
-                    try:
-                        await bot.send_message(uid, f"🗞 {digest_text}")
-                        last_digest_sent[uid] = today
-                    except Exception:
-                        continue
+            await db.refill_reminders(now_ts)
+            due = await db.pop_due_reminders(now_ts, REMINDER_COALESCE_SEC)
+            if due:
+                for r in due:
+                    metrics.REMINDER_LAG.observe(max(0.0, time.time() - r.run_at_ts))
+                await delivery.send_many(bot, _reminder_messages(due), priority=delivery.REMINDER)
+
+            # Daily digest: only users whose own digest time (UTC minute bucket) has come
+            if digest_task is None or digest_task.done():
+                # в фоне: большой дайджест не должен задерживать напоминания следующих тиков
+                digest_task = asyncio.create_task(_run_digest(bot))
+                _background_tasks.add(digest_task)
+                digest_task.add_done_callback(_background_tasks.discard)
 
         except Exception as e:
             logger.error("Scheduler error: %s", e)
 
+        _error_dedup.flush_expired()
+
         # 30s tick is enough
-        await asyncio.sleep(30)
+        expected_wakeup = time.monotonic() + 30
+        try:
+            await asyncio.wait_for(stop.wait(), 30)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def _cancel_background_tasks() -> None:
+    tasks = list(_background_tasks)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
 
 
 # -------------------------
@@ -1131,25 +1666,123 @@ async def scheduler_loop(bot: Bot):
 # -------------------------
 
 
+def create_bot(token: str | None = None, api_url: str | None = None) -> Bot:
+    api_url = api_url or TELEGRAM_API_URL
+    session = AiohttpSession(api=TelegramAPIServer.from_base(api_url)) if api_url else AiohttpSession()
+    session.middleware(metrics.ApiMetricsMiddleware())
+    session.middleware(tracing.ApiTraceMiddleware())
+    session.middleware(delivery.InteractiveRateMiddleware())
+    return Bot(
+        token or BOT_TOKEN,
+        session=session,
+        default=DefaultBotProperties(parse_mode="HTML"),
+    )
+
+
+def create_dispatcher() -> Dispatcher:
+    isolation = UserOrderedIsolation(UPDATE_CONCURRENCY) if UPDATE_CONCURRENCY > 0 else None
+    dp = tracing.TracedDispatcher(storage=MemoryStorage(), events_isolation=isolation)
+    dp.include_router(router)
+    return dp
+
+
+def create_webhook_app(bot: Bot, dp: Dispatcher, secret_token: str | None = None) -> web.Application:
+    """aiohttp-приложение с хэндлером вебхука aiogram (без запуска сервера)."""
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=secret_token or WEBHOOK_SECRET or None,
+        handle_in_background=WEBHOOK_BACKGROUND,
+    ).register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+    return app
+
+
+async def run_webhook(bot: Bot, dp: Dispatcher) -> None:
+    if not WEBHOOK_SECRET:
+        raise RuntimeError("WEBHOOK_SECRET is empty. It is required in webhook mode.")
+
+    app = create_webhook_app(bot, dp)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host=WEBAPP_HOST, port=WEBAPP_PORT)
+    await site.start()
+    logger.info("Webhook server listening on %s:%s%s", WEBAPP_HOST, WEBAPP_PORT, WEBHOOK_PATH)
+
+    if WEBHOOK_BASE_URL:
+        await bot.set_webhook(
+            WEBHOOK_BASE_URL.rstrip("/") + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=dp.resolve_used_update_types(),
+        )
+        logger.info("Webhook registered at %s%s", WEBHOOK_BASE_URL.rstrip("/"), WEBHOOK_PATH)
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        # Shutdown hooks run here: setup_application() -> dp.emit_shutdown, the request handler
+        # closes bot.session (main() closes it again once the scheduler and outbound queue stop).
+        # The webhook is left registered on purpose: Telegram keeps pending updates for it until
+        # the next start, and during a rolling restart delete_webhook from the old instance would
+        # unregister the URL the new instance has just set.
+        await runner.cleanup()
+
+
 async def main() -> None:
     if not BOT_TOKEN:
         raise RuntimeError("BOT_TOKEN is empty. Put it in .env or environment variables.")
 
-    await db.init_db(BOT_DB)
+    if TRACE_FILE:
+        tracing.configure(TRACE_FILE, max_bytes=TRACE_MAX_BYTES, slow_ms=TRACE_SLOW_MS)
+        logging_setup.offload("bot.trace")
 
-    bot = Bot(
-        BOT_TOKEN,
-        default=DefaultBotProperties(parse_mode="HTML"),
-    )
+    await db.init_db(BOT_DB, reminder_window_sec=REMINDER_WINDOW_SEC)
 
-    dp = Dispatcher(storage=MemoryStorage())
-    dp.include_router(router)
+    bot = create_bot()
+    dp = create_dispatcher()
+
+    metrics_runner = None
+    if METRICS_PORT:
+        metrics_runner = await metrics.start_server(METRICS_HOST, METRICS_PORT)
+        logger.info("Metrics on http://%s:%s/metrics", METRICS_HOST, METRICS_PORT)
+
+    if LOOP_MONITOR_INTERVAL_MS > 0:
+        loop_monitor.start()
+
+    delivery.start_dispatcher(
+        bot,
+        rate=OUTBOUND_RATE,
+        burst=OUTBOUND_RATE,
+        per_chat_interval=OUTBOUND_PER_CHAT_SEC,
+        concurrency=OUTBOUND_CONCURRENCY,
+    )
 
     # Background scheduler
-    asyncio.create_task(scheduler_loop(bot))
+    scheduler_stop = asyncio.Event()
+    scheduler = asyncio.create_task(scheduler_loop(bot, scheduler_stop))
 
-    await dp.start_polling(bot)
+    try:
+        if BOT_MODE == "webhook":
+            await run_webhook(bot, dp)
+        else:
+            await dp.start_polling(bot)
+    finally:
+        # Snapshot only once nothing writes to the DB. The scheduler finishes its current tick
+        # (cancelling it inside pop_due_reminders would drop a rescheduled reminder from the
+        # cache); digest/broadcast/export tasks are cancelled.
+        scheduler_stop.set()
+        await scheduler
+        await _cancel_background_tasks()
+        await delivery.stop_dispatcher()
+        # last, after everything that sends: a request made after start_polling / the webhook
+        # runner closed the session would have reopened it
+        await bot.session.close()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        # clean shutdown -> cache snapshot for a fast next start
+        await db.close_db()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
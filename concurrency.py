@@ -0,0 +1,62 @@
+# ===== Параллельная обработка апдейтов с порядком внутри пользователя =====
+# aiogram по умолчанию запускает каждый апдейт отдельной задачей без ограничений
+# и без гарантий порядка. FSM-сценарии (Register, ReminderState, TrainingAdminState)
+# ломаются, если два сообщения одного пользователя обрабатываются одновременно.
+#
+# UserOrderedIsolation подключается в Dispatcher(events_isolation=...):
+# FSM-middleware берёт lock(key) ДО чтения состояния, поэтому апдейты одного
+# пользователя идут строго по очереди, а разные пользователи — параллельно,
+# но не больше `concurrency` хэндлеров одновременно.
+from __future__ import annotations
+
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncGenerator, Hashable
+
+from aiogram.fsm.storage.base import BaseEventIsolation, StorageKey
+
+
+class _Lane:
+    """Очередь одного пользователя: FIFO-lock + число ожидающих (для сборки мусора)."""
+
+    __slots__ = ("lock", "waiters")
+
+    def __init__(self) -> None:
+        self.lock = asyncio.Lock()
+        self.waiters = 0
+
+
+class UserOrderedIsolation(BaseEventIsolation):
+    def __init__(self, concurrency: int) -> None:
+        if concurrency <= 0:
+            raise ValueError("concurrency must be positive")
+        self.concurrency = concurrency
+        self._slots = asyncio.Semaphore(concurrency)
+        self._lanes: dict[Hashable, _Lane] = {}
+
+    @asynccontextmanager
+    async def lock(self, key: StorageKey) -> AsyncGenerator[None, None]:
+        # asyncio.Lock честный (FIFO), а до этой точки апдейт не уступает цикл —
+        # значит, порядок захвата совпадает с порядком поступления апдейтов.
+        lane = self._lanes.get(key)
+        if lane is None:
+            lane = self._lanes[key] = _Lane()
+        lane.waiters += 1
+        try:
+            async with lane.lock:
+                # слот берём только головой очереди пользователя: хвост одного
+                # "шумного" пользователя не занимает общий лимит
+                async with self._slots:
+                    yield
+        finally:
+            lane.waiters -= 1
+            if lane.waiters == 0:
+                # пользователь простаивает — очередь больше не нужна
+                self._lanes.pop(key, None)
+
+    @property
+    def active_lanes(self) -> int:
+        return len(self._lanes)
+
+    async def close(self) -> None:
+        self._lanes.clear()
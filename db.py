@@ -3,25 +3,40 @@
 from __future__ import annotations
 
 import asyncio
+import functools
+import logging
+import os
+import pickle
+import time
+from bisect import bisect_left, bisect_right, insort
+from contextlib import contextmanager
 from dataclasses import dataclass
 from datetime import datetime, timezone
-from typing import Iterable
+from typing import AsyncIterator, Awaitable, Callable, Iterable
+from zoneinfo import ZoneInfo
 
 import aiosqlite
 import re
 import difflib
 
+import metrics
+import recurrence
+import tracing
+
 # ----------------------------
 # Глобальное состояние
 # ----------------------------
 _DB_PATH: str = "bot.db"
 _db: aiosqlite.Connection | None = None
 _db_lock = asyncio.Lock()
+logger = logging.getLogger("bot.db")
 
 # Кэши (используются синхронными функциями чтения — удобно для переводов/кнопок)
 users_db: dict[int, tuple[int, str | None, str | None, str | None, str, str | None]] = {}
 feedback_db: list[tuple[int, str, datetime]] = []
 banned_users: set[int] = set()
+# недоступные для отправки (заблокировали бота / чат удалён) — users.inactive=1
+inactive_users: set[int] = set()
 
 # FAQ: храним с id, чтобы можно было удалять/редактировать
 FAQ_ARTICLES: list[dict[str, str]] = []  # {"id": "1", "title": "...", "body": "...", "tags": "a,b"}
@@ -33,34 +48,108 @@ class Reminder:
     run_at_ts: float
     user_id: int
     text: str
+    rule: str | None = None   # повторяющееся (recurrence.py); None — разовое
+    tz: str | None = None     # пояс, в котором считается правило
 
+# В памяти — только напоминания с run_at_ts <= _reminder_horizon (окно вперёд от "сейчас"),
+# отсортированные по времени; дальние лежат в SQLite и подтягиваются refill_reminders().
 reminders: list[Reminder] = []
+reminder_window: float = 3600.0
+_reminder_horizon: float = 0.0
+# запись в reminders + кэш и сдвиг окна — под одним замком: иначе строка, вставленная
+# между SELECT окна и переносом горизонта, не попадёт ни в кэш, ни в догрузку (или попадёт дважды)
+_reminders_lock = asyncio.Lock()
 daily_digest_users: set[int] = set()
+# user_id -> (digest_time "HH:MM" | None, tz | None) — только у кого задано своё время/пояс
+digest_prefs: dict[int, tuple[str | None, str | None]] = {}
 daily_digest_message: str = "Ежедневный дайджест: проверьте обновления в «Обучалки» и «Ссылки»."
 
+# Счётчики для /stats: поддерживаются на каждой записи, стартовые значения — из SQL-агрегатов.
+# (feedback_db хранит только последние 500, reminders — только окно, поэтому len() не годится)
+feedback_total: int = 0
+reminders_pending: int = 0
+# Вторичные индексы пользователей: сегмент -> значение (None -> "") -> user_id.
+# Поддерживаются save_user(); строятся из users_db при загрузке (в снапшот не пишутся).
+# Выборка для рассылки по сегментам — пересечение множеств (select_users), счётчики /stats — len().
+users_by_segment: dict[str, dict[str, set[int]]] = {"role": {}, "shop": {}, "lang": {}}
+_SEGMENT_COLS = (("role", 2), ("shop", 3), ("lang", 4))
+
+# Поиск пользователя (/find): отсортированные списки (ключ, user_id) — префиксный поиск
+# бинпоиском, O(log n) + размер выдачи. Поддерживаются так же, как users_by_segment.
+_phone_keys: list[tuple[str, int]] = []
+_username_keys: list[tuple[str, int]] = []
+
+# размеры кэшей для /metrics (считаются только в момент запроса)
+metrics.CACHE_SIZE.set_function(lambda: len(users_db), "users_db")
+metrics.CACHE_SIZE.set_function(lambda: len(FAQ_ARTICLES), "FAQ_ARTICLES")
+metrics.CACHE_SIZE.set_function(lambda: len(reminders), "reminders")
+metrics.CACHE_SIZE.set_function(lambda: len(feedback_db), "feedback_db")
+metrics.CACHE_SIZE.set_function(lambda: len(banned_users), "banned_users")
+metrics.CACHE_SIZE.set_function(lambda: len(inactive_users), "inactive_users")
+metrics.CACHE_SIZE.set_function(lambda: len(daily_digest_users), "daily_digest_users")
+
 
 # ----------------------------
 # SQLite helpers
 # ----------------------------
 
+@functools.lru_cache(maxsize=256)
+def _stmt_label(query: str) -> str:
+    """'INSERT INTO users(...)' -> 'INSERT users' (метка для метрик)."""
+    words = query.replace("(", " ").split()
+    if not words:
+        return "?"
+    op = words[0].upper()
+    if op == "UPDATE" and len(words) > 1:
+        return f"UPDATE {words[1]}"
+    for i, w in enumerate(words[1:-1], start=1):
+        if w.upper() in ("INTO", "FROM"):
+            return f"{op} {words[i + 1]}"
+    return op
+
+@contextmanager
+def _observe(label: str):
+    """Метрика + span трассировки для одного SQL-выражения."""
+    t0 = time.perf_counter()
+    with tracing.span("sqlite", statement=label):
+        try:
+            yield
+        finally:
+            metrics.DB_STATEMENT_LATENCY.observe(time.perf_counter() - t0, label)
+
+async def _exec(query: str, params: tuple | list = ()) -> aiosqlite.Cursor:
+    assert _db is not None
+    with _observe(_stmt_label(query)):
+        return await _db.execute(query, params)
+
+async def _exec_many(query: str, rows: Iterable[tuple]) -> None:
+    assert _db is not None
+    with _observe(_stmt_label(query)):
+        await _db.executemany(query, rows)
+
+async def _commit() -> None:
+    assert _db is not None
+    t0 = time.perf_counter()
+    with tracing.span("sqlite", statement="COMMIT"):
+        try:
+            await _db.commit()
+        finally:
+            metrics.DB_COMMIT_LATENCY.observe(time.perf_counter() - t0)
+
 async def _fetchone(conn: aiosqlite.Connection, query: str, params: tuple = ()) -> aiosqlite.Row | None:
-    async with conn.execute(query, params) as cur:
-        return await cur.fetchone()
+    with _observe(_stmt_label(query)):
+        async with conn.execute(query, params) as cur:
+            return await cur.fetchone()
 
 async def _fetchall(conn: aiosqlite.Connection, query: str, params: tuple = ()) -> list[aiosqlite.Row]:
-    async with conn.execute(query, params) as cur:
-        return await cur.fetchall()
-
-async def _execute(conn: aiosqlite.Connection, query: str, params: tuple = ()) -> None:
-    await conn.execute(query, params)
-    await conn.commit()
+    with _observe(_stmt_label(query)):
+        async with conn.execute(query, params) as cur:
+            return await cur.fetchall()
 
 # ----------------------------
 # Init / schema
 # ----------------------------
 SCHEMA_SQL = """
-PRAGMA journal_mode=WAL;
-
 CREATE TABLE IF NOT EXISTS users (
   user_id INTEGER PRIMARY KEY,
   username TEXT,
@@ -120,50 +209,256 @@ DEFAULT_FAQ = [
 ]
 
 
-async def init_db(db_path: str = "bot.db") -> None:
+# ----------------------------
+# Миграции (PRAGMA user_version)
+# ----------------------------
+# Миграция N (с 1) — SQL-скрипт или async-функция(conn); выполняется в одной
+# транзакции вместе с `PRAGMA user_version=N`, поэтому либо применяется целиком,
+# либо не применяется. Новые таблицы/индексы/колонки — только новым элементом в
+# конце списка, старые не менять. Если версия БД уже последняя, старт = одно чтение
+# user_version.
+async def _add_users_phone(conn: aiosqlite.Connection) -> None:
+    # БД, созданные до появления phone
+    async with conn.execute("PRAGMA table_info(users)") as cur:
+        cols = [r["name"] async for r in cur]
+    if "phone" not in cols:
+        await conn.execute("ALTER TABLE users ADD COLUMN phone TEXT")
+
+
+# Таблицы, которые попадают в кэши: любое изменение увеличивает change_counter.n
+# (по нему проверяется, что снапшот кэшей ещё соответствует БД).
+CACHED_TABLES = ("users", "banned_users", "feedback", "reminders", "daily_digest_users", "settings", "faq")
+
+CHANGE_COUNTER_SQL = """
+CREATE TABLE IF NOT EXISTS change_counter (
+  id INTEGER PRIMARY KEY CHECK (id = 1),
+  n INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO change_counter(id, n) VALUES (1, 0);
+""" + "".join(
+    f"CREATE TRIGGER IF NOT EXISTS trg_{t}_{op.lower()} AFTER {op} ON {t} "
+    f"BEGIN UPDATE change_counter SET n = n + 1 WHERE id = 1; END;\n"
+    for t in CACHED_TABLES
+    for op in ("INSERT", "UPDATE", "DELETE")
+)
+
+# Кому дайджест за день уже доставлен. Не кэшируется (не в CACHED_TABLES):
+# в память читается только текущий день (digest.py).
+DIGEST_DELIVERIES_SQL = """
+CREATE TABLE IF NOT EXISTS digest_deliveries (
+  day TEXT NOT NULL,
+  user_id INTEGER NOT NULL,
+  sent_at REAL NOT NULL,
+  PRIMARY KEY (day, user_id)
+) WITHOUT ROWID;
+"""
+
+# Нормализованные ключи поиска (/find): телефон — только цифры E.164 (8XXXXXXXXXX -> 7...),
+# username — без @ в нижнем регистре. Значения считает только Python (normalize_phone()/
+# normalize_username()) — и при записи, и при заполнении здесь, иначе ключ в БД разойдётся
+# с ключом в памяти. Индексы отдают отсортированные ключи при холодной загрузке.
+async def _add_users_search_keys(conn: aiosqlite.Connection) -> None:
+    await conn.execute("ALTER TABLE users ADD COLUMN phone_norm TEXT")
+    await conn.execute("ALTER TABLE users ADD COLUMN username_lc TEXT")
+    async with conn.execute("SELECT user_id, username, phone FROM users") as cur:
+        rows = [(normalize_phone(r["phone"]), normalize_username(r["username"]), r["user_id"]) async for r in cur]
+    await conn.executemany("UPDATE users SET phone_norm=?, username_lc=? WHERE user_id=?", rows)
+    await conn.execute("CREATE INDEX IF NOT EXISTS idx_users_phone_norm ON users(phone_norm)")
+    await conn.execute("CREATE INDEX IF NOT EXISTS idx_users_username_lc ON users(username_lc)")
+
+
+Migration = str | Callable[[aiosqlite.Connection], Awaitable[None]]
+
+MIGRATIONS: list[Migration] = [
+    SCHEMA_SQL,         # 1: базовая схема (IF NOT EXISTS — подходит и для БД до версий)
+    _add_users_phone,   # 2: users.phone
+    CHANGE_COUNTER_SQL, # 3: счётчик изменений для снапшота кэшей
+    "CREATE INDEX IF NOT EXISTS idx_reminders_run_at ON reminders(run_at_ts);",  # 4: окно напоминаний
+    "ALTER TABLE users ADD COLUMN inactive INTEGER NOT NULL DEFAULT 0;",           # 5: недоступные пользователи
+    DIGEST_DELIVERIES_SQL,  # 6: журнал доставки дайджеста
+    "ALTER TABLE daily_digest_users ADD COLUMN digest_time TEXT;\n"
+    "ALTER TABLE daily_digest_users ADD COLUMN tz TEXT;",  # 7: своё время/пояс дайджеста
+    "ALTER TABLE reminders ADD COLUMN rule TEXT;\n"
+    "ALTER TABLE reminders ADD COLUMN tz TEXT;",           # 8: повторяющиеся напоминания
+    _add_users_search_keys,                                # 9: поиск по телефону/username
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+async def _schema_version(conn: aiosqlite.Connection) -> int:
+    async with conn.execute("PRAGMA user_version") as cur:
+        row = await cur.fetchone()
+    return int(row[0])
+
+
+async def migrate(conn: aiosqlite.Connection) -> int:
+    """Доводит схему до SCHEMA_VERSION. Возвращает итоговую версию."""
+    version = await _schema_version(conn)
+    if version >= SCHEMA_VERSION:
+        return version
+    if version == 0:
+        # режим журнала хранится в файле БД — достаточно один раз, и не внутри транзакции
+        async with conn.execute("PRAGMA journal_mode=WAL"):
+            pass
+    for n in range(version + 1, SCHEMA_VERSION + 1):
+        step = MIGRATIONS[n - 1]
+        try:
+            if isinstance(step, str):
+                await conn.executescript(f"BEGIN;\n{step}\nPRAGMA user_version={n};\nCOMMIT;")
+            else:
+                await conn.execute("BEGIN")
+                await step(conn)
+                await conn.execute(f"PRAGMA user_version={n}")
+                await conn.commit()
+        except Exception:
+            if conn.in_transaction:
+                await conn.rollback()
+            raise
+    return SCHEMA_VERSION
+
+
+async def init_db(db_path: str = "bot.db", reminder_window_sec: float | None = None) -> None:
     """
     1) Открывает SQLite
-    2) Создаёт таблицы
-    3) Загружает кэши в память
+    2) Применяет недостающие миграции
+    3) Загружает кэши в память (напоминания — только на reminder_window_sec вперёд)
     """
-    global _DB_PATH, _db
+    global _DB_PATH, _db, reminder_window, _reminders_lock
     _DB_PATH = db_path
+    _reminders_lock = asyncio.Lock()  # замок привязывается к event loop — новый на каждый запуск
+    if reminder_window_sec is not None:
+        reminder_window = max(60.0, float(reminder_window_sec))
 
     async with _db_lock:
         if _db is None:
-            _db = await aiosqlite.connect(_DB_PATH)
-            _db.row_factory = aiosqlite.Row
-            await _db.executescript(SCHEMA_SQL)
-            await _db.commit()
-            # --- миграции схемы (безопасно для существующей БД) ---
-            cur = await _db.execute("PRAGMA table_info(users)")
-            rows = await cur.fetchall()
-            await cur.close()
-            cols = [r["name"] for r in rows]
-            if "phone" not in cols:
-                await _db.execute("ALTER TABLE users ADD COLUMN phone TEXT")
-                await _db.commit()
+            conn = await aiosqlite.connect(_DB_PATH)
+            conn.row_factory = aiosqlite.Row
+            try:
+                await migrate(conn)
+            except Exception:
+                await conn.close()
+                raise
+            _db = conn
 
     # первичная инициализация дефолтов
     await _ensure_defaults()
-    await _reload_caches()
+    if not await _load_snapshot():
+        await _reload_caches()
 
 
-async def close_db() -> None:
+async def close_db(snapshot: bool = True) -> None:
+    """Закрывает БД; при snapshot=True сначала сохраняет снапшот кэшей для быстрого старта."""
     global _db
     async with _db_lock:
         if _db is not None:
+            if snapshot:
+                try:
+                    await save_snapshot()
+                except Exception as e:
+                    logger.warning("Cache snapshot not saved: %s", e)
             await _db.close()
             _db = None
 
 
+# ----------------------------
+# Снапшот кэшей (быстрый рестарт)
+# ----------------------------
+# При штатной остановке кэши целиком пишутся одним pickle в BOT_DB + ".cache" вместе
+# со штампом (версия схемы, change_counter.n). При старте, если штамп совпал с БД,
+# кэши берутся из файла, иначе — обычный _reload_caches() построчно из SQLite.
+# Любая запись в кэшируемые таблицы (в т.ч. не через бота) меняет штамп, поэтому
+# устаревший снапшот просто игнорируется.
+SNAPSHOT_FORMAT = 7
+
+
+def _snapshot_path() -> str | None:
+    if not _DB_PATH or _DB_PATH == ":memory:" or _DB_PATH.startswith("file:"):
+        return None
+    return _DB_PATH + ".cache"
+
+
+async def _stamp() -> tuple[int, int]:
+    assert _db is not None
+    row = await _fetchone(_db, "SELECT n FROM change_counter WHERE id=1")
+    return (SCHEMA_VERSION, int(row["n"]) if row else 0)
+
+
+async def save_snapshot() -> bool:
+    path = _snapshot_path()
+    if path is None:
+        return False
+    assert _db is not None
+    if _db.in_transaction:
+        # чью-то запись прервали между SQL и обновлением кэша — кэш может не совпадать с БД
+        logger.warning("Cache snapshot skipped: unfinished transaction")
+        return False
+    data = {
+        "format": SNAPSHOT_FORMAT,
+        "stamp": await _stamp(),
+        "users": list(users_db.values()),
+        "banned": list(banned_users),
+        "inactive": list(inactive_users),
+        "feedback": list(feedback_db),
+        "reminders": [(r.id, r.run_at_ts, r.user_id, r.text, r.rule, r.tz) for r in reminders],
+        "reminder_horizon": _reminder_horizon,
+        "counters": (feedback_total, reminders_pending),
+        "digest_users": list(daily_digest_users),
+        "digest_prefs": digest_prefs,
+        "digest_message": daily_digest_message,
+        "faq": list(FAQ_ARTICLES),
+    }
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+    return True
+
+
+async def _load_snapshot() -> bool:
+    """True — кэши загружены из снапшота (штамп совпал)."""
+    global daily_digest_message, _reminder_horizon, feedback_total, reminders_pending
+    path = _snapshot_path()
+    if path is None or not os.path.exists(path):
+        return False
+    try:
+        with open(path, "rb") as f:
+            data = pickle.load(f)
+        if data.get("format") != SNAPSHOT_FORMAT or tuple(data.get("stamp", ())) != await _stamp():
+            return False
+        users = {u[0]: u for u in data["users"]}
+        rems = [Reminder(*r) for r in data["reminders"]]
+    except Exception as e:
+        logger.warning("Cache snapshot %s ignored: %s", path, e)
+        return False
+
+    users_db.clear()
+    users_db.update(users)
+    banned_users.clear()
+    banned_users.update(data["banned"])
+    inactive_users.clear()
+    inactive_users.update(data["inactive"])
+    feedback_db[:] = data["feedback"]
+    reminders[:] = rems
+    # окно могло "уехать", пока бот стоял — догрузится первым refill_reminders()
+    _reminder_horizon = float(data["reminder_horizon"])
+    daily_digest_users.clear()
+    daily_digest_users.update(data["digest_users"])
+    digest_prefs.clear()
+    digest_prefs.update(data["digest_prefs"])
+    daily_digest_message = data["digest_message"]
+    FAQ_ARTICLES[:] = data["faq"]
+    feedback_total, reminders_pending = data["counters"]
+    _rebuild_indexes()
+    return True
+
+
 async def _ensure_defaults() -> None:
     assert _db is not None
 
     # daily digest message
     row = await _fetchone(_db, "SELECT value FROM settings WHERE key='daily_digest_message'")
     if row is None:
-        await _db.execute(
+        await _exec(
             "INSERT OR REPLACE INTO settings(key,value) VALUES('daily_digest_message', ?)",
             (daily_digest_message,),
         )
@@ -172,12 +467,12 @@ async def _ensure_defaults() -> None:
     row = await _fetchone(_db, "SELECT COUNT(1) AS c FROM faq")
     if row["c"] == 0:
         now = datetime.now(timezone.utc).isoformat()
-        await _db.executemany(
+        await _exec_many(
             "INSERT INTO faq(title, body, tags, created_at) VALUES(?,?,?,?)",
             [(t, b, tags, now) for (t, b, tags) in DEFAULT_FAQ],
         )
 
-    await _db.commit()
+    await _commit()
 
 
 async def _reload_caches() -> None:
@@ -189,11 +484,15 @@ async def _reload_caches() -> None:
     feedback_db.clear()
     reminders.clear()
     daily_digest_users.clear()
+    digest_prefs.clear()
     FAQ_ARTICLES.clear()
 
-    async with _db.execute("SELECT user_id, username, role, shop, lang, phone FROM users") as cur:
+    inactive_users.clear()
+    async with _db.execute("SELECT user_id, username, role, shop, lang, phone, inactive FROM users") as cur:
         async for r in cur:
             users_db[int(r["user_id"])] = (int(r["user_id"]), r["username"], r["role"], r["shop"], r["lang"], r["phone"])
+            if r["inactive"]:
+                inactive_users.add(int(r["user_id"]))
 
     async with _db.execute("SELECT user_id FROM banned_users") as cur:
         async for r in cur:
@@ -208,13 +507,16 @@ async def _reload_caches() -> None:
                 ts = datetime.now(timezone.utc)
             feedback_db.append((int(r["user_id"]), r["text"], ts))
 
-    async with _db.execute("SELECT id, user_id, run_at_ts, text FROM reminders ORDER BY run_at_ts ASC") as cur:
-        async for r in cur:
-            reminders.append(Reminder(id=int(r["id"]), user_id=int(r["user_id"]), run_at_ts=float(r["run_at_ts"]), text=r["text"]))
+    global _reminder_horizon
+    _reminder_horizon = time.time() + reminder_window
+    reminders.extend(await _load_reminders(float("-inf"), _reminder_horizon))
 
-    async with _db.execute("SELECT user_id FROM daily_digest_users WHERE enabled=1") as cur:
+    async with _db.execute("SELECT user_id, enabled, digest_time, tz FROM daily_digest_users") as cur:
         async for r in cur:
-            daily_digest_users.add(int(r["user_id"]))
+            if r["enabled"]:
+                daily_digest_users.add(int(r["user_id"]))
+            if r["digest_time"] or r["tz"]:
+                digest_prefs[int(r["user_id"])] = (r["digest_time"], r["tz"])
 
     row = await _fetchone(_db, "SELECT value FROM settings WHERE key='daily_digest_message'")
     global daily_digest_message
@@ -227,6 +529,68 @@ async def _reload_caches() -> None:
                 {"id": str(r["id"]), "title": r["title"], "body": r["body"], "tags": r["tags"] or ""}
             )
 
+    await _seed_counters()
+    # списки поиска — уже отсортированными из индексов (rowid = user_id идёт вторым ключом)
+    for keys, col in ((_phone_keys, "phone_norm"), (_username_keys, "username_lc")):
+        rows = await _fetchall(_db, f"SELECT {col}, user_id FROM users WHERE {col} IS NOT NULL ORDER BY {col}, user_id")
+        keys[:] = [(r[0], int(r[1])) for r in rows]
+
+
+async def _seed_counters() -> None:
+    global feedback_total, reminders_pending
+    assert _db is not None
+    feedback_total = int((await _fetchone(_db, "SELECT COUNT(1) AS c FROM feedback"))["c"])
+    reminders_pending = int((await _fetchone(_db, "SELECT COUNT(1) AS c FROM reminders"))["c"])
+    _rebuild_indexes(search_keys=False)
+
+
+def _rebuild_indexes(search_keys: bool = True) -> None:
+    for idx in users_by_segment.values():
+        idx.clear()
+    for u in users_db.values():
+        for seg, col in _SEGMENT_COLS:
+            users_by_segment[seg].setdefault(u[col] or "", set()).add(u[0])
+    if search_keys:
+        # списки поиска — одной сортировкой, а не insort на каждого
+        _phone_keys[:] = sorted((k, u[0]) for u in users_db.values() if (k := normalize_phone(u[5])))
+        _username_keys[:] = sorted((k, u[0]) for u in users_db.values() if (k := normalize_username(u[1])))
+
+
+def _index_user(u: tuple) -> None:
+    for seg, col in _SEGMENT_COLS:
+        users_by_segment[seg].setdefault(u[col] or "", set()).add(u[0])
+    for keys, key in ((_phone_keys, normalize_phone(u[5])), (_username_keys, normalize_username(u[1]))):
+        if key:
+            insort(keys, (key, u[0]))
+
+
+def _unindex_user(u: tuple) -> None:
+    for seg, col in _SEGMENT_COLS:
+        idx = users_by_segment[seg]
+        key = u[col] or ""
+        ids = idx.get(key)
+        if ids is not None:
+            ids.discard(u[0])
+            if not ids:
+                del idx[key]
+    for keys, key in ((_phone_keys, normalize_phone(u[5])), (_username_keys, normalize_username(u[1]))):
+        if key:
+            i = bisect_left(keys, (key, u[0]))
+            if i < len(keys) and keys[i] == (key, u[0]):
+                del keys[i]
+
+
+def normalize_phone(phone: str | None) -> str | None:
+    """'+7 (999) 123-45-67' / '89991234567' -> '79991234567'."""
+    digits = re.sub(r"\D", "", phone or "")
+    if len(digits) == 11 and digits.startswith("8"):
+        digits = "7" + digits[1:]
+    return digits or None
+
+
+def normalize_username(username: str | None) -> str | None:
+    return (username or "").lstrip("@").lower() or None
+
 # ----------------------------
 # Sync READ API (кэш)
 # ----------------------------
@@ -248,90 +612,423 @@ def get_daily_digest_users() -> set[int]:
 def get_daily_digest_message() -> str:
     return daily_digest_message
 
+def get_stats() -> dict:
+    """Все числа для /stats за O(1) (+ размер разбивки по сегментам)."""
+    return {
+        "users": len(users_db),
+        "feedback": feedback_total,
+        "banned": len(banned_users),
+        "inactive": len(inactive_users),
+        "digest": len(daily_digest_users),
+        "reminders": reminders_pending,
+        "by_role": {k: len(v) for k, v in users_by_segment["role"].items()},
+        "by_shop": {k: len(v) for k, v in users_by_segment["shop"].items()},
+        "by_lang": {k: len(v) for k, v in users_by_segment["lang"].items()},
+    }
+
+# Выгрузка (/export_*): страницы по первичному ключу. Каждая страница — законченный
+# запрос, открытый курсор не висит между страницами и не мешает COMMIT'ам бота;
+# в памяти — не больше одной страницы.
+EXPORTS: dict[str, tuple[tuple[str, ...], str]] = {
+    "users": (
+        ("user_id", "username", "role", "shop", "lang", "phone", "inactive", "banned"),
+        "SELECT u.user_id, u.username, u.role, u.shop, u.lang, u.phone, u.inactive, "
+        "EXISTS(SELECT 1 FROM banned_users b WHERE b.user_id = u.user_id) "
+        "FROM users u WHERE u.user_id > ? ORDER BY u.user_id LIMIT ?",
+    ),
+    "feedback": (
+        ("id", "user_id", "text", "created_at"),
+        "SELECT id, user_id, text, created_at FROM feedback WHERE id > ? ORDER BY id LIMIT ?",
+    ),
+}
+
+async def iter_export(kind: str, page: int = 1000) -> AsyncIterator[list[tuple]]:
+    """Строки таблицы kind (см. EXPORTS) страницами по page; ключ — первая колонка."""
+    assert _db is not None
+    query = EXPORTS[kind][1]
+    after = float("-inf")
+    while True:
+        with _observe(f"SELECT {kind}"):
+            async with _db.execute(query, (after, page)) as cur:
+                rows = [tuple(r) for r in await cur.fetchall()]
+        if not rows:
+            return
+        yield rows
+        if len(rows) < page:
+            return
+        after = rows[-1][0]
+
+# Постраничные списки админки: keyset по первичному ключу — страница = один запрос
+# по индексу (WHERE key > ? / key < ? ... LIMIT), без копии кэша и без OFFSET.
+PAGES: dict[str, tuple[str, str]] = {
+    "users": ("users", "user_id, username, role, shop, lang, phone"),
+    "faq": ("faq", "id, title"),
+}
+
+async def list_page(
+    kind: str, after: int | None = None, before: int | None = None, limit: int = 20
+) -> tuple[list[tuple], bool, bool]:
+    """Страница kind после ключа after (вперёд) или перед before (назад).
+    Возвращает (строки по возрастанию ключа, есть предыдущая, есть следующая)."""
+    assert _db is not None
+    table, cols = PAGES[kind]
+    key = cols.split(",")[0]
+    if before is not None:
+        query = f"SELECT {cols} FROM {table} WHERE {key} < ? ORDER BY {key} DESC LIMIT ?"
+        params: tuple = (before, limit + 1)
+    else:
+        query = f"SELECT {cols} FROM {table} WHERE {key} > ? ORDER BY {key} LIMIT ?"
+        params = (after if after is not None else -1, limit + 1)
+    with _observe(f"SELECT {table}"):
+        async with _db.execute(query, params) as cur:
+            rows = [tuple(r) for r in await cur.fetchall()]
+    more = len(rows) > limit
+    rows = rows[:limit]
+    if before is not None:
+        rows.reverse()
+        return rows, more, True
+    return rows, after is not None, more
+
+def find_users(query: str, limit: int = 20) -> list[tuple]:
+    """Пользователи по префиксу телефона или username (или точному id).
+    Цифры (с +, пробелами, скобками) — телефон, иначе — username; '8...' как '7...'."""
+    q = (query or "").strip()
+    found: dict[int, tuple] = {}
+    if q.isdigit() and int(q) in users_db:
+        found[int(q)] = users_db[int(q)]
+    if re.fullmatch(r"\+?[\d\s()\-]+", q):
+        prefix = re.sub(r"\D", "", q)
+        if prefix.startswith("8") and not q.startswith("+"):
+            prefix = "7" + prefix[1:]
+        keys = _phone_keys
+    else:
+        prefix = normalize_username(q) or ""
+        keys = _username_keys
+    if prefix:
+        i = bisect_left(keys, (prefix, -1))
+        while i < len(keys) and len(found) < limit and keys[i][0].startswith(prefix):
+            uid = keys[i][1]
+            found.setdefault(uid, users_db[uid])
+            i += 1
+    return list(found.values())[:limit]
+
+def select_users(role: str | None = None, shop: str | None = None, lang: str | None = None) -> set[int]:
+    """user_id, подходящие под все заданные фильтры (None — без фильтра).
+    Пересекаем множества индексов, начиная с самого маленького."""
+    sets = [
+        users_by_segment[seg].get(value, set())
+        for seg, value in (("role", role), ("shop", shop), ("lang", lang))
+        if value is not None
+    ]
+    if not sets:
+        return set(users_db)
+    sets.sort(key=len)
+    return sets[0].intersection(*sets[1:])
+
 # ----------------------------
 # Async WRITE API (SQLite + кэш)
 # ----------------------------
 async def save_user(user_id: int, username: str | None, role: str | None = None, shop: str | None = None, lang: str = "RU", phone: str | None = None):
     assert _db is not None
-    await _db.execute(
-        "INSERT INTO users(user_id, username, role, shop, lang, phone) VALUES(?,?,?,?,?,?) "
-        "ON CONFLICT(user_id) DO UPDATE SET username=excluded.username, role=excluded.role, shop=excluded.shop, lang=excluded.lang, phone=COALESCE(excluded.phone, users.phone)",
-        (user_id, username, role, shop, lang, phone),
+    await _exec(
+        "INSERT INTO users(user_id, username, role, shop, lang, phone, phone_norm, username_lc) VALUES(?,?,?,?,?,?,?,?) "
+        "ON CONFLICT(user_id) DO UPDATE SET username=excluded.username, role=excluded.role, shop=excluded.shop, lang=excluded.lang, "
+        "phone=COALESCE(excluded.phone, users.phone), phone_norm=COALESCE(excluded.phone_norm, users.phone_norm), "
+        "username_lc=excluded.username_lc",
+        (user_id, username, role, shop, lang, phone, normalize_phone(phone), normalize_username(username)),
     )
-    await _db.commit()
+    await _commit()
     prev = users_db.get(user_id)
     cache_phone = phone if phone is not None else (prev[5] if prev and len(prev) > 5 else None)
-    users_db[user_id] = (user_id, username, role, shop, lang, cache_phone)
+    user = (user_id, username, role, shop, lang, cache_phone)
+    users_db[user_id] = user
+    if prev is not None:
+        _unindex_user(prev)
+    _index_user(user)
 
 async def ban_user(user_id: int):
     assert _db is not None
-    await _db.execute("INSERT OR REPLACE INTO banned_users(user_id) VALUES(?)", (user_id,))
-    await _db.commit()
+    await _exec("INSERT OR REPLACE INTO banned_users(user_id) VALUES(?)", (user_id,))
+    await _commit()
     banned_users.add(user_id)
 
 async def unban_user(user_id: int):
     assert _db is not None
-    await _db.execute("DELETE FROM banned_users WHERE user_id=?", (user_id,))
-    await _db.commit()
+    await _exec("DELETE FROM banned_users WHERE user_id=?", (user_id,))
+    await _commit()
     banned_users.discard(user_id)
 
+# Массовые операции админки: executemany в одной транзакции (ошибка — откат всего),
+# кэши обновляются одним проходом после COMMIT.
+async def _commit_or_rollback(statements: list[tuple[str, list[tuple]]]) -> None:
+    assert _db is not None
+    try:
+        for query, rows in statements:
+            await _exec_many(query, rows)
+        await _commit()
+    except Exception:
+        await _db.rollback()
+        raise
+
+async def ban_users(user_ids: Iterable[int]) -> int:
+    """Банит всех; возвращает, сколько забанено заново (уже забаненные не считаются)."""
+    new = set(user_ids) - banned_users
+    if new:
+        await _commit_or_rollback([("INSERT OR IGNORE INTO banned_users(user_id) VALUES(?)", [(u,) for u in new])])
+        banned_users.update(new)
+    return len(new)
+
+async def unban_users(user_ids: Iterable[int]) -> int:
+    old = set(user_ids) & banned_users
+    if old:
+        await _commit_or_rollback([("DELETE FROM banned_users WHERE user_id=?", [(u,) for u in old])])
+        banned_users.difference_update(old)
+    return len(old)
+
+# поля, которые правит админка -> позиция в кортеже users_db
+_EDIT_COLS = {"role": 2, "shop": 3, "lang": 4, "phone": 5}
+
+async def update_users(changes: dict[int, dict[str, str]]) -> tuple[int, list[int]]:
+    """changes: user_id -> {role/shop/lang/phone: значение}. Возвращает (изменено, не найденные id).
+
+    Пишутся только реально меняющиеся поля (по UPDATE на каждый набор полей, все — одной
+    транзакцией), остальные колонки строки не трогаем.
+    """
+    diffs: dict[int, dict[str, str]] = {}
+    by_fields: dict[tuple[str, ...], list[tuple]] = {}
+    missing: list[int] = []
+    for uid, fields in changes.items():
+        u = users_db.get(uid)
+        if u is None:
+            missing.append(uid)
+            continue
+        diff = {f: v for f, v in fields.items() if u[_EDIT_COLS[f]] != v}
+        if not diff:
+            continue
+        diffs[uid] = diff
+        keys = tuple(sorted(diff))
+        params = [diff[f] for f in keys]
+        if "phone" in diff:
+            params.append(normalize_phone(diff["phone"]))
+        by_fields.setdefault(keys, []).append((*params, uid))
+    if diffs:
+        statements = []
+        for keys, rows in by_fields.items():
+            cols = [f"{f}=?" for f in keys] + (["phone_norm=?"] if "phone" in keys else [])
+            statements.append((f"UPDATE users SET {', '.join(cols)} WHERE user_id=?", rows))
+        await _commit_or_rollback(statements)
+        # поверх текущей строки кэша: save_user, прошедший, пока ждали COMMIT, не откатываем
+        for uid, diff in diffs.items():
+            prev = users_db.get(uid)
+            if prev is None:
+                continue
+            row = list(prev)
+            for f, v in diff.items():
+                row[_EDIT_COLS[f]] = v
+            _unindex_user(prev)
+            users_db[uid] = tuple(row)  # type: ignore[assignment]
+            _index_user(users_db[uid])
+    return len(diffs), missing
+
+async def set_inactive(user_id: int, inactive: bool) -> None:
+    """Пометка "недоступен для отправки" (пишем в БД только при изменении)."""
+    if (user_id in inactive_users) == inactive:
+        return
+    cur = await _exec("UPDATE users SET inactive=? WHERE user_id=?", (1 if inactive else 0, user_id))
+    await _commit()
+    # нет строки в users (не проходил /start) — в БД пометить нечего, и кэш со снапшотом
+    # не должны держать состояние, которое пропадёт после холодной загрузки
+    if inactive and cur.rowcount > 0:
+        inactive_users.add(user_id)
+    else:
+        inactive_users.discard(user_id)
+
 async def save_feedback(user_id: int, text: str):
+    global feedback_total
     assert _db is not None
     created = datetime.now(timezone.utc).isoformat()
-    await _db.execute("INSERT INTO feedback(user_id, text, created_at) VALUES(?,?,?)", (user_id, text, created))
-    await _db.commit()
+    await _exec("INSERT INTO feedback(user_id, text, created_at) VALUES(?,?,?)", (user_id, text, created))
+    await _commit()
+    feedback_total += 1
     # кэш: держим максимум 500
     feedback_db.insert(0, (user_id, text, datetime.fromisoformat(created)))
     del feedback_db[500:]
 
 async def cleanup_feedback(user_id: int | None = None):
     assert _db is not None
-    global feedback_db
+    global feedback_db, feedback_total
     if user_id is not None:
-        await _db.execute("DELETE FROM feedback WHERE user_id=?", (user_id,))
+        cur = await _exec("DELETE FROM feedback WHERE user_id=?", (user_id,))
         feedback_db = [f for f in feedback_db if f[0] != user_id]
+        feedback_total = max(0, feedback_total - max(cur.rowcount, 0))
     else:
-        await _db.execute("DELETE FROM feedback")
+        await _exec("DELETE FROM feedback")
         feedback_db = []
-    await _db.commit()
+        feedback_total = 0
+    await _commit()
 
-async def add_reminder(user_id: int, run_at_ts: float, text: str):
+async def add_reminder(user_id: int, run_at_ts: float, text: str, rule: str | None = None, tz: str | None = None):
+    global reminders_pending
     assert _db is not None
-    cur = await _db.execute("INSERT INTO reminders(user_id, run_at_ts, text) VALUES(?,?,?)", (user_id, run_at_ts, text))
-    await _db.commit()
-    rid = cur.lastrowid or 0
-    reminders.append(Reminder(id=int(rid), user_id=user_id, run_at_ts=run_at_ts, text=text))
-    reminders.sort(key=lambda r: r.run_at_ts)
-
-async def pop_due_reminders(now_ts: float) -> list[Reminder]:
+    async with _reminders_lock:
+        cur = await _exec(
+            "INSERT INTO reminders(user_id, run_at_ts, text, rule, tz) VALUES(?,?,?,?,?)",
+            (user_id, run_at_ts, text, rule, tz),
+        )
+        await _commit()
+        reminders_pending += 1
+        rid = cur.lastrowid or 0
+        if run_at_ts <= _reminder_horizon:
+            insort(reminders, Reminder(int(rid), run_at_ts, user_id, text, rule, tz), key=_run_at)
+        # иначе — попадёт в память, когда до него дойдёт окно (refill_reminders)
+
+async def pop_due_reminders(now_ts: float, coalesce_sec: float = 0.0) -> list[Reminder]:
     """
     Достаём из SQLite и кэша напоминания, которые пора отправить.
-    Возвращаем список Reminder и удаляем их из БД.
+    Разовые удаляем из БД, повторяющимся переносим run_at_ts на следующее срабатывание.
+    coalesce_sec > 0 — заодно забираем напоминания тех же пользователей, которым
+    срабатывать в ближайшие coalesce_sec: уйдут одним сообщением, а не вдогонку.
     """
+    async with _reminders_lock:
+        return await _pop_due_locked(now_ts, coalesce_sec)
+
+async def _pop_due_locked(now_ts: float, coalesce_sec: float) -> list[Reminder]:
+    global reminders_pending
     assert _db is not None
-    due_ids: list[int] = []
-    due: list[Reminder] = []
-    # кэш уже отсортирован по времени
-    while reminders and reminders[0].run_at_ts <= now_ts:
-        r = reminders.pop(0)
-        due.append(r)
-        due_ids.append(r.id)
-
-    if due_ids:
-        q_marks = ",".join(["?"] * len(due_ids))
-        await _db.execute(f"DELETE FROM reminders WHERE id IN ({q_marks})", tuple(due_ids))
-        await _db.commit()
+    # кэш отсортирован по времени: созревшие — префикс списка
+    k = bisect_right(reminders, now_ts, key=_run_at)
+    if not k:
+        return []
+    due = reminders[:k]
+    del reminders[:k]
+    if coalesce_sec > 0:
+        users = {r.user_id for r in due}
+        k2 = bisect_right(reminders, now_ts + coalesce_sec, key=_run_at)
+        soon = reminders[:k2]
+        due.extend(r for r in soon if r.user_id in users)
+        reminders[:k2] = [r for r in soon if r.user_id not in users]
+
+    once = [(r.id,) for r in due if r.rule is None]
+    again: list[Reminder] = []
+    for r in due:
+        rule = recurrence.parse_rule(r.rule) if r.rule else None
+        if rule is not None:
+            tz = ZoneInfo(r.tz) if r.tz else timezone.utc
+            nxt = recurrence.next_fire(rule, r.run_at_ts, max(now_ts, r.run_at_ts), tz)
+            again.append(Reminder(r.id, nxt, r.user_id, r.text, r.rule, r.tz))
+        elif r.rule:
+            once.append((r.id,))  # правило не разбирается — считаем разовым
+    if once:
+        await _exec_many("DELETE FROM reminders WHERE id=?", once)
+    kept: list[Reminder] = []
+    for r in again:
+        # по одному: 0 строк — пользователь остановил повтор, пока напоминание было «в руках»,
+        # возвращать его в кэш нельзя (удаление после UPDATE дочистит кэш само — оно позже в очереди)
+        cur = await _exec("UPDATE reminders SET run_at_ts=? WHERE id=?", (r.run_at_ts, r.id))
+        if cur.rowcount:
+            kept.append(r)
+    await _commit()
+    reminders_pending = max(0, reminders_pending - len(once))
+    for r in kept:
+        # следующее срабатывание — сразу в окно, если попадает (бинпоиск, без пересканирования)
+        if r.run_at_ts <= _reminder_horizon:
+            insort(reminders, r, key=_run_at)
     return due
 
+async def delete_recurring_reminders(user_id: int) -> int:
+    """Удаляет все повторяющиеся напоминания пользователя. Возвращает, сколько удалено."""
+    global reminders_pending
+    cur = await _exec("DELETE FROM reminders WHERE user_id=? AND rule IS NOT NULL", (user_id,))
+    await _commit()
+    reminders[:] = [r for r in reminders if not (r.user_id == user_id and r.rule)]
+    reminders_pending = max(0, reminders_pending - cur.rowcount)
+    return cur.rowcount
+
+async def refill_reminders(now_ts: float) -> int:
+    """Сдвигает окно: когда до горизонта осталось меньше половины окна, догружает
+    из SQLite (по индексу run_at_ts) напоминания до now + reminder_window.
+    Возвращает число догруженных."""
+    global _reminder_horizon
+    if _reminder_horizon - now_ts > reminder_window / 2:
+        return 0
+    async with _reminders_lock:
+        if _reminder_horizon - now_ts > reminder_window / 2:
+            return 0  # пока ждали замок, окно уже сдвинули
+        new_horizon = now_ts + reminder_window
+        rows = await _load_reminders(_reminder_horizon, new_horizon)
+        # все новые позже уже загруженных (> старого горизонта) — порядок сохраняется
+        reminders.extend(rows)
+        _reminder_horizon = new_horizon
+    return len(rows)
+
+async def _load_reminders(after_ts: float, until_ts: float) -> list[Reminder]:
+    assert _db is not None
+    rows = await _fetchall(
+        _db,
+        "SELECT id, user_id, run_at_ts, text, rule, tz FROM reminders WHERE run_at_ts > ? AND run_at_ts <= ? ORDER BY run_at_ts ASC",
+        (after_ts, until_ts),
+    )
+    return [
+        Reminder(int(r["id"]), float(r["run_at_ts"]), int(r["user_id"]), r["text"], r["rule"], r["tz"])
+        for r in rows
+    ]
+
+def _run_at(r: Reminder) -> float:
+    return r.run_at_ts
+
 async def enable_daily_digest(user_id: int, enabled: bool):
     assert _db is not None
+    # строку не удаляем: своё время/пояс сохраняются до следующей подписки
+    await _exec(
+        "INSERT INTO daily_digest_users(user_id, enabled) VALUES(?,?) "
+        "ON CONFLICT(user_id) DO UPDATE SET enabled=excluded.enabled",
+        (user_id, int(enabled)),
+    )
     if enabled:
-        await _db.execute("INSERT OR REPLACE INTO daily_digest_users(user_id, enabled) VALUES(?,1)", (user_id,))
         daily_digest_users.add(user_id)
     else:
-        await _db.execute("DELETE FROM daily_digest_users WHERE user_id=?", (user_id,))
         daily_digest_users.discard(user_id)
-    await _db.commit()
+    await _commit()
+
+async def set_digest_prefs(user_id: int, digest_time: str | None, tz: str | None) -> None:
+    """Своё время ("HH:MM") и пояс дайджеста; None — общее значение. Заодно включает подписку."""
+    await _exec(
+        "INSERT INTO daily_digest_users(user_id, enabled, digest_time, tz) VALUES(?,1,?,?) "
+        "ON CONFLICT(user_id) DO UPDATE SET enabled=1, digest_time=excluded.digest_time, tz=excluded.tz",
+        (user_id, digest_time, tz),
+    )
+    daily_digest_users.add(user_id)
+    if digest_time or tz:
+        digest_prefs[user_id] = (digest_time, tz)
+    else:
+        digest_prefs.pop(user_id, None)
+    await _commit()
+
+async def digest_delivered_since(day: str, user_id: int | None = None) -> set[tuple[str, int]]:
+    """(день, user_id) доставок начиная с day — для раскладки подписчиков при старте."""
+    assert _db is not None
+    query, params = "SELECT day, user_id FROM digest_deliveries WHERE day >= ?", (day,)
+    if user_id is not None:
+        query, params = query + " AND user_id = ?", (day, user_id)
+    async with _db.execute(query, params) as cur:
+        return {(r["day"], int(r["user_id"])) async for r in cur}
+
+async def record_digest_deliveries(day: str, user_ids: Iterable[int]) -> None:
+    ids = list(user_ids)
+    if not ids:
+        return
+    now = time.time()
+    await _exec_many(
+        "INSERT OR IGNORE INTO digest_deliveries(day, user_id, sent_at) VALUES(?,?,?)",
+        [(day, uid, now) for uid in ids],
+    )
+    await _commit()
+
+async def prune_digest_deliveries(before_day: str) -> int:
+    """Удаляет записи за дни раньше before_day (YYYY-MM-DD)."""
+    cur = await _exec("DELETE FROM digest_deliveries WHERE day < ?", (before_day,))
+    await _commit()
+    return cur.rowcount
 
 async def set_daily_digest_message(text: str):
     assert _db is not None
@@ -340,11 +1037,11 @@ async def set_daily_digest_message(text: str):
     if not new_text:
         return
     daily_digest_message = new_text
-    await _db.execute(
+    await _exec(
         "INSERT OR REPLACE INTO settings(key,value) VALUES('daily_digest_message', ?)",
         (daily_digest_message,),
     )
-    await _db.commit()
+    await _commit()
 
 # ----------------------------
 # FAQ: CRUD + поиск
@@ -352,16 +1049,16 @@ async def set_daily_digest_message(text: str):
 async def faq_add(title: str, body: str, tags: str = "") -> int:
     assert _db is not None
     now = datetime.now(timezone.utc).isoformat()
-    cur = await _db.execute("INSERT INTO faq(title, body, tags, created_at) VALUES(?,?,?,?)", (title, body, tags, now))
-    await _db.commit()
+    cur = await _exec("INSERT INTO faq(title, body, tags, created_at) VALUES(?,?,?,?)", (title, body, tags, now))
+    await _commit()
     fid = int(cur.lastrowid or 0)
     FAQ_ARTICLES.append({"id": str(fid), "title": title, "body": body, "tags": tags})
     return fid
 
 async def faq_delete(faq_id: int) -> bool:
     assert _db is not None
-    await _db.execute("DELETE FROM faq WHERE id=?", (faq_id,))
-    await _db.commit()
+    await _exec("DELETE FROM faq WHERE id=?", (faq_id,))
+    await _commit()
     before = len(FAQ_ARTICLES)
     FAQ_ARTICLES[:] = [a for a in FAQ_ARTICLES if int(a.get("id","0")) != int(faq_id)]
     return len(FAQ_ARTICLES) != before
@@ -410,8 +1107,8 @@ async def faq_edit(faq_id: int, title: str | None = None, body: str | None = Non
     new_title = title if title is not None else cur["title"]
     new_body = body if body is not None else cur["body"]
     new_tags = tags if tags is not None else (cur["tags"] or "")
-    await _db.execute("UPDATE faq SET title=?, body=?, tags=? WHERE id=?", (new_title, new_body, new_tags, faq_id))
-    await _db.commit()
+    await _exec("UPDATE faq SET title=?, body=?, tags=? WHERE id=?", (new_title, new_body, new_tags, faq_id))
+    await _commit()
     # обновим кэш
     for a in FAQ_ARTICLES:
         if int(a.get("id","0")) == int(faq_id):
@@ -450,16 +1147,17 @@ def search_faq(query: str, limit: int = 5) -> list[dict[str, str]]:
         return []
 
     scored: list[tuple[float, dict[str, str]]] = []
-    for art in FAQ_ARTICLES:
-        title = art.get("title", "")
-        body = art.get("body", "")
-        tags = art.get("tags", "")
-        hay = f"{title}\n{body}\n{tags}"
-        score = _token_set_ratio(q, hay)
-        # небольшая надбавка, если совпало в заголовке
-        score += 0.10 * _token_set_ratio(q, title)
-        if score > 0.15:
-            scored.append((score, art))
-
-    scored.sort(key=lambda x: x[0], reverse=True)
+    with tracing.span("search_faq", articles=len(FAQ_ARTICLES)):
+        for art in FAQ_ARTICLES:
+            title = art.get("title", "")
+            body = art.get("body", "")
+            tags = art.get("tags", "")
+            hay = f"{title}\n{body}\n{tags}"
+            score = _token_set_ratio(q, hay)
+            # небольшая надбавка, если совпало в заголовке
+            score += 0.10 * _token_set_ratio(q, title)
+            if score > 0.15:
+                scored.append((score, art))
+
+        scored.sort(key=lambda x: x[0], reverse=True)
     return [a for _, a in scored[:limit]]
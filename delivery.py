@@ -0,0 +1,348 @@
+# ===== Доставка сообщений пользователям =====
+# Рассылки, дайджест и напоминания шлют сообщения пачками. Ошибки отправки
+# классифицируем: заблокировавших бота / удалённые чаты помечаем неактивными
+# (db.set_inactive) — дальше fan-out их пропускает и не тратит на них запросы.
+# Пользователь снова становится активным по my_chat_member (разблокировал бота).
+#
+# OutboundDispatcher — общая очередь для всех сообщений, которые бот шлёт сам:
+# приоритеты (напоминания > дайджест > рассылка), общий лимит (token bucket),
+# лимит на чат и пауза по RetryAfter. Ответы хэндлеров (interactive) в очередь не
+# встают — они идут сразу, но списывают токены из того же bucket'а, поэтому фоновые
+# рассылки автоматически притормаживают, а ответы пользователям не ждут.
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Iterable
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramNetworkError,
+    TelegramNotFound,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+
+import db
+import metrics
+
+logger = logging.getLogger("bot.delivery")
+
+# причины ошибок (метка метрики bot_delivery_failures_total{reason})
+BLOCKED = "blocked"                # 403: бот заблокирован / пользователь удалён
+CHAT_NOT_FOUND = "chat_not_found"  # 400/404: чата нет (никогда не писал боту, id неверный)
+RETRY_AFTER = "retry_after"        # 429: флуд-лимит Telegram
+NETWORK = "network"                # сеть / 5xx — временно
+OTHER = "other"
+
+# после этих ошибок писать пользователю бесполезно, пока он сам не вернётся
+PERMANENT = frozenset({BLOCKED, CHAT_NOT_FOUND})
+
+DELIVERY_FAILURES = metrics.Counter(
+    "bot_delivery_failures_total", "Failed fan-out sends by reason", ("reason",)
+)
+
+
+def classify_send_error(exc: BaseException) -> str:
+    if isinstance(exc, TelegramForbiddenError):
+        return BLOCKED
+    if isinstance(exc, TelegramRetryAfter):
+        return RETRY_AFTER
+    if isinstance(exc, (TelegramNetworkError, TelegramServerError)):
+        return NETWORK
+    if isinstance(exc, TelegramNotFound):
+        return CHAT_NOT_FOUND
+    if isinstance(exc, TelegramBadRequest):
+        msg = (getattr(exc, "message", "") or str(exc)).lower()
+        if "chat not found" in msg or "user not found" in msg or "peer_id_invalid" in msg:
+            return CHAT_NOT_FOUND
+    return OTHER
+
+
+async def handle_send_error(user_id: int, exc: BaseException) -> str:
+    """Учесть ошибку отправки; постоянные — пометить пользователя неактивным."""
+    reason = classify_send_error(exc)
+    DELIVERY_FAILURES.inc(reason)
+    if reason in PERMANENT:
+        await db.set_inactive(user_id, True)
+    elif reason == OTHER:
+        logger.warning("Send to %s failed: %s", user_id, exc)
+    return reason
+
+
+async def send_text(bot: Bot, user_id: int, text: str, priority: int | None = None) -> bool:
+    """send_message для fan-out: неактивных пропускает, ошибки не пробрасывает.
+    Если запущен OutboundDispatcher — отправка идёт через его очередь."""
+    if user_id in db.inactive_users:
+        return False
+    try:
+        if _dispatcher is not None:
+            await _dispatcher.send_message(user_id, text, BROADCAST if priority is None else priority)
+        else:
+            await bot.send_message(user_id, text)
+    except Exception as e:
+        await handle_send_error(user_id, e)
+        return False
+    return True
+
+
+async def send_many(
+    bot: Bot, items: Iterable[tuple[int, str]], priority: int | None = None, batch: int = 500
+) -> list[int]:
+    """Fan-out пачками по `batch` (память не растёт с числом получателей).
+    Возвращает user_id, кому доставлено."""
+    delivered: list[int] = []
+
+    async def one(uid: int, text: str) -> None:
+        if await send_text(bot, uid, text, priority):
+            delivered.append(uid)
+
+    chunk: list[tuple[int, str]] = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= batch:
+            await asyncio.gather(*(one(uid, text) for uid, text in chunk))
+            chunk.clear()
+    if chunk:
+        await asyncio.gather(*(one(uid, text) for uid, text in chunk))
+    return delivered
+
+
+# ----------------------------
+# Общая очередь исходящих
+# ----------------------------
+INTERACTIVE, REMINDER, DIGEST, BROADCAST = range(4)
+PRIORITY_NAMES = ("interactive", "reminder", "digest", "broadcast")
+
+# методы Bot API, которые отправляют сообщение в чат (учитываются в лимите)
+SEND_METHODS = frozenset({
+    "sendMessage", "sendDocument", "sendPhoto", "sendVideo", "sendAudio", "sendVoice",
+    "sendAnimation", "sendSticker", "sendMediaGroup", "sendLocation", "sendContact",
+    "copyMessage", "forwardMessage",
+})
+
+OUTBOUND_QUEUE_DEPTH = metrics.Gauge("bot_outbound_queue_depth", "Queued bot-initiated sends", ("priority",))
+OUTBOUND_WAIT = metrics.Histogram(
+    "bot_outbound_wait_seconds", "Time from enqueue to send", ("priority",),
+    buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0),
+)
+OUTBOUND_SENT = metrics.Counter("bot_outbound_sent_total", "Sends charged to the global rate limit", ("priority",))
+OUTBOUND_RETRY_AFTER = metrics.Counter("bot_outbound_retry_after_total", "RetryAfter (429) responses")
+
+# True внутри отправки из очереди — чтобы request middleware не списал токен второй раз
+_dispatching: ContextVar[bool] = ContextVar("outbound_dispatching", default=False)
+_dispatcher: "OutboundDispatcher | None" = None
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self._ts = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._ts) * self.rate)
+        self._ts = now
+
+    def charge(self, n: float = 1.0) -> None:
+        """Списать токены (можно уйти в минус — тогда очередь подождёт дольше)."""
+        self._refill()
+        self.tokens -= n
+
+    def delay(self) -> float:
+        """Сколько ждать до появления целого токена."""
+        self._refill()
+        return 0.0 if self.tokens >= 1.0 else (1.0 - self.tokens) / self.rate
+
+
+class _Job:
+    __slots__ = ("priority", "seq", "chat_id", "call", "future", "enqueued", "attempts")
+
+    def __init__(self, priority: int, seq: int, chat_id: int, call: Callable[[], Awaitable[Any]]) -> None:
+        self.priority = priority
+        self.seq = seq
+        self.chat_id = chat_id
+        self.call = call
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.enqueued = time.monotonic()
+        self.attempts = 0
+
+    def __lt__(self, other: "_Job") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class OutboundDispatcher:
+    def __init__(
+        self,
+        bot: Bot,
+        rate: float = 25.0,
+        burst: float = 25.0,
+        per_chat_interval: float = 1.0,
+        concurrency: int = 8,
+        max_retries: int = 3,
+    ) -> None:
+        self.bot = bot
+        self.per_chat_interval = per_chat_interval
+        self.max_retries = max_retries
+        self._bucket = TokenBucket(rate, burst)
+        self._sem = asyncio.Semaphore(concurrency)
+        self._ready: list[_Job] = []                         # heap по (priority, seq)
+        self._delayed: list[tuple[float, _Job]] = []         # ждут лимита своего чата
+        self._chat_next: dict[int, float] = {}               # chat_id -> когда можно следующее
+        self._paused_until = 0.0                             # глобальная пауза после 429
+        self._depth = [0] * len(PRIORITY_NAMES)
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._inflight: set[asyncio.Task] = set()
+
+    # ---------- API ----------
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run(), name="outbound-dispatcher")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        # уже отправляемые запросы дожидаемся: после stop() сессию бота можно закрывать
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+        for _, job in self._delayed:
+            job.future.cancel()
+        for job in self._ready:
+            job.future.cancel()
+        self._ready.clear()
+        self._delayed.clear()
+        self._depth = [0] * len(PRIORITY_NAMES)
+
+    def submit(self, chat_id: int, call: Callable[[], Awaitable[Any]], priority: int = BROADCAST) -> asyncio.Future:
+        job = _Job(priority, next(self._seq), chat_id, call)
+        heapq.heappush(self._ready, job)
+        self._depth[priority] += 1
+        self._wakeup.set()
+        return job.future
+
+    async def send_message(self, chat_id: int, text: str, priority: int = BROADCAST, **kwargs: Any) -> Any:
+        return await self.submit(chat_id, lambda: self.bot.send_message(chat_id, text, **kwargs), priority)
+
+    def charge_interactive(self) -> None:
+        self._bucket.charge()
+        OUTBOUND_SENT.inc(PRIORITY_NAMES[INTERACTIVE])
+
+    def depth(self, priority: int) -> int:
+        return self._depth[priority]
+
+    # ---------- цикл ----------
+    async def _run(self) -> None:
+        while True:
+            # слот — до выбора job: иначе job, выбранный, пока все слоты заняты, ушёл бы
+            # сразу после освобождения слота, не заметив паузу от только что пойманного 429
+            await self._sem.acquire()
+            try:
+                job = await self._next_job()
+            except BaseException:
+                self._sem.release()
+                raise
+            task = asyncio.create_task(self._deliver(job))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _next_job(self) -> _Job:
+        while True:
+            now = time.monotonic()
+            while self._delayed and self._delayed[0][0] <= now:
+                heapq.heappush(self._ready, heapq.heappop(self._delayed)[1])
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+            if not self._ready:
+                self._wakeup.clear()
+                timeout = self._delayed[0][0] - now if self._delayed else None
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            wait = self._bucket.delay()
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            job = heapq.heappop(self._ready)
+            next_ok = self._chat_next.get(job.chat_id, 0.0)
+            if next_ok > now:
+                heapq.heappush(self._delayed, (next_ok, job))
+                continue
+            self._chat_next[job.chat_id] = now + self.per_chat_interval
+            if len(self._chat_next) > 10_000:
+                self._chat_next = {c: t for c, t in self._chat_next.items() if t > now}
+            self._bucket.charge()
+            self._depth[job.priority] -= 1
+            return job
+
+    async def _deliver(self, job: _Job) -> None:
+        _dispatching.set(True)
+        name = PRIORITY_NAMES[job.priority]
+        OUTBOUND_WAIT.observe(time.monotonic() - job.enqueued, name)
+        OUTBOUND_SENT.inc(name)
+        try:
+            result = await job.call()
+        except TelegramRetryAfter as e:
+            OUTBOUND_RETRY_AFTER.inc()
+            # флуд-лимит Telegram общий на бота: останавливаем всю очередь
+            self._paused_until = max(self._paused_until, time.monotonic() + e.retry_after)
+            if job.attempts < self.max_retries and not job.future.done():
+                job.attempts += 1
+                heapq.heappush(self._ready, job)
+                self._depth[job.priority] += 1
+                self._wakeup.set()
+            elif not job.future.done():
+                job.future.set_exception(e)
+        except Exception as e:
+            if not job.future.done():
+                job.future.set_exception(e)
+        else:
+            if not job.future.done():
+                job.future.set_result(result)
+        finally:
+            self._sem.release()
+
+
+def start_dispatcher(bot: Bot, **kwargs: Any) -> OutboundDispatcher:
+    global _dispatcher
+    _dispatcher = OutboundDispatcher(bot, **kwargs)
+    _dispatcher.start()
+    return _dispatcher
+
+
+async def stop_dispatcher() -> None:
+    global _dispatcher
+    if _dispatcher is not None:
+        await _dispatcher.stop()
+        _dispatcher = None
+
+
+for _p, _name in enumerate(PRIORITY_NAMES):
+    OUTBOUND_QUEUE_DEPTH.set_function(lambda p=_p: _dispatcher.depth(p) if _dispatcher else 0, _name)
+
+
+class InteractiveRateMiddleware(BaseRequestMiddleware):
+    """Request middleware сессии: ответы хэндлеров списывают токен из общего лимита
+    (без ожидания), чтобы фоновая очередь под них подстраивалась."""
+
+    async def __call__(self, make_request, bot, method):
+        if (
+            _dispatcher is not None
+            and not _dispatching.get()
+            and getattr(method, "__api_method__", "") in SEND_METHODS
+        ):
+            _dispatcher.charge_interactive()
+        return await make_request(bot, method)
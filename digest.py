@@ -0,0 +1,235 @@
+# ===== Ежедневный дайджест =====
+# У каждого подписчика своё время и часовой пояс (daily_digest_users.digest_time / tz,
+# по умолчанию — общие DAILY_DIGEST_HOUR:MINUTE, Europe/Oslo). Планировщик держит
+# индекс «UTC-минута срабатывания -> пользователи» и кучу этих минут: тик забирает
+# только наступившие корзины, остальных подписчиков не трогает. После доставки
+# пользователь переезжает в корзину следующего локального дня.
+#
+# Кому дайджест за день (локальная дата пользователя) уже ушёл — в SQLite
+# (digest_deliveries), поэтому рестарт не даёт ни дублей, ни пропусков: при старте
+# недополучившие в пределах DIGEST_CATCHUP_HOURS сразу попадают в текущую минуту.
+#
+# Переход на летнее/зимнее время: локальное время переводится в UTC для каждого дня
+# заново. Несуществующее время (02:30 в день перевода вперёд) срабатывает на час позже,
+# дважды встречающееся (перевод назад) — один раз, при первом наступлении.
+from __future__ import annotations
+
+import heapq
+import logging
+import re
+import time
+from datetime import date, datetime, timedelta, timezone, tzinfo
+from typing import Awaitable, Callable, Iterable
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+import db
+from translations import group_by_lang, parse_lang_variants, pick_variant, tr_lang
+
+logger = logging.getLogger("bot.digest")
+
+# [(user_id, text)] -> доставленные user_id; в боте — delivery.send_many(bot, ..., priority=DIGEST)
+SendMany = Callable[[Iterable[tuple[int, str]]], Awaitable[list[int]]]
+
+_TIME_RE = re.compile(r"^([01]?\d|2[0-3])[:.]([0-5]\d)$")
+
+
+def parse_digest_time(text: str) -> tuple[str, str | None] | None:
+    """'08:30' или '08:30 Asia/Tashkent' -> ('08:30', tz | None). None — формат не подошёл."""
+    parts = (text or "").split()
+    if not parts or len(parts) > 2:
+        return None
+    m = _TIME_RE.match(parts[0])
+    if not m:
+        return None
+    tz_name = None
+    if len(parts) == 2:
+        tz_name = parts[1]
+        try:
+            ZoneInfo(tz_name)
+        except (ZoneInfoNotFoundError, ValueError):
+            return None
+    return f"{int(m.group(1)):02d}:{m.group(2)}", tz_name
+
+
+class DigestScheduler:
+    def __init__(
+        self,
+        hour: int,
+        minute: int,
+        tz: tzinfo,
+        catchup_hours: float = 12.0,
+        batch: int = 500,
+        keep_days: int = 7,
+        retry_minutes: int = 5,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.hour = hour
+        self.minute = minute
+        self.tz = tz
+        self.catchup = catchup_hours * 3600
+        self.batch = batch
+        self.keep_days = keep_days
+        self.retry_minutes = retry_minutes
+        self.clock = clock
+        self._buckets: dict[int, set[int]] = {}   # UTC epoch-минута -> user_id
+        self._minutes: list[int] = []             # куча минут (могут быть устаревшие)
+        self._slot: dict[int, tuple[int, date]] = {}  # user_id -> (минута, за какой локальный день)
+        self._loaded = False
+        self._pruned: date | None = None
+
+    # ---------- время срабатывания ----------
+    def user_time(self, user_id: int) -> tuple[int, int, tzinfo]:
+        digest_time, tz_name = db.digest_prefs.get(user_id, (None, None))
+        hour, minute = self.hour, self.minute
+        if digest_time:
+            h, m = digest_time.split(":")
+            hour, minute = int(h), int(m)
+        return hour, minute, ZoneInfo(tz_name) if tz_name else self.tz
+
+    def fire_ts(self, user_id: int, day: date) -> float:
+        hour, minute, zone = self.user_time(user_id)
+        # fold=0: в «дыре» — смещение до перевода (т.е. на час позже), в повторе — первое наступление
+        return datetime(day.year, day.month, day.day, hour, minute, tzinfo=zone).timestamp()
+
+    def last_fire(self, user_id: int, now_ts: float) -> tuple[float, date]:
+        """Последнее срабатывание не позже now_ts: (ts, локальный день)."""
+        zone = self.user_time(user_id)[2]
+        day = datetime.fromtimestamp(now_ts, zone).date()
+        ts = self.fire_ts(user_id, day)
+        if ts > now_ts:
+            day -= timedelta(days=1)
+            ts = self.fire_ts(user_id, day)
+        return ts, day
+
+    # ---------- индекс корзин ----------
+    def _place(self, user_id: int, minute: int, day: date) -> None:
+        self.unschedule(user_id)
+        bucket = self._buckets.get(minute)
+        if bucket is None:
+            bucket = self._buckets[minute] = set()
+            heapq.heappush(self._minutes, minute)
+        bucket.add(user_id)
+        self._slot[user_id] = (minute, day)
+
+    def _place_next(self, user_id: int, after_day: date) -> None:
+        day = after_day + timedelta(days=1)
+        self._place(user_id, int(self.fire_ts(user_id, day) // 60), day)
+
+    def _place_initial(self, user_id: int, now_ts: float, delivered: set[tuple[str, int]]) -> None:
+        ts, day = self.last_fire(user_id, now_ts)
+        if now_ts - ts <= self.catchup and (day.isoformat(), user_id) not in delivered:
+            self._place(user_id, int(now_ts // 60), day)  # пропущенный сегодня — досылаем сразу
+        else:
+            self._place_next(user_id, day)
+
+    def unschedule(self, user_id: int) -> None:
+        slot = self._slot.pop(user_id, None)
+        if slot is None:
+            return
+        bucket = self._buckets.get(slot[0])
+        if bucket is not None:
+            bucket.discard(user_id)
+            if not bucket:
+                del self._buckets[slot[0]]  # минута в куче останется, при извлечении пропустится
+
+    def _since(self, now_ts: float) -> str:
+        # локальный день пользователя может отставать от UTC-даты — берём с запасом
+        return (datetime.fromtimestamp(now_ts - self.catchup, timezone.utc) - timedelta(days=2)).date().isoformat()
+
+    async def load(self) -> None:
+        """Разложить всех подписчиков по корзинам (один раз при старте)."""
+        now = self.clock()
+        delivered = await db.digest_delivered_since(self._since(now))
+        self._buckets.clear()
+        self._minutes.clear()
+        self._slot.clear()
+        for uid in db.daily_digest_users:
+            self._place_initial(uid, now, delivered)
+        self._loaded = True
+
+    async def schedule(self, user_id: int) -> None:
+        """После подписки или смены времени/пояса пользователя."""
+        if user_id not in db.daily_digest_users:
+            self.unschedule(user_id)
+            return
+        now = self.clock()
+        delivered = await db.digest_delivered_since(self._since(now), user_id)
+        self._place_initial(user_id, now, delivered)
+
+    def pending(self) -> int:
+        return len(self._slot)
+
+    # ---------- тик ----------
+    async def tick(self, send_many: SendMany) -> int:
+        """Один проход планировщика. Возвращает, скольким доставлено."""
+        if not self._loaded:
+            await self.load()
+        now = self.clock()
+        now_min = int(now // 60)
+        await self._prune(now)
+
+        due: list[tuple[int, date]] = []
+        while self._minutes and self._minutes[0] <= now_min:
+            minute = heapq.heappop(self._minutes)
+            for uid in self._buckets.pop(minute, ()):
+                due.append((uid, self._slot.pop(uid)[1]))
+        if not due:
+            return 0
+
+        send: list[tuple[int, date]] = []
+        for uid, day in due:
+            if uid not in db.daily_digest_users:
+                continue
+            if now - self.fire_ts(uid, day) > self.catchup:
+                # окно досылки прошло (бот лежал дольше) — к ближайшему сроку после now
+                last_ts, last_day = self.last_fire(uid, now)
+                if last_day > day and now - last_ts <= self.catchup:
+                    self._place(uid, now_min, last_day)
+                else:
+                    self._place_next(uid, last_day)
+                continue
+            if uid in db.banned_users or uid in db.inactive_users:
+                self._place_next(uid, day)
+                continue
+            send.append((uid, day))
+        if not send:
+            return 0
+
+        variants = parse_lang_variants(db.get_daily_digest_message())
+        texts: dict[str, str] = {}
+        total = 0
+        for i in range(0, len(send), self.batch):
+            chunk = dict(send[i:i + self.batch])
+            groups = group_by_lang(chunk)
+            for lang in groups:
+                if lang not in texts:
+                    # текст рендерим один раз на язык за проход
+                    texts[lang] = tr_lang("digest_push", lang, text=pick_variant(variants, lang))
+            try:
+                delivered = set(await send_many((uid, texts[lang]) for lang, uids in groups.items() for uid in uids))
+            except Exception:
+                for uid, day in send[i:]:
+                    self._place(uid, now_min + self.retry_minutes, day)
+                raise
+
+            by_day: dict[date, list[int]] = {}
+            for uid, day in chunk.items():
+                if uid in delivered:
+                    by_day.setdefault(day, []).append(uid)
+                    self._place_next(uid, day)
+                elif uid in db.daily_digest_users:
+                    # временная ошибка — повтор позже (окно досылки проверится на следующем проходе)
+                    self._place(uid, now_min + self.retry_minutes, day)
+            # фиксируем после каждой пачки: рестарт посреди рассылки не пошлёт её заново
+            for day, uids in by_day.items():
+                await db.record_digest_deliveries(day.isoformat(), uids)
+            total += len(delivered)
+        logger.info("Digest: delivered %d of %d due", total, len(send))
+        return total
+
+    async def _prune(self, now_ts: float) -> None:
+        today = datetime.fromtimestamp(now_ts, timezone.utc).date()
+        if self._pruned == today:
+            return
+        self._pruned = today
+        await db.prune_digest_deliveries((today - timedelta(days=self.keep_days)).isoformat())
@@ -0,0 +1,58 @@
+# ===== Выгрузка таблиц (/export_users, /export_feedback) =====
+# Строки читаются из SQLite страницами (db.iter_export) и сразу дописываются во
+# временный файл — память не зависит от размера таблицы. Запись (и gzip) идёт в
+# пуле потоков, event loop между страницами свободен для других апдейтов.
+from __future__ import annotations
+
+import asyncio
+import csv
+import gzip
+import json
+import os
+import tempfile
+from typing import IO
+
+import db
+
+FORMATS = ("csv", "ndjson")
+
+
+def _open(path: str, fmt: str, gz: bool) -> IO[str]:
+    # BOM в CSV — чтобы Excel открыл кириллицу без танцев с кодировкой
+    encoding = "utf-8-sig" if fmt == "csv" else "utf-8"
+    if gz:
+        return gzip.open(path, "wt", encoding=encoding, newline="")
+    return open(path, "w", encoding=encoding, newline="")
+
+
+def _write(f: IO[str], fmt: str, columns: tuple[str, ...], rows: list[tuple]) -> None:
+    if fmt == "csv":
+        csv.writer(f).writerows(rows)
+    else:
+        f.writelines(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + "\n" for row in rows)
+
+
+def filename(kind: str, fmt: str, gz: bool, stamp: str) -> str:
+    return f"{kind}-{stamp}.{fmt}" + (".gz" if gz else "")
+
+
+async def export_to_file(kind: str, fmt: str = "csv", gz: bool = False, page: int = 1000) -> tuple[str, int]:
+    """Выгружает таблицу во временный файл. Возвращает (путь, строк); файл удаляет вызывающий."""
+    columns = db.EXPORTS[kind][0]
+    fd, path = tempfile.mkstemp(prefix=f"export-{kind}-")
+    os.close(fd)
+    rows_total = 0
+    try:
+        f = await asyncio.to_thread(_open, path, fmt, gz)
+        try:
+            if fmt == "csv":
+                await asyncio.to_thread(_write, f, fmt, columns, [columns])
+            async for rows in db.iter_export(kind, page):
+                await asyncio.to_thread(_write, f, fmt, columns, rows)
+                rows_total += len(rows)
+        finally:
+            await asyncio.to_thread(f.close)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path, rows_total
@@ -0,0 +1,210 @@
+"""Local stand-in for the Telegram Bot API (for load tests, no real Telegram needed).
+
+Implements just enough of https://core.telegram.org/bots/api for bot.py:
+getMe, getUpdates (long polling), sendMessage/sendDocument/editMessageText
+(return a Message), everything else -> `true`.
+
+Point the bot at it with TELEGRAM_API_URL=http://127.0.0.1:8081 (see bot.create_bot).
+Used in-process by loadtest.py; can also run standalone:
+    python fake_tg_server.py --port 8081
+and inject updates with POST /_inject (one Update JSON or a list), stats at GET /_stats.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+
+from aiohttp import ClientSession, web
+
+
+@dataclass
+class Outbound:
+    ts: float
+    method: str
+    chat_id: int
+    text: str
+
+
+# Методы, которые в настоящем API возвращают Message
+_MESSAGE_METHODS = {
+    "sendMessage", "sendDocument", "sendPhoto", "editMessageText", "forwardMessage", "copyMessage",
+}
+
+
+class FakeTelegram:
+    def __init__(self, bot_id: int = 123456) -> None:
+        self.bot_id = bot_id
+        self.app = web.Application()
+        self.app.router.add_route("*", "/bot{token}/{method}", self._api)
+        self.app.router.add_post("/_inject", self._inject)
+        self.app.router.add_get("/_stats", self._stats)
+
+        self.webhook_url: str | None = None
+        self.webhook_secret: str = ""
+        self._http: ClientSession | None = None
+
+        self._updates: list[dict] = []
+        self._updates_cond = asyncio.Condition()
+        self._next_update_id = 1
+        self._next_message_id = 1
+
+        # чаты, "заблокировавшие бота": отправка в них -> 403 Forbidden
+        self.blocked_chats: set[int] = set()
+        # chat_id -> retry_after: следующая отправка в чат получит 429 (один раз)
+        self.flood_once: dict[int, int] = {}
+
+        self.outbound: list[Outbound] = []
+        self.calls: dict[str, int] = defaultdict(int)
+        self._inbox: dict[int, asyncio.Queue[Outbound]] = {}
+        self._runner: web.AppRunner | None = None
+
+    # ---- lifecycle ----
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host=host, port=port)
+        await site.start()
+        host, port = self._runner.addresses[0][:2]
+        return f"http://{host}:{port}"
+
+    async def stop(self) -> None:
+        if self._http is not None:
+            await self._http.close()
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    # ---- updates in ----
+    async def push_update(self, update: dict) -> None:
+        """Отдать апдейт боту: через вебхук (если задан) или в очередь getUpdates."""
+        update = dict(update)
+        update["update_id"] = self._next_update_id
+        self._next_update_id += 1
+
+        if self.webhook_url:
+            if self._http is None:
+                self._http = ClientSession()
+            headers = {"X-Telegram-Bot-Api-Secret-Token": self.webhook_secret} if self.webhook_secret else {}
+            async with self._http.post(self.webhook_url, json=update, headers=headers) as resp:
+                await resp.read()
+            return
+
+        async with self._updates_cond:
+            self._updates.append(update)
+            self._updates_cond.notify_all()
+
+    # ---- messages out ----
+    def inbox(self, chat_id: int) -> asyncio.Queue[Outbound]:
+        q = self._inbox.get(chat_id)
+        if q is None:
+            q = self._inbox[chat_id] = asyncio.Queue()
+        return q
+
+    # ---- HTTP handlers ----
+    async def _api(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.calls[method] += 1
+        params: dict = dict(await request.post()) if request.can_read_body else {}
+        params.update(request.query)
+        handler = getattr(self, f"_m_{method}", None)
+        if handler is not None:
+            result = await handler(params)
+        elif method in _MESSAGE_METHODS:
+            retry_after = self.flood_once.pop(int(params.get("chat_id") or 0), None)
+            if retry_after is not None:
+                return web.json_response(
+                    {"ok": False, "error_code": 429, "description": f"Too Many Requests: retry after {retry_after}",
+                     "parameters": {"retry_after": retry_after}},
+                    status=429,
+                )
+            if int(params.get("chat_id") or 0) in self.blocked_chats:
+                return web.json_response(
+                    {"ok": False, "error_code": 403, "description": "Forbidden: bot was blocked by the user"},
+                    status=403,
+                )
+            result = self._record(method, params)
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    async def _m_getMe(self, params: dict) -> dict:
+        return {"id": self.bot_id, "is_bot": True, "first_name": "FakeBot", "username": "fake_bot"}
+
+    async def _m_getUpdates(self, params: dict) -> list[dict]:
+        offset = int(params.get("offset") or 0)
+        limit = int(params.get("limit") or 100)
+        timeout = float(params.get("timeout") or 0)
+        async with self._updates_cond:
+            if offset:
+                self._updates = [u for u in self._updates if u["update_id"] >= offset]
+            if not self._updates and timeout > 0:
+                try:
+                    await asyncio.wait_for(self._updates_cond.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+            return self._updates[:limit]
+
+    async def _m_setWebhook(self, params: dict) -> bool:
+        self.webhook_url = params.get("url") or None
+        self.webhook_secret = params.get("secret_token") or ""
+        return True
+
+    async def _m_deleteWebhook(self, params: dict) -> bool:
+        self.webhook_url = None
+        return True
+
+    def _record(self, method: str, params: dict) -> dict:
+        chat_id = int(params.get("chat_id") or 0)
+        text = str(params.get("text") or params.get("caption") or "")
+        out = Outbound(ts=time.perf_counter(), method=method, chat_id=chat_id, text=text)
+        self.outbound.append(out)
+        self.inbox(chat_id).put_nowait(out)
+
+        message_id = int(params.get("message_id") or 0) or self._next_message_id
+        self._next_message_id += 1
+        msg: dict = {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+        }
+        if method == "sendDocument":
+            msg["document"] = {"file_id": f"doc{message_id}", "file_unique_id": f"udoc{message_id}"}
+            if text:
+                msg["caption"] = text
+        else:
+            msg["text"] = text
+        return msg
+
+    async def _inject(self, request: web.Request) -> web.Response:
+        payload = await request.json()
+        for upd in payload if isinstance(payload, list) else [payload]:
+            await self.push_update(upd)
+        return web.json_response({"ok": True})
+
+    async def _stats(self, request: web.Request) -> web.Response:
+        return web.json_response({"calls": dict(self.calls), "outbound": len(self.outbound)})
+
+
+async def _serve(host: str, port: int) -> None:
+    fake = FakeTelegram()
+    url = await fake.start(host, port)
+    print(f"Fake Bot API on {url} (TELEGRAM_API_URL={url})")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await fake.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Fake Telegram Bot API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    args = parser.parse_args()
+    asyncio.run(_serve(args.host, args.port))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
-from aiogram.types import ReplyKeyboardMarkup, KeyboardButton
+from aiogram.filters.callback_data import CallbackData
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton
 
 # ===== Тексты кнопок (локализация интерфейса) =====
 # Важно: это именно тексты кнопок, а не переводы ответов бота.
@@ -75,6 +76,13 @@ BUTTONS = {
         "TJ": "➕ Ёдраскунии нав",
         "KG": "➕ Эскертме түзүү",
     },
+    "rem_stop": {
+        "RU": "🔕 Убрать повторяющиеся",
+        "EN": "🔕 Remove recurring",
+        "UZ": "🔕 Takroriylarni o‘chirish",
+        "TJ": "🔕 Такрориҳоро нест кардан",
+        "KG": "🔕 Кайталанмаларды өчүрүү",
+    },
     "daily_on": {
         "RU": "📅 Включить дайджест",
         "EN": "📅 Enable digest",
@@ -89,6 +97,13 @@ BUTTONS = {
         "TJ": "❌ Дайджестро хомӯш кардан",
         "KG": "❌ Дайджестти өчүрүү",
     },
+    "daily_time": {
+        "RU": "🕘 Время дайджеста",
+        "EN": "🕘 Digest time",
+        "UZ": "🕘 Dayjest vaqti",
+        "TJ": "🕘 Вақти дайджест",
+        "KG": "🕘 Дайджест убактысы",
+    },
 
     "share_phone": {
         "RU": "📱 Отправить номер телефона",
@@ -148,7 +163,7 @@ def get_role_kb(lang: str = "RU"):
 def get_shop_kb(lang: str = "RU"):
     labels = SHOP_LABELS.get(lang, SHOP_LABELS["RU"])
     return ReplyKeyboardMarkup(
-        keyboard=[[KeyboardButton(text=labels["courier"]), KeyboardButton(text=labels["picker"])]],
+        keyboard=[[KeyboardButton(text=label) for label in labels.values()]],
         resize_keyboard=True
     )
 
@@ -171,8 +186,9 @@ def main_menu(role, user_id, lang="RU"):
 def reminders_menu(lang: str = "RU"):
     return ReplyKeyboardMarkup(
         keyboard=[
-            [KeyboardButton(text=btn(lang, "rem_add"))],
+            [KeyboardButton(text=btn(lang, "rem_add")), KeyboardButton(text=btn(lang, "rem_stop"))],
             [KeyboardButton(text=btn(lang, "daily_on")), KeyboardButton(text=btn(lang, "daily_off"))],
+            [KeyboardButton(text=btn(lang, "daily_time"))],
             [KeyboardButton(text=btn(lang, "back")), KeyboardButton(text=btn(lang, "home"))],
         ],
         resize_keyboard=True
@@ -286,3 +302,19 @@ def phone_request_kb(lang: str) -> ReplyKeyboardMarkup:
         one_time_keyboard=True,
     )
 
+
+
+# ===== Постраничные списки админки (inline ◀️ ▶️) =====
+class PageCb(CallbackData, prefix="pg"):
+    kind: str      # users / faq (db.PAGES)
+    after: int | None = None   # следующая страница: ключи > after
+    before: int | None = None  # предыдущая: ключи < before
+
+
+def page_kb(kind: str, first_key: int, last_key: int, has_prev: bool, has_next: bool) -> InlineKeyboardMarkup | None:
+    row = []
+    if has_prev:
+        row.append(InlineKeyboardButton(text="◀️", callback_data=PageCb(kind=kind, before=first_key).pack()))
+    if has_next:
+        row.append(InlineKeyboardButton(text="▶️", callback_data=PageCb(kind=kind, after=last_key).pack()))
+    return InlineKeyboardMarkup(inline_keyboard=[row]) if row else None
@@ -0,0 +1,197 @@
+"""End-to-end load test against a local fake Bot API (fake_tg_server.py).
+
+Starts the fake API, the bot (bot.create_bot/create_dispatcher) and N virtual workers
+in one process. Every worker goes through the real flows of bot.py:
+/start -> language -> contact -> role -> shop -> knowledge menu -> search -> reminders.
+
+Run:
+    python loadtest.py --workers 200
+    python loadtest.py --workers 200 --mode webhook     # same flow through the webhook server
+    python loadtest.py --workers 200 --json loadtest.json
+
+Reports step latency percentiles (update sent -> last reply received), updates/s and
+outbound messages/s. Uses a throwaway SQLite file, never BOT_DB.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import tempfile
+import time
+from dataclasses import dataclass, field
+
+from aiohttp import web
+
+from fake_tg_server import FakeTelegram
+
+FAKE_TOKEN = "123456:LOADTEST"
+WEBHOOK_SECRET = "loadtest-secret"
+SEARCH_QUERIES = ["подключение терминала", "возвраты", "погрузка", "как начать", "правила сборки", "ссылки"]
+
+
+def _message(uid: int, text: str | None = None, **extra) -> dict:
+    msg = {
+        "message_id": 1,
+        "date": int(time.time()),
+        "chat": {"id": uid, "type": "private"},
+        "from": {"id": uid, "is_bot": False, "first_name": f"worker{uid}", "username": f"worker{uid}"},
+    }
+    if text is not None:
+        msg["text"] = text
+        if text.startswith("/"):
+            msg["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    msg.update(extra)
+    return {"message": msg}
+
+
+def worker_flow(uid: int, rnd: random.Random) -> list[tuple[str, dict, int]]:
+    """(step name, update, сколько ответов бот пришлёт на этот шаг)."""
+    contact = {"phone_number": f"+7999{uid:07d}", "first_name": f"worker{uid}", "user_id": uid}
+    return [
+        ("start", _message(uid, "/start"), 1),
+        ("language", _message(uid, "RU"), 1),
+        ("contact", _message(uid, contact=contact), 2),
+        ("role", _message(uid, "Курьер"), 2),
+        ("shop", _message(uid, "Таллинское"), 1),
+        ("knowledge", _message(uid, "📚 Обучалки / FAQ"), 1),
+        ("search_prompt", _message(uid, "🔎 Поиск"), 1),
+        ("search", _message(uid, rnd.choice(SEARCH_QUERIES)), 1),
+        ("reminders", _message(uid, "⏰ Напоминания"), 1),
+        ("reminder_add", _message(uid, "➕ Создать напоминание"), 1),
+        ("reminder_minutes", _message(uid, str(rnd.randint(5, 600))), 1),
+        ("reminder_text", _message(uid, "Проверить терминал"), 1),
+    ]
+
+
+@dataclass
+class Report:
+    latencies: dict[str, list[float]] = field(default_factory=dict)
+    updates: int = 0
+    timeouts: int = 0
+
+    def add(self, step: str, seconds: float) -> None:
+        self.latencies.setdefault(step, []).append(seconds)
+
+
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    s = sorted(values)
+    k = min(len(s) - 1, max(0, int(round(p / 100.0 * (len(s) - 1)))))
+    return s[k]
+
+
+def _summary(values: list[float]) -> dict[str, float]:
+    return {
+        "count": len(values),
+        "p50_ms": round(percentile(values, 50) * 1000, 2),
+        "p95_ms": round(percentile(values, 95) * 1000, 2),
+        "p99_ms": round(percentile(values, 99) * 1000, 2),
+    }
+
+
+async def run_worker(fake: FakeTelegram, uid: int, rnd: random.Random, report: Report, reply_timeout: float) -> None:
+    inbox = fake.inbox(uid)
+    for step, update, replies in worker_flow(uid, rnd):
+        t0 = time.perf_counter()
+        await fake.push_update(update)
+        report.updates += 1
+        try:
+            for _ in range(replies):
+                await asyncio.wait_for(inbox.get(), reply_timeout)
+        except asyncio.TimeoutError:
+            report.timeouts += 1
+            return
+        report.add(step, time.perf_counter() - t0)
+
+
+async def run(workers: int, mode: str, seed: int, reply_timeout: float) -> dict:
+    logging.getLogger("aiogram").setLevel(logging.WARNING)
+    logging.getLogger("aiohttp.access").setLevel(logging.WARNING)
+
+    import bot as botmod
+    import db
+
+    fake = FakeTelegram()
+    api_url = await fake.start()
+
+    tmpdir = tempfile.mkdtemp(prefix="loadtest-")
+    await db.init_db(os.path.join(tmpdir, "loadtest.db"))
+
+    tg = botmod.create_bot(FAKE_TOKEN, api_url=api_url)
+    dp = botmod.create_dispatcher()
+
+    runner: web.AppRunner | None = None
+    polling: asyncio.Task | None = None
+    if mode == "webhook":
+        runner = web.AppRunner(botmod.create_webhook_app(tg, dp, secret_token=WEBHOOK_SECRET), access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, host="127.0.0.1", port=0)
+        await site.start()
+        host, port = runner.addresses[0][:2]
+        fake.webhook_url = f"http://{host}:{port}{botmod.WEBHOOK_PATH}"
+        fake.webhook_secret = WEBHOOK_SECRET
+    else:
+        polling = asyncio.create_task(dp.start_polling(tg, handle_signals=False, polling_timeout=1))
+        await asyncio.sleep(0.2)
+
+    report = Report()
+    out_before = len(fake.outbound)
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        run_worker(fake, 1_000_000 + i, random.Random(seed + i), report, reply_timeout)
+        for i in range(workers)
+    ))
+    elapsed = time.perf_counter() - started
+    outbound = len(fake.outbound) - out_before
+
+    if polling is not None:
+        await dp.stop_polling()
+        await polling
+    if runner is not None:
+        await runner.cleanup()
+    else:
+        await tg.session.close()
+    await fake.stop()
+    await db.close_db()
+
+    all_latencies = [v for vals in report.latencies.values() for v in vals]
+    return {
+        "mode": mode,
+        "workers": workers,
+        "seed": seed,
+        "elapsed_s": round(elapsed, 3),
+        "updates": report.updates,
+        "timeouts": report.timeouts,
+        "updates_per_s": round(report.updates / elapsed, 1) if elapsed else 0.0,
+        "outbound_messages": outbound,
+        "outbound_per_s": round(outbound / elapsed, 1) if elapsed else 0.0,
+        "latency": _summary(all_latencies),
+        "steps": {step: _summary(vals) for step, vals in report.latencies.items()},
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=100)
+    parser.add_argument("--mode", choices=["polling", "webhook"], default="polling")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--reply-timeout", type=float, default=15.0)
+    parser.add_argument("--json", help="write report to this file")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args.workers, args.mode, args.seed, args.reply_timeout))
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    print(text)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            f.write(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+# ===== Неблокирующее логирование =====
+# Поток event loop только кладёт запись в очередь (QueueHandler); форматирование
+# (включая traceback) и запись в stderr/файл делает фоновый поток QueueListener.
+# Так медленный stdout/диск или шторм ошибок не останавливают обработку апдейтов.
+#
+# ExceptionDeduper — для on_error: одинаковые исключения (тип + место, где брошено)
+# пишутся полностью один раз за окно, остальные только считаются и выводятся
+# одной строкой "ещё N раз" по истечении окна.
+from __future__ import annotations
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+from datetime import datetime, timezone
+
+import metrics
+import tracing
+
+TEXT_FORMAT = "%(asctime)s | %(levelname)s | %(name)s | %(message)s"
+
+_listeners: list[logging.handlers.QueueListener] = []
+_dropped = 0
+
+metrics.Gauge("bot_log_records_dropped", "Log records dropped because the log queue was full").set_function(
+    lambda: _dropped
+)
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна JSON-строка на запись: ts, level, logger, msg (+ trace_id, exc)."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        rec = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        trace_id = getattr(record, "trace_id", None)
+        if trace_id:
+            rec["trace_id"] = trace_id
+        if record.exc_info:
+            rec["exc"] = self.formatException(record.exc_info)
+        if record.stack_info:
+            rec["stack"] = record.stack_info
+        return json.dumps(rec, ensure_ascii=False, default=str)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Кладёт запись как есть: traceback форматирует уже фоновый поток.
+
+    Стандартный QueueHandler.prepare() форматирует исключение в вызывающем потоке —
+    ровно то, что мы хотим убрать с event loop. Здесь подставляем только текст
+    сообщения (args могут поменяться позже) и trace_id текущего апдейта (ContextVar
+    виден только в этом потоке). Переполненная очередь — запись теряется, не ждём.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        if not hasattr(record, "trace_id"):
+            record.trace_id = tracing.current_trace_id()
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        global _dropped
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _dropped += 1
+
+
+def _start_listener(handlers: list[logging.Handler], queue_size: int) -> _QueueHandler:
+    q: queue.Queue = queue.Queue(maxsize=queue_size)
+    listener = logging.handlers.QueueListener(q, *handlers, respect_handler_level=True)
+    listener.start()
+    _listeners.append(listener)
+    return _QueueHandler(q)
+
+
+def setup_logging(level: str = "INFO", fmt: str = "text", queue_size: int = 10_000) -> bool:
+    """Корневой логгер -> очередь -> stderr в фоне. Как basicConfig: не трогает уже настроенный root."""
+    root = logging.getLogger()
+    if root.handlers:
+        return False
+    stream = logging.StreamHandler(sys.stderr)
+    stream.setFormatter(JsonFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT))
+    root.addHandler(_start_listener([stream], queue_size))
+    root.setLevel(level.upper())
+    return True
+
+
+def offload(name: str, queue_size: int = 10_000) -> None:
+    """Перенести уже навешенные обработчики логгера `name` (например, файл трасс) в фоновый поток."""
+    log = logging.getLogger(name)
+    handlers = [h for h in log.handlers if not isinstance(h, logging.handlers.QueueHandler)]
+    if not handlers:
+        return
+    log.handlers[:] = [_start_listener(handlers, queue_size)]
+
+
+def shutdown() -> None:
+    """Дописать всё из очередей (вызывается и при выходе процесса)."""
+    while _listeners:
+        _listeners.pop().stop()
+
+
+atexit.register(shutdown)
+
+
+# ----------------------------
+# Дедупликация исключений
+# ----------------------------
+def fingerprint(exc: BaseException) -> str:
+    """Тип исключения + самый глубокий кадр (файл:строка), где оно брошено."""
+    tb = exc.__traceback__
+    where = "?"
+    while tb is not None:
+        where = f"{os.path.basename(tb.tb_frame.f_code.co_filename)}:{tb.tb_lineno}"
+        tb = tb.tb_next
+    return f"{type(exc).__name__}@{where}"
+
+
+class ExceptionDeduper:
+    def __init__(self, window: float = 60.0) -> None:
+        self.window = window
+        # fingerprint -> [начало окна, сколько раз подавили]
+        self._seen: dict[str, list[float]] = {}
+
+    def first(self, exc: BaseException, now: float | None = None) -> bool:
+        """True — исключение с этим отпечатком первое в окне, его надо залогировать целиком."""
+        now = time.monotonic() if now is None else now
+        fp = fingerprint(exc)
+        entry = self._seen.get(fp)
+        if entry is None or now - entry[0] >= self.window:
+            if entry is not None and entry[1]:
+                self._report(fp, int(entry[1]))
+            self._seen[fp] = [now, 0]
+            return True
+        entry[1] += 1
+        return False
+
+    def flush_expired(self, now: float | None = None) -> None:
+        """Вывести счётчики по закрывшимся окнам (зовётся из планировщика)."""
+        now = time.monotonic() if now is None else now
+        for fp in [fp for fp, (start, _) in self._seen.items() if now - start >= self.window]:
+            _, count = self._seen.pop(fp)
+            if count:
+                self._report(fp, int(count))
+
+    def _report(self, fp: str, count: int) -> None:
+        logging.getLogger("bot").error("%s repeated %d more times in %gs", fp, count, self.window)
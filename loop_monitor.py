@@ -0,0 +1,106 @@
+# ===== Монитор задержки event loop =====
+# Heartbeat-корутина раз в `interval` засыпает и меряет, насколько позже проснулась —
+# это и есть лаг loop (сколько ждёт любая готовая к запуску задача). Последние
+# значения лежат в кольцевом буфере для перцентилей (/stats) и уходят в метрики.
+#
+# Watchdog — отдельный поток: если heartbeat не отмечался дольше `stall_threshold`,
+# значит кто-то держит loop (синхронный код в хэндлере, тяжёлый поиск и т.п.).
+# Поток снимает стек потока loop прямо во время зависания и пишет его в лог —
+# по нему видно, какой именно callback виноват. Один лог на одно зависание.
+from __future__ import annotations
+
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+
+import metrics
+
+logger = logging.getLogger("bot.loop")
+
+LOOP_LAG = metrics.Histogram(
+    "bot_event_loop_lag_seconds", "Event loop wakeup lag",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+LOOP_STALLS = metrics.Counter("bot_event_loop_stalls_total", "Loop blocked longer than the stall threshold")
+
+
+class LoopMonitor:
+    """stall_threshold должен быть заметно больше interval, иначе обычный сон heartbeat — «зависание»."""
+
+    def __init__(self, interval: float = 0.1, stall_threshold: float = 0.25, window: int = 3000) -> None:
+        self.interval = interval
+        self.stall_threshold = stall_threshold
+        self.lags: deque[float] = deque(maxlen=window)
+        self.max_lag = 0.0
+        self.stalls = 0
+        self._stalls_exported = 0
+        self._beat = time.monotonic()
+        self._beats = 0
+        self._loop_thread = 0
+        self._task: asyncio.Task | None = None
+        self._stop = threading.Event()
+        self._watchdog: threading.Thread | None = None
+
+    # ---------- heartbeat (в потоке loop) ----------
+    async def _heartbeat(self) -> None:
+        while True:
+            t0 = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - t0 - self.interval)
+            self._beat = now
+            self._beats += 1
+            self.lags.append(lag)
+            if lag > self.max_lag:
+                self.max_lag = lag
+            LOOP_LAG.observe(lag)
+            if self.stalls != self._stalls_exported:
+                # watchdog только увеличивает self.stalls, в метрики пишем из потока loop
+                LOOP_STALLS.inc(amount=self.stalls - self._stalls_exported)
+                self._stalls_exported = self.stalls
+                logger.warning("Event loop unblocked, total stall %.0f ms", lag * 1000)
+
+    # ---------- watchdog (отдельный поток) ----------
+    def _watch(self) -> None:
+        reported = -1
+        while not self._stop.wait(self.interval):
+            beats = self._beats
+            stuck = time.monotonic() - self._beat
+            if stuck < self.stall_threshold or beats == reported:
+                continue
+            reported = beats
+            frame = sys._current_frames().get(self._loop_thread)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else "<no frame>\n"
+            del frame
+            self.stalls += 1
+            logger.warning("Event loop blocked for %.0f ms, stack of the loop thread:\n%s", stuck * 1000, stack.rstrip())
+
+    # ---------- API ----------
+    def start(self) -> None:
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._stop.clear()
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def percentiles(self) -> dict[str, float]:
+        """p50/p95/p99/max лага в миллисекундах по последним замерам."""
+        s = sorted(self.lags)
+        if not s:
+            return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+
+        def pct(p: float) -> float:
+            return s[min(len(s) - 1, int(p / 100.0 * len(s)))] * 1000
+
+        return {"p50": pct(50), "p95": pct(95), "p99": pct(99), "max": self.max_lag * 1000}
@@ -0,0 +1,200 @@
+# ===== Метрики в формате Prometheus =====
+# Без внешних зависимостей: счётчики/гистограммы живут в памяти процесса и
+# обновляются только из потока event loop (без блокировок). Стоимость observe() —
+# один bisect по границам бакетов, поэтому метрики можно не выключать в проде.
+# Размеры кэшей считаются лениво — в момент запроса /metrics.
+from __future__ import annotations
+
+import time
+from bisect import bisect_left
+from typing import Any, Awaitable, Callable
+
+from aiohttp import web
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+
+# секунды: от 1 мс до 30 с
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_REGISTRY: list["_Metric"] = []
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels_str(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.help = help_text
+        self.label_names = labels
+        _REGISTRY.append(self)
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: tuple[str, ...] = ()) -> None:
+        super().__init__(name, help_text, labels)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1.0) -> None:
+        self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def value(self, *label_values: str) -> float:
+        return self._values.get(label_values, 0.0)
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        for lv, v in self._values.items():
+            lines.append(f"{self.name}{_labels_str(self.label_names, lv)} {v:g}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self, name: str, help_text: str, labels: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS
+    ) -> None:
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [counts per bucket (+Inf последним), sum]
+        self._series: dict[tuple[str, ...], list[Any]] = {}
+
+    def observe(self, value: float, *label_values: str) -> None:
+        s = self._series.get(label_values)
+        if s is None:
+            s = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+        s[0][bisect_left(self.buckets, value)] += 1
+        s[1] += value
+
+    def count(self, *label_values: str) -> int:
+        s = self._series.get(label_values)
+        return sum(s[0]) if s else 0
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        for lv, (counts, total) in self._series.items():
+            acc = 0
+            for le, c in zip(self.buckets, counts):
+                acc += c
+                le_label = 'le="%g"' % le
+                lines.append(f"{self.name}_bucket{_labels_str(self.label_names, lv, le_label)} {acc}")
+            acc += counts[-1]
+            inf_label = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_labels_str(self.label_names, lv, inf_label)} {acc}")
+            lines.append(f"{self.name}_sum{_labels_str(self.label_names, lv)} {total:.6f}")
+            lines.append(f"{self.name}_count{_labels_str(self.label_names, lv)} {acc}")
+        return lines
+
+
+class Gauge(_Metric):
+    """Значение вычисляется функцией в момент экспорта (ничего не стоит между запросами)."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labels: tuple[str, ...] = ()) -> None:
+        super().__init__(name, help_text, labels)
+        self._funcs: dict[tuple[str, ...], Callable[[], float]] = {}
+
+    def set_function(self, func: Callable[[], float], *label_values: str) -> None:
+        self._funcs[label_values] = func
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        for lv, func in self._funcs.items():
+            try:
+                v = float(func())
+            except Exception:
+                continue
+            lines.append(f"{self.name}{_labels_str(self.label_names, lv)} {v:g}")
+        return lines
+
+
+def render() -> str:
+    lines: list[str] = []
+    for m in _REGISTRY:
+        lines.extend(m.render())
+    return "\n".join(lines) + "\n"
+
+
+# ----------------------------
+# Метрики бота
+# ----------------------------
+HANDLER_LATENCY = Histogram("bot_handler_duration_seconds", "Handler execution time", ("handler",))
+HANDLER_ERRORS = Counter("bot_handler_errors_total", "Handlers that raised", ("handler",))
+DB_STATEMENT_LATENCY = Histogram("bot_db_statement_duration_seconds", "SQLite statement time", ("statement",))
+DB_COMMIT_LATENCY = Histogram("bot_db_commit_duration_seconds", "SQLite commit time")
+CACHE_SIZE = Gauge("bot_cache_size", "Items in in-memory caches", ("cache",))
+SCHEDULER_LAG = Histogram("bot_scheduler_tick_lag_seconds", "How late the scheduler woke up")
+REMINDER_LAG = Histogram("bot_reminder_delivery_lag_seconds", "Reminder delivery time minus run_at")
+API_REQUESTS = Counter("bot_api_requests_total", "Bot API calls by method and outcome", ("method", "outcome"))
+API_LATENCY = Histogram("bot_api_request_duration_seconds", "Bot API call time", ("method",))
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Inner middleware: время работы хэндлера с ключом по имени функции из bot.py."""
+
+    async def __call__(
+        self,
+        handler: Callable[[Any, dict[str, Any]], Awaitable[Any]],
+        event: Any,
+        data: dict[str, Any],
+    ) -> Any:
+        obj = data.get("handler")
+        name = getattr(getattr(obj, "callback", None), "__name__", "unknown")
+        t0 = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.inc(name)
+            raise
+        finally:
+            HANDLER_LATENCY.observe(time.perf_counter() - t0, name)
+
+
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    """Request middleware сессии бота: все вызовы Bot API (answer, send_message, ...)."""
+
+    async def __call__(self, make_request, bot, method):
+        name = getattr(method, "__api_method__", type(method).__name__)
+        t0 = time.perf_counter()
+        try:
+            response = await make_request(bot, method)
+        except Exception:
+            API_REQUESTS.inc(name, "error")
+            raise
+        finally:
+            API_LATENCY.observe(time.perf_counter() - t0, name)
+        API_REQUESTS.inc(name, "ok")
+        return response
+
+
+# ----------------------------
+# HTTP endpoint
+# ----------------------------
+async def _handle_metrics(request: web.Request) -> web.Response:
+    return web.Response(text=render(), content_type="text/plain", charset="utf-8",
+                        headers={"X-Content-Type-Options": "nosniff"})
+
+
+async def start_server(host: str, port: int) -> web.AppRunner:
+    app = web.Application()
+    app.router.add_get("/metrics", _handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host=host, port=port).start()
+    return runner
@@ -0,0 +1,134 @@
+# ===== Повторяющиеся напоминания =====
+# Правило хранится в reminders.rule в каноническом виде:
+#   daily 08:00            — каждый день
+#   weekdays 08:00         — пн–пт
+#   every 4h               — каждые N часов от предыдущего срабатывания
+#   cron 0 8,20 * * 1-5    — подмножество cron: минута, час, день недели
+#                            (день месяца и месяц — только "*")
+# Календарные правила считаются в часовом поясе пользователя; следующее время —
+# не больше 8 дней перебора по заранее отсортированным минутам суток, т.е. O(1).
+# Переход на летнее время: несуществующее время срабатывает на час позже,
+# повторяющееся — один раз.
+from __future__ import annotations
+
+import re
+from bisect import bisect_left
+from dataclasses import dataclass
+from datetime import datetime, timedelta, tzinfo
+from functools import lru_cache
+
+ALL_DAYS = frozenset(range(7))      # datetime.weekday(): 0 — понедельник
+WEEKDAYS = frozenset(range(5))
+
+_HHMM_RE = re.compile(r"^([01]?\d|2[0-3])[:.]([0-5]\d)$")
+_EVERY_RE = re.compile(r"^(\d{1,3})\s*(h|ч)$")
+
+# русские синонимы для ввода с клавиатуры
+_ALIASES = {
+    "ежедневно": "daily",
+    "будни": "weekdays",
+    "каждые": "every",
+}
+
+
+@dataclass(frozen=True)
+class Rule:
+    text: str                               # каноническая запись (для БД и показа)
+    every: int = 0                          # > 0 — интервал в секундах
+    times: tuple[int, ...] = ()             # минуты суток, по возрастанию
+    days: frozenset[int] = ALL_DAYS
+
+
+def _cron_field(field: str, lo: int, hi: int) -> list[int]:
+    out: set[int] = set()
+    for part in field.split(","):
+        step = 1
+        if "/" in part:
+            part, s = part.split("/", 1)
+            step = int(s)
+            if step <= 0:
+                raise ValueError(field)
+        if part == "*":
+            a, b = lo, hi
+        elif "-" in part:
+            a, b = (int(x) for x in part.split("-", 1))
+        else:
+            a = b = int(part)
+        if not (lo <= a <= b <= hi):
+            raise ValueError(field)
+        out.update(range(a, b + 1, step))
+    return sorted(out)
+
+
+@lru_cache(maxsize=1024)
+def parse_rule(text: str) -> Rule | None:
+    """Разбирает правило; None — не правило (например, просто число минут)."""
+    words = (text or "").strip().lower().split()
+    if not words:
+        return None
+    kind = _ALIASES.get(words[0], words[0])
+    args = words[1:]
+    try:
+        if kind in ("daily", "weekdays") and len(args) == 1:
+            m = _HHMM_RE.match(args[0])
+            if not m:
+                return None
+            hh, mm = int(m.group(1)), int(m.group(2))
+            return Rule(
+                text=f"{kind} {hh:02d}:{mm:02d}",
+                times=(hh * 60 + mm,),
+                days=ALL_DAYS if kind == "daily" else WEEKDAYS,
+            )
+        if kind == "every" and args:
+            m = _EVERY_RE.match("".join(args))
+            if not m or not 1 <= int(m.group(1)) <= 168:
+                return None
+            n = int(m.group(1))
+            return Rule(text=f"every {n}h", every=n * 3600)
+        if kind == "cron" and len(args) == 5:
+            minute, hour, dom, month, dow = args
+            if dom != "*" or month != "*":
+                return None
+            minutes = _cron_field(minute, 0, 59)
+            hours = _cron_field(hour, 0, 23)
+            # cron: 0 и 7 — воскресенье -> weekday() 6
+            days = frozenset((d - 1) % 7 for d in _cron_field(dow, 0, 7))
+            return Rule(
+                text=" ".join(["cron", *args]),
+                times=tuple(h * 60 + m for h in hours for m in minutes),
+                days=days,
+            )
+    except ValueError:
+        return None
+    return None
+
+
+def _at(day, minute_of_day: int, tz: tzinfo) -> float:
+    # fold=0: в «дыре» — смещение до перевода (на час позже), в повторе — первое наступление
+    return datetime(day.year, day.month, day.day, minute_of_day // 60, minute_of_day % 60, tzinfo=tz).timestamp()
+
+
+def next_fire(rule: Rule, prev_ts: float, now_ts: float, tz: tzinfo) -> float:
+    """Следующее срабатывание строго позже now_ts.
+
+    Интервальное правило отсчитывается от prev_ts (пропущенные, пока бот стоял,
+    не досылаются пачкой — сразу к ближайшему будущему).
+    """
+    if rule.every:
+        if prev_ts > now_ts:
+            return prev_ts
+        return prev_ts + ((now_ts - prev_ts) // rule.every + 1) * rule.every
+
+    local = datetime.fromtimestamp(now_ts, tz)
+    today = local.date()
+    # на час раньше — чтобы не проскочить время из «дыры», которое срабатывает позже
+    start = bisect_left(rule.times, local.hour * 60 + local.minute - 60)
+    for offset in range(8):
+        day = today + timedelta(days=offset)
+        if day.weekday() not in rule.days:
+            continue
+        for minute_of_day in rule.times[start if offset == 0 else 0:]:
+            ts = _at(day, minute_of_day, tz)
+            if ts > now_ts:
+                return ts
+    raise ValueError(f"rule never fires: {rule.text}")  # пустой набор дней
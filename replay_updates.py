@@ -0,0 +1,119 @@
+"""Replay recorded Telegram updates against the bot's webhook endpoint.
+
+Run the bot in webhook mode locally (no WEBHOOK_BASE_URL -> setWebhook is not called):
+    BOT_MODE=webhook WEBHOOK_SECRET=local-secret python bot.py
+
+Then POST updates to it:
+    python replay_updates.py --file updates.jsonl --secret local-secret
+    python replay_updates.py --synthetic 500 --concurrency 50 --secret local-secret
+
+`updates.jsonl` is one Update JSON object per line (e.g. dumped from getUpdates).
+Prints how fast the webhook acknowledges updates (req/s and ack latency percentiles).
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import time
+
+from aiohttp import ClientSession
+
+
+def load_updates(path: str) -> list[dict]:
+    out: list[dict] = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                out.append(json.loads(line))
+    return out
+
+
+def synthetic_updates(count: int, first_user_id: int = 100_000) -> list[dict]:
+    """/start от `count` разных пользователей — как будто все пришли одновременно."""
+    now = int(time.time())
+    out: list[dict] = []
+    for i in range(count):
+        uid = first_user_id + i
+        out.append({
+            "update_id": i + 1,
+            "message": {
+                "message_id": i + 1,
+                "date": now,
+                "chat": {"id": uid, "type": "private"},
+                "from": {"id": uid, "is_bot": False, "first_name": f"user{uid}"},
+                "text": "/start",
+                "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+            },
+        })
+    return out
+
+
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    s = sorted(values)
+    k = min(len(s) - 1, max(0, int(round(p / 100.0 * (len(s) - 1)))))
+    return s[k]
+
+
+async def replay(url: str, updates: list[dict], secret: str, concurrency: int) -> dict:
+    sem = asyncio.Semaphore(max(1, concurrency))
+    latencies: list[float] = []
+    errors = 0
+    headers = {"X-Telegram-Bot-Api-Secret-Token": secret} if secret else {}
+
+    async with ClientSession() as session:
+        async def post(update: dict) -> None:
+            nonlocal errors
+            async with sem:
+                t0 = time.perf_counter()
+                try:
+                    async with session.post(url, json=update, headers=headers) as resp:
+                        await resp.read()
+                        if resp.status != 200:
+                            errors += 1
+                except Exception:
+                    errors += 1
+                    return
+                latencies.append(time.perf_counter() - t0)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(post(u) for u in updates))
+        elapsed = time.perf_counter() - started
+
+    return {
+        "updates": len(updates),
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "updates_per_s": round(len(updates) / elapsed, 1) if elapsed else 0.0,
+        "ack_p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "ack_p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "ack_p99_ms": round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8080/webhook")
+    parser.add_argument("--secret", default="")
+    parser.add_argument("--file", help="JSONL file with recorded updates")
+    parser.add_argument("--synthetic", type=int, default=0, help="generate N /start updates instead of --file")
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.file:
+        updates = load_updates(args.file)
+    elif args.synthetic > 0:
+        updates = synthetic_updates(args.synthetic)
+    else:
+        parser.error("either --file or --synthetic is required")
+
+    report = asyncio.run(replay(args.url, updates, args.secret, args.concurrency))
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
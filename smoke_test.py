@@ -6,14 +6,25 @@ Run:
 It checks:
 - modules import
 - db schema init + defaults (creates/opens BOT_DB or bot.db)
+
+The test_* functions are also collected by pytest (`python -m pytest -q`);
+they work on throwaway SQLite files and never touch BOT_DB.
 """
 
 import os
 import asyncio
+import sqlite3
+import tempfile
 
 from dotenv import load_dotenv
 
+import time
+
 import db
+import delivery
+import recurrence
+from concurrency import UserOrderedIsolation
+from digest import DigestScheduler
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 load_dotenv(os.path.join(BASE_DIR, ".env"))
@@ -24,5 +35,579 @@ async def main():
     await db.init_db(BOT_DB)
     print("OK: db.init_db")
 
+
+# ----------------------------
+# pytest
+# ----------------------------
+OLD_SCHEMA_SQL = """
+CREATE TABLE users (user_id INTEGER PRIMARY KEY, username TEXT, role TEXT, shop TEXT, lang TEXT NOT NULL);
+CREATE TABLE banned_users (user_id INTEGER PRIMARY KEY);
+CREATE TABLE feedback (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, text TEXT NOT NULL, created_at TEXT NOT NULL);
+CREATE TABLE reminders (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, run_at_ts REAL NOT NULL, text TEXT NOT NULL);
+INSERT INTO users(user_id, username, role, shop, lang) VALUES (42, 'old', 'Курьер', 'Таллинское', 'RU');
+INSERT INTO reminders(user_id, run_at_ts, text) VALUES (42, 1.0, 'старое напоминание');
+"""
+
+
+def _user_version(path: str) -> int:
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("PRAGMA user_version").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_migrate_old_schema():
+    """БД без user_version и без users.phone доводится до SCHEMA_VERSION, данные на месте."""
+    path = os.path.join(tempfile.mkdtemp(prefix="smoke-"), "old.db")
+    conn = sqlite3.connect(path)
+    conn.executescript(OLD_SCHEMA_SQL)
+    conn.close()
+
+    async def run():
+        await db.init_db(path)
+        try:
+            assert db.users_db[42] == (42, "old", "Курьер", "Таллинское", "RU", None)
+            assert [r.text for r in db.reminders] == ["старое напоминание"]
+            assert db.FAQ_ARTICLES  # таблица faq создана, дефолты залиты
+            await db.save_user(42, "old", "Курьер", "Таллинское", "RU", phone="+79990000000")
+            assert db.users_db[42][5] == "+79990000000"
+        finally:
+            await db.close_db()
+
+    asyncio.run(run())
+    assert _user_version(path) == db.SCHEMA_VERSION
+    conn = sqlite3.connect(path)
+    cols = [r[1] for r in conn.execute("PRAGMA table_info(users)")]
+    mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+    conn.close()
+    assert "phone" in cols
+    assert mode == "wal"
+
+
+def test_migrate_is_noop_when_current():
+    """Повторный старт: миграции не выполняются, версия не меняется."""
+    path = os.path.join(tempfile.mkdtemp(prefix="smoke-"), "new.db")
+
+    async def run():
+        await db.init_db(path)
+        await db.close_db()
+        await db.init_db(path)
+        await db.close_db()
+
+    asyncio.run(run())
+    assert _user_version(path) == db.SCHEMA_VERSION
+
+
+def _clock_at(now: list[float], tz):
+    from datetime import datetime
+
+    def at(month: int, day: int, hour: int, minute: int = 0) -> None:
+        now[0] = datetime(2024, month, day, hour, minute, tzinfo=tz).timestamp()
+    return at
+
+
+def test_digest_ledger_catchup():
+    """Дайджест с симулированными часами: окно, досылка, рестарт без дублей, лимит досылки."""
+    from zoneinfo import ZoneInfo
+
+    tz = ZoneInfo("Europe/Oslo")
+    path = os.path.join(tempfile.mkdtemp(prefix="smoke-"), "digest.db")
+    now = [0.0]
+    at = _clock_at(now, tz)
+    sent: list[int] = []
+
+    async def send_many(items):
+        ids = [uid for uid, _ in items]
+        sent.extend(ids)
+        return [uid for uid in ids if uid != 3]  # 3 — временно недоступен
+
+    def scheduler() -> DigestScheduler:
+        return DigestScheduler(9, 0, tz, catchup_hours=6, batch=2, keep_days=1, retry_minutes=5, clock=lambda: now[0])
+
+    async def run():
+        await db.init_db(path)
+        try:
+            for uid in (1, 2, 3):
+                await db.enable_daily_digest(uid, True)
+            digest = scheduler()
+
+            at(3, 4, 8, 59)
+            assert await digest.tick(send_many) == 0 and not sent
+            at(3, 4, 9, 0)
+            assert await digest.tick(send_many) == 2
+            assert sorted(sent) == [1, 2, 3]
+            sent.clear()
+            # недоставленному — повтор через retry_minutes, доставленным — нет
+            at(3, 4, 9, 2)
+            assert await digest.tick(send_many) == 0 and not sent
+            at(3, 4, 9, 5)
+            assert await digest.tick(send_many) == 0 and sent == [3]
+            sent.clear()
+
+            # рестарт посреди дня: ledger из БД, новый подписчик получает досылку
+            await db.close_db()
+            await db.init_db(path)
+            await db.enable_daily_digest(4, True)
+            at(3, 4, 14)
+            digest = scheduler()
+            assert await digest.tick(send_many) == 1 and sorted(sent) == [3, 4]
+            sent.clear()
+
+            # пропущенное окно: досылка в пределах catchup_hours, дальше — нет
+            at(3, 5, 16)
+            digest = scheduler()
+            assert await digest.tick(send_many) == 0 and not sent
+            at(3, 6, 14, 30)
+            assert await digest.tick(send_many) == 3
+            assert await db.digest_delivered_since("2024-03-01") == {
+                ("2024-03-06", 1), ("2024-03-06", 2), ("2024-03-06", 4),
+            }  # старше keep_days — удалено
+        finally:
+            await db.close_db()
+
+    asyncio.run(run())
+
+
+def test_digest_per_user_time_and_dst():
+    """Своё время/пояс: срабатывает только своя UTC-минута; переходы на летнее/зимнее время."""
+    from zoneinfo import ZoneInfo
+
+    oslo = ZoneInfo("Europe/Oslo")
+    path = os.path.join(tempfile.mkdtemp(prefix="smoke-"), "digest-tz.db")
+    now = [0.0]
+    at = _clock_at(now, ZoneInfo("UTC"))
+    sent: list[int] = []
+
+    async def send_many(items):
+        ids = [uid for uid, _ in items]
+        sent.extend(ids)
+        return ids
+
+    async def run():
+        await db.init_db(path)
+        try:
+            await db.enable_daily_digest(1, True)                           # 09:00 Oslo по умолчанию
+            await db.set_digest_prefs(2, "07:00", "Asia/Tashkent")          # 02:00 UTC, без перевода часов
+            await db.set_digest_prefs(3, "02:30", None)                     # 02:30 Oslo — в «дыре» 31 марта
+            digest = DigestScheduler(9, 0, oslo, catchup_hours=1, clock=lambda: now[0])
+
+            async def fired(month: int, day: int, hour: int, minute: int = 0) -> list[int]:
+                at(month, day, hour, minute)
+                await digest.tick(send_many)
+                out = sorted(sent)
+                sent.clear()
+                return out
+
+            at(3, 30, 0)
+            await digest.load()
+            assert await fired(3, 30, 1, 29) == []           # чужие корзины не трогаем
+            assert await fired(3, 30, 1, 30) == [3]          # 02:30 CET = 01:30 UTC
+            assert await fired(3, 30, 2, 0) == [2]
+            assert await fired(3, 30, 8, 0) == [1]           # 09:00 CET
+            # 31 марта 02:00 CET -> 03:00 CEST: 02:30 нет, срабатывает в 03:30 CEST = 01:30 UTC
+            assert await fired(3, 31, 1, 30) == [3]
+            assert await fired(3, 31, 7, 0) == [1]           # 09:00 CEST
+            # 27 октября 02:30 бывает дважды — дайджест один раз
+            at(10, 26, 12)
+            await digest.load()
+            assert await fired(10, 27, 0, 30) == [3]          # первое 02:30 (CEST)
+            assert await fired(10, 27, 1, 30) == []           # второе 02:30 (CET)
+            assert await fired(10, 27, 2, 0) == [2]
+            assert await fired(10, 27, 8, 0) == [1]           # 09:00 CET
+            assert digest.pending() == 3
+
+            # отписка убирает из индекса, смена пояса — переносит
+            await db.enable_daily_digest(1, False)
+            digest.unschedule(1)
+            await db.set_digest_prefs(2, "07:00", "Europe/Oslo")
+            await digest.schedule(2)
+            assert await fired(10, 28, 6, 0) == [2]
+            assert await fired(10, 28, 8, 0) == []
+        finally:
+            await db.close_db()
+
+    asyncio.run(run())
+
+
+def test_recurrence_next_fire():
+    """Правила повторения: следующее срабатывание по фиктивным часам, включая переводы часов."""
+    from datetime import datetime
+    from zoneinfo import ZoneInfo
+
+    oslo = ZoneInfo("Europe/Oslo")
+
+    def ts(month, day, hour, minute=0, tz=oslo):
+        return datetime(2024, month, day, hour, minute, tzinfo=tz).timestamp()
+
+    def local(t):
+        return datetime.fromtimestamp(t, oslo).strftime("%a %d.%m %H:%M")
+
+    assert recurrence.parse_rule("15") is None
+    assert recurrence.parse_rule("cron 0 8 1 * *") is None           # день месяца не поддерживается
+    assert recurrence.parse_rule("ежедневно 8:05").text == "daily 08:05"
+    assert recurrence.parse_rule("каждые 4 ч").text == "every 4h"
+
+    daily = recurrence.parse_rule("daily 08:00")
+    assert local(recurrence.next_fire(daily, 0, ts(3, 4, 7, 59), oslo)) == "Mon 04.03 08:00"
+    assert local(recurrence.next_fire(daily, 0, ts(3, 4, 8, 0), oslo)) == "Tue 05.03 08:00"
+
+    weekdays = recurrence.parse_rule("weekdays 08:00")
+    assert local(recurrence.next_fire(weekdays, 0, ts(3, 8, 9), oslo)) == "Mon 11.03 08:00"  # пт -> пн
+
+    every = recurrence.parse_rule("every 4h")
+    prev = ts(3, 4, 8)
+    assert recurrence.next_fire(every, prev, prev, oslo) == prev + 4 * 3600
+    # бот стоял 10 часов: сразу к ближайшему будущему, без пачки пропущенных
+    assert recurrence.next_fire(every, prev, prev + 10 * 3600, oslo) == prev + 12 * 3600
+
+    cron = recurrence.parse_rule("cron 30 8,20 * * 0,6")              # выходные, 08:30 и 20:30
+    assert local(recurrence.next_fire(cron, 0, ts(3, 8, 12), oslo)) == "Sat 09.03 08:30"
+    assert local(recurrence.next_fire(cron, 0, ts(3, 9, 8, 30), oslo)) == "Sat 09.03 20:30"
+    assert local(recurrence.next_fire(cron, 0, ts(3, 10, 21), oslo)) == "Sat 16.03 08:30"
+
+    # 31 марта 02:30 не существует -> 03:30 CEST; 27 октября 02:30 дважды -> один раз
+    night = recurrence.parse_rule("daily 02:30")
+    assert local(recurrence.next_fire(night, 0, ts(3, 31, 1), oslo)) == "Sun 31.03 03:30"
+    first = recurrence.next_fire(night, 0, ts(10, 27, 1), oslo)
+    assert local(first) == "Sun 27.10 02:30"
+    assert local(recurrence.next_fire(night, first, first, oslo)) == "Mon 28.10 02:30"
+
+
+def test_recurring_reminder_reschedules():
+    """Повторяющееся напоминание после срабатывания переносится, разовое — удаляется."""
+    path = os.path.join(tempfile.mkdtemp(prefix="smoke-"), "rem.db")
+    t0 = 1_700_000_000.0
+
+    async def run():
+        await db.init_db(path, reminder_window_sec=6 * 3600)
+        try:
+            await db.add_reminder(1, t0 + 60, "once")
+            await db.add_reminder(2, t0 + 60, "shift", rule="every 2h", tz="UTC")
+            assert db.get_stats()["reminders"] == 2
+
+            due = await db.pop_due_reminders(t0 + 61)
+            assert sorted(r.text for r in due) == ["once", "shift"]
+            assert [(r.text, r.run_at_ts) for r in db.reminders] == [("shift", t0 + 60 + 2 * 3600)]
+            assert db.get_stats()["reminders"] == 1
+
+            assert await db.pop_due_reminders(t0 + 3600) == []
+            due = await db.pop_due_reminders(t0 + 60 + 2 * 3600)
+            assert [r.text for r in due] == ["shift"]
+
+            # после рестарта правило и следующее время берутся из БД
+            await db.close_db()
+            await db.init_db(path, reminder_window_sec=6 * 3600)
+            await db.refill_reminders(t0 + 4 * 3600)
+            assert [(r.rule, r.run_at_ts) for r in db.reminders] == [("every 2h", t0 + 60 + 4 * 3600)]
+            assert await db.delete_recurring_reminders(2) == 1
+            assert db.reminders == [] and db.get_stats()["reminders"] == 0
+        finally:
+            await db.close_db()
+
+    asyncio.run(run())
+
+
+
+def test_reminder_added_during_refill():
+    """Напоминание, добавленное, пока refill_reminders сдвигает окно, попадает в кэш ровно один раз."""
+    path = os.path.join(tempfile.mkdtemp(prefix="smoke-"), "window.db")
+    t0 = 1_700_000_000.0
+
+    async def run():
+        await db.init_db(path, reminder_window_sec=600)
+        try:
+            # разные точки, где add_reminder вклинивается в refill (до/после его SELECT)
+            for i in range(6):
+                now = t0 + i * 10_000
+                db._reminder_horizon = now + 100
+                refill = asyncio.create_task(db.refill_reminders(now))
+                for _ in range(i):
+                    await asyncio.sleep(0)
+                await db.add_reminder(1, now + 300, f"r{i}")
+                await refill
+                assert db._reminder_horizon == now + 600
+                assert [r.text for r in db.reminders].count(f"r{i}") == 1, i
+        finally:
+            await db.close_db()
+
+    asyncio.run(run())
+
+
+def test_bulk_user_ops():
+    """/ban_many, /unban_many, /edit_users: одна транзакция, кэш = БД, ошибка — откат всего."""
+    path = os.path.join(tempfile.mkdtemp(prefix="smoke-"), "bulk.db")
+
+    async def db_row(uid):
+        row = await db._fetchone(db._db, "SELECT user_id, username, role, shop, lang, phone FROM users WHERE user_id=?", (uid,))
+        return tuple(row)
+
+    async def run():
+        await db.init_db(path)
+        try:
+            for uid in range(1, 6):
+                await db.save_user(uid, f"u{uid}", "Курьер", "Таллинское", "RU", f"+7999000000{uid}")
+
+            assert await db.ban_users([1, 2, 3]) == 3
+            assert await db.ban_users([1, 2]) == 0
+            assert await db.unban_users([2, 99]) == 1
+            assert db.banned_users == {1, 3}
+
+            assert await db.update_users({1: {"lang": "UZ", "phone": "8 999 111 22 33"}, 2: {"role": "Сборщик"}, 99: {"lang": "EN"}}) == (2, [99])
+            assert [u[0] for u in db.find_users("7999111")] == [1]
+            assert db.select_users(role="Сборщик") == {2}
+            for uid in (1, 2):
+                assert db.users_db[uid] == await db_row(uid)
+
+            # регистрация того же пользователя, пока ждём COMMIT, не откатывается в кэше
+            reg = asyncio.create_task(db.save_user(3, "renamed", "Курьер", "Таллинское", "RU"))
+            await asyncio.sleep(0)
+            await db.update_users({3: {"shop": "Шереметьевская"}})
+            await reg
+            assert db.users_db[3] == await db_row(3) == (3, "renamed", "Курьер", "Шереметьевская", "RU", "+79990000003")
+
+            # ошибка посреди executemany: ни БД, ни кэши не меняются
+            await db._exec("CREATE TEMP TRIGGER fail_5 BEFORE UPDATE ON users WHEN NEW.user_id=5 BEGIN SELECT RAISE(ABORT, 'boom'); END")
+            await db._exec("CREATE TEMP TRIGGER fail_ban_5 BEFORE INSERT ON banned_users WHEN NEW.user_id=5 BEGIN SELECT RAISE(ABORT, 'boom'); END")
+            before = dict(db.users_db)
+            for op in (db.update_users({4: {"lang": "EN"}, 5: {"lang": "EN"}}), db.ban_users([4, 5])):
+                try:
+                    await op
+                except Exception:
+                    pass
+                else:
+                    raise AssertionError("expected the trigger to abort")
+            assert db.users_db == before and db.banned_users == {1, 3}
+            assert (await db_row(4))[4] == "RU"
+            assert await db._fetchall(db._db, "SELECT user_id FROM banned_users WHERE user_id IN (4, 5)") == []
+            assert db.select_users(lang="EN") == set()
+        finally:
+            await db.close_db()
+
+    asyncio.run(run())
+
+
+def test_list_page_keyset():
+    """Keyset-страницы: вперёд/назад, флаги границ, пустая страница за последним ключом."""
+    path = os.path.join(tempfile.mkdtemp(prefix="smoke-"), "pages.db")
+
+    async def run():
+        await db.init_db(path)
+        try:
+            for uid in (10, 20, 30, 40, 50):
+                await db.save_user(uid, f"u{uid}", "Курьер", "Таллинское", "RU")
+
+            def ids(rows):
+                return [r[0] for r in rows]
+
+            rows, has_prev, has_next = await db.list_page("users", limit=2)
+            assert (ids(rows), has_prev, has_next) == ([10, 20], False, True)
+            rows, has_prev, has_next = await db.list_page("users", after=20, limit=2)
+            assert (ids(rows), has_prev, has_next) == ([30, 40], True, True)
+            rows, has_prev, has_next = await db.list_page("users", after=40, limit=2)
+            assert (ids(rows), has_prev, has_next) == ([50], True, False)
+            # ровно limit строк до конца — следующей страницы нет
+            rows, has_prev, has_next = await db.list_page("users", after=30, limit=2)
+            assert (ids(rows), has_prev, has_next) == ([40, 50], True, False)
+            rows, has_prev, has_next = await db.list_page("users", after=50, limit=2)
+            assert (rows, has_prev, has_next) == ([], True, False)
+
+            rows, has_prev, has_next = await db.list_page("users", before=50, limit=2)
+            assert (ids(rows), has_prev, has_next) == ([30, 40], True, True)
+            rows, has_prev, has_next = await db.list_page("users", before=30, limit=2)
+            assert (ids(rows), has_prev, has_next) == ([10, 20], False, True)
+            rows, has_prev, has_next = await db.list_page("users", before=20, limit=2)
+            assert (ids(rows), has_prev, has_next) == ([10], False, True)
+
+            assert rows[0] == (10, "u10", "Курьер", "Таллинское", "RU", None)
+            rows, has_prev, has_next = await db.list_page("faq", limit=100)
+            assert ids(rows) == sorted(ids(rows)) and len(rows) == len(db.FAQ_ARTICLES)
+            assert (has_prev, has_next) == (False, False)
+        finally:
+            await db.close_db()
+
+    asyncio.run(run())
+
+
+def test_find_users_prefix():
+    """/find: префикс телефона в любом формате, username без учёта регистра и '@', точный id."""
+    path = os.path.join(tempfile.mkdtemp(prefix="smoke-"), "find.db")
+
+    async def run():
+        await db.init_db(path)
+        try:
+            await db.save_user(1, "Alice", "Курьер", "Таллинское", "RU", "+7 (999) 123-45-67")
+            await db.save_user(2, "alina", "Курьер", "Таллинское", "RU", "89991230000")
+            await db.save_user(3, "Bob", "Курьер", "Таллинское", "RU", "+998 90 000 00 00")
+            await db.save_user(79991, "carl", "Курьер", "Таллинское", "RU")
+
+            def ids(query, limit=20):
+                return sorted(u[0] for u in db.find_users(query, limit))
+
+            for q in ("8999123", "+7999123", "7 999 123", "+7 (999) 123"):
+                assert ids(q) == [1, 2], q
+            assert ids("89991234567") == [1]
+            assert ids("+998") == [3]
+            assert ids("8999") == [1, 2]   # '8...' без '+' — российский номер
+            assert ids("+8999") == []      # с '+' — как есть
+            assert ids("@ALI") == ids("ali") == ids("Ali") == [1, 2]
+            assert ids("@Bob") == [3]
+            assert ids("alice") == [1]
+            assert ids("79991") == [1, 2, 79991]  # точный id + префикс телефона
+            assert ids("zed") == [] and ids("") == [] and ids("@") == []
+            assert len(db.find_users("ali", limit=1)) == 1
+
+            # ключи следуют за изменениями
+            await db.save_user(2, "Zed", "Курьер", "Таллинское", "RU", "+79990000000")
+            assert ids("ali") == [1] and ids("@zed") == [2]
+            assert ids("8999123") == [1]
+
+            # после рестарта ключи читаются из индексов SQLite
+            await db.close_db(snapshot=False)
+            await db.init_db(path)
+            assert ids("@ALI") == [1] and ids("8999") == [1, 2]
+        finally:
+            await db.close_db()
+
+    asyncio.run(run())
+
+
+def test_user_ordered_isolation():
+    """Апдейты одного пользователя — строго по очереди, разные — параллельно до concurrency."""
+    from aiogram.fsm.storage.base import StorageKey
+
+    async def run():
+        iso = UserOrderedIsolation(concurrency=2)
+        log: list[tuple[int, int]] = []
+        running = {"now": 0, "max": 0}
+
+        async def handle(user: int, n: int, delay: float) -> None:
+            async with iso.lock(StorageKey(bot_id=1, chat_id=user, user_id=user)):
+                running["now"] += 1
+                running["max"] = max(running["max"], running["now"])
+                log.append((user, n))
+                await asyncio.sleep(delay)
+                running["now"] -= 1
+
+        # у первого апдейта пользователя сон самый длинный: без очереди следующие обогнали бы его
+        tasks = [
+            asyncio.create_task(handle(user, n, 0.03 / (n + 1)))
+            for n in range(4)
+            for user in (1, 2, 3)
+        ]
+        await asyncio.sleep(0)
+        assert iso.active_lanes == 3
+        await asyncio.gather(*tasks)
+
+        for user in (1, 2, 3):
+            assert [n for u, n in log if u == user] == [0, 1, 2, 3]
+        assert running["max"] == 2
+        assert iso.active_lanes == 0
+
+    asyncio.run(run())
+
+
+def test_registration_keyboards():
+    """Клавиатуры роли и точки строятся для всех языков; каждая кнопка распознаётся хэндлером."""
+    import bot
+    from keyboards import ROLE_LABELS, SHOP_LABELS, get_role_kb, get_shop_kb
+
+    def texts(kb):
+        return [b.text for row in kb.keyboard for b in row]
+
+    for lang in bot.LANGS + ("XX",):
+        shops = texts(get_shop_kb(lang))
+        assert shops == list(SHOP_LABELS.get(lang, SHOP_LABELS["RU"]).values()), lang
+        assert {bot._SHOP_TEXT_TO_RU[t] for t in shops} == set(SHOP_LABELS["RU"]), lang
+        roles = texts(get_role_kb(lang))
+        assert [bot._ROLE_TEXT_TO_RU[t] for t in roles] == ["Курьер", "Сборщик"], lang
+    assert set(ROLE_LABELS) == set(SHOP_LABELS) == set(bot.LANGS)
+
+
+def _fake_send(log: list, name, fail: list | None = None):
+    """Вместо bot.send_message: пишет (имя, время) в log; пока fail не пуст — бросает fail.pop()."""
+    async def call():
+        log.append((name, time.monotonic()))
+        if fail:
+            raise fail.pop()
+        return name
+    return call
+
+
+def test_outbound_dispatcher_priority_and_per_chat():
+    """Очередь исходящих: сначала напоминания, потом дайджест, потом рассылка; лимит на чат."""
+    async def run():
+        d = delivery.OutboundDispatcher(None, rate=1000, burst=1000, per_chat_interval=0.2, concurrency=1)
+        log: list = []
+        futures = [
+            d.submit(1, _fake_send(log, "broadcast-1"), delivery.BROADCAST),
+            d.submit(1, _fake_send(log, "broadcast-1b"), delivery.BROADCAST),
+            d.submit(2, _fake_send(log, "broadcast-2"), delivery.BROADCAST),
+            d.submit(3, _fake_send(log, "digest"), delivery.DIGEST),
+            d.submit(4, _fake_send(log, "reminder"), delivery.REMINDER),
+        ]
+        assert d.depth(delivery.BROADCAST) == 3
+        d.start()
+        try:
+            assert await asyncio.wait_for(asyncio.gather(*futures), 5) == [
+                "broadcast-1", "broadcast-1b", "broadcast-2", "digest", "reminder"
+            ]
+        finally:
+            await d.stop()
+        order = [name for name, _ in log]
+        # второе сообщение в чат 1 ждёт per_chat_interval и не держит очередь: чат 2 уходит раньше
+        assert order == ["reminder", "digest", "broadcast-1", "broadcast-2", "broadcast-1b"]
+        sent = dict(log)
+        assert sent["broadcast-1b"] - sent["broadcast-1"] >= 0.2
+        assert d.depth(delivery.BROADCAST) == 0
+
+        # stop() дожидается уже начатой отправки, ещё не выбранные job отменяет
+        async def slow():
+            await asyncio.sleep(0.1)
+            return "slow"
+        d = delivery.OutboundDispatcher(None, rate=1000, burst=1000, per_chat_interval=0, concurrency=1)
+        started, queued = d.submit(1, slow), d.submit(2, _fake_send(log, "queued"))
+        d.start()
+        await asyncio.sleep(0.02)
+        await d.stop()
+        assert started.result() == "slow" and queued.cancelled()
+
+    asyncio.run(run())
+
+
+def test_outbound_dispatcher_retry_after():
+    """429 ставит на паузу всю очередь; после max_retries повторов job падает с RetryAfter."""
+    from aiogram.exceptions import TelegramRetryAfter
+    from aiogram.methods import SendMessage
+
+    def flood():
+        return TelegramRetryAfter(SendMessage(chat_id=1, text="x"), "Too Many Requests", retry_after=1)
+
+    async def run():
+        d = delivery.OutboundDispatcher(None, rate=1000, burst=1000, per_chat_interval=0, concurrency=1, max_retries=1)
+        log: list = []
+        once = d.submit(1, _fake_send(log, "once", [flood()]), delivery.REMINDER)
+        always = d.submit(2, _fake_send(log, "always", [flood(), flood()]), delivery.DIGEST)
+        later = d.submit(3, _fake_send(log, "later"), delivery.BROADCAST)
+        d.start()
+        try:
+            assert await asyncio.wait_for(once, 5) == "once"
+            try:
+                await asyncio.wait_for(always, 5)
+            except TelegramRetryAfter:
+                pass
+            else:
+                raise AssertionError("job must be dropped after max_retries")
+            assert await asyncio.wait_for(later, 5) == "later"
+        finally:
+            await d.stop()
+        names = [name for name, _ in log]
+        assert names.count("once") == 2 and names.count("always") == 2 and names.count("later") == 1
+        # после первого 429 никто не отправляется раньше, чем через retry_after
+        first_429 = log[0][1]
+        assert all(ts - first_429 >= 1.0 for _, ts in log[1:])
+
+    asyncio.run(run())
+
 if __name__ == "__main__":
     asyncio.run(main())
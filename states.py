@@ -23,6 +23,10 @@ class ReminderState(StatesGroup):
     minutes = State()
     text = State()
 
+# ===== Время дайджеста =====
+class DigestTimeState(StatesGroup):
+    time = State()
+
 
 # ===== Управление обучалками (админ) =====
 class TrainingAdminState(StatesGroup):
@@ -0,0 +1,175 @@
+# ===== Трассировка апдейтов =====
+# Каждый апдейт получает trace_id; span'ы открываются по ходу обработки:
+#   update (весь feed_update: middleware, очередь пользователя, фильтры, хэндлер)
+#   ├─ dispatch          — от начала апдейта до входа в хэндлер (middleware + фильтры)
+#   └─ handler           — сам хэндлер из bot.py
+#      ├─ sqlite / search_faq / ...  — вызовы db.py
+#      └─ tg.sendMessage — вызовы Bot API
+# Текущий span хранится в ContextVar, поэтому спаны из db.py и сессии бота сами
+# цепляются к нужному апдейту. Готовая трасса пишется в ротируемый JSONL-файл
+# (одна строка на span). Если TRACE_FILE не задан — span() ничего не делает.
+from __future__ import annotations
+
+import json
+import logging
+import logging.handlers
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Iterator
+
+from aiogram import BaseMiddleware, Bot, Dispatcher
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.types import Update
+
+_exporter = logging.getLogger("bot.trace")
+_exporter.propagate = False
+_enabled = False
+_slow_s = 0.0
+
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name", "start", "end", "attrs")
+
+    def __init__(self, trace: "Trace", name: str, parent_id: str | None, attrs: dict[str, Any]) -> None:
+        self.trace = trace
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.name = name
+        self.start = time.perf_counter()
+        self.end = 0.0
+        self.attrs = attrs
+
+
+class Trace:
+    __slots__ = ("trace_id", "wall_start", "perf_start", "spans")
+
+    def __init__(self) -> None:
+        self.trace_id = uuid.uuid4().hex
+        self.wall_start = time.time()
+        self.perf_start = time.perf_counter()
+        self.spans: list[Span] = []
+
+    def export(self) -> None:
+        for s in self.spans:
+            rec = {
+                "trace_id": self.trace_id,
+                "span_id": s.span_id,
+                "parent_id": s.parent_id,
+                "name": s.name,
+                "ts": round(self.wall_start + (s.start - self.perf_start), 6),
+                "dur_ms": round((s.end - s.start) * 1000, 3),
+            }
+            if s.attrs:
+                rec.update(s.attrs)
+            _exporter.info(json.dumps(rec, ensure_ascii=False, default=str))
+
+
+_current: ContextVar[Span | None] = ContextVar("trace_span", default=None)
+
+
+def configure(path: str, max_bytes: int = 10 * 1024 * 1024, backups: int = 5, slow_ms: float = 0.0) -> None:
+    """Включает экспорт трасс в `path`. slow_ms > 0 — писать только апдейты медленнее порога."""
+    global _enabled, _slow_s
+    handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    _exporter.handlers[:] = [handler]
+    _exporter.setLevel(logging.INFO)
+    _slow_s = max(0.0, slow_ms) / 1000.0
+    _enabled = True
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def current_trace_id() -> str | None:
+    cur = _current.get()
+    return cur.trace.trace_id if cur is not None else None
+
+
+@contextmanager
+def start_trace(name: str, **attrs: Any) -> Iterator[Span | None]:
+    """Корневой span. Трасса экспортируется при выходе (с учётом порога slow_ms)."""
+    if not _enabled:
+        yield None
+        return
+    trace = Trace()
+    root = Span(trace, name, None, attrs)
+    token = _current.set(root)
+    try:
+        yield root
+    finally:
+        _current.reset(token)
+        root.end = time.perf_counter()
+        trace.spans.append(root)
+        if root.end - root.start >= _slow_s:
+            trace.export()
+
+
+@contextmanager
+def span(name: str, **attrs: Any) -> Iterator[Span | None]:
+    parent = _current.get()
+    if parent is None:
+        yield None
+        return
+    s = Span(parent.trace, name, parent.span_id, attrs)
+    token = _current.set(s)
+    try:
+        yield s
+    finally:
+        _current.reset(token)
+        s.end = time.perf_counter()
+        parent.trace.spans.append(s)
+
+
+def add_span(name: str, start: float, end: float, **attrs: Any) -> None:
+    """Задним числом добавить span (perf_counter-время) к текущему."""
+    parent = _current.get()
+    if parent is None:
+        return
+    s = Span(parent.trace, name, parent.span_id, attrs)
+    s.start, s.end = start, end
+    parent.trace.spans.append(s)
+
+
+# ----------------------------
+# aiogram integration
+# ----------------------------
+class TracedDispatcher(Dispatcher):
+    """feed_update в корневом span'е — в трассу попадают и outer middleware (очередь пользователя, FSM)."""
+
+    async def feed_update(self, bot: Bot, update: Update, **kwargs: Any) -> Any:
+        if not _enabled:
+            return await super().feed_update(bot, update, **kwargs)
+        with start_trace("update", update_id=update.update_id, event=update.event_type):
+            return await super().feed_update(bot, update, **kwargs)
+
+
+class HandlerTraceMiddleware(BaseMiddleware):
+    """Inner middleware: span 'dispatch' (до хэндлера) + span 'handler'."""
+
+    async def __call__(
+        self,
+        handler: Callable[[Any, dict[str, Any]], Awaitable[Any]],
+        event: Any,
+        data: dict[str, Any],
+    ) -> Any:
+        cur = _current.get()
+        if cur is None:
+            return await handler(event, data)
+        add_span("dispatch", cur.start, time.perf_counter())
+        user = data.get("event_from_user")
+        obj = data.get("handler")
+        name = getattr(getattr(obj, "callback", None), "__name__", "unknown")
+        with span("handler", handler=name, user_id=getattr(user, "id", None)):
+            return await handler(event, data)
+
+
+class ApiTraceMiddleware(BaseRequestMiddleware):
+    async def __call__(self, make_request, bot, method):
+        if _current.get() is None:
+            return await make_request(bot, method)
+        with span("tg." + getattr(method, "__api_method__", type(method).__name__)):
+            return await make_request(bot, method)
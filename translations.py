@@ -1,5 +1,8 @@
 from __future__ import annotations
 
+import re
+from typing import Iterable
+
 from db import get_user
 
 # ===== Переводы =====
@@ -310,11 +313,18 @@ TRANSLATIONS: dict[str, dict[str, str]] = {
         "RU": "👑 Admin:\n\n"
               "/stats\n"
               "/users\n"
+              "/export_users [csv|ndjson] [gz]\n"
+              "/export_feedback [csv|ndjson] [gz]\n"
+              "/find phone|username\n"
               "/edit_user <id> <role/shop/lang/phone> <value>\n"
-              "/broadcast <text>\n"
+              "/edit_users [field] [value] [ids | shop=… role=… lang=…] | CSV\n"
+              "/broadcast [shop=… role=… lang=…] текст\n"
               "/cleanup\n"
               "/ban <user_id>\n"
               "/unban <user_id>\n"
+              "/ban_many [ids | shop=… role=… lang=…] | CSV\n"
+              "/unban_many [ids | shop=… role=… lang=…] | CSV\n"
+              "/profile [seconds]\n"
               "/set_digest <text>\n\n"
               "Материалы (Обучалки/FAQ):\n"
               "/faq_list\n"
@@ -324,11 +334,18 @@ TRANSLATIONS: dict[str, dict[str, str]] = {
         "EN": "👑 Admin:\n\n"
               "/stats\n"
               "/users\n"
+              "/export_users [csv|ndjson] [gz]\n"
+              "/export_feedback [csv|ndjson] [gz]\n"
+              "/find phone|username\n"
               "/edit_user <id> <role/shop/lang/phone> <value>\n"
-              "/broadcast <text>\n"
+              "/edit_users [field] [value] [ids | shop=… role=… lang=…] | CSV\n"
+              "/broadcast [shop=… role=… lang=…] text\n"
               "/cleanup\n"
               "/ban <user_id>\n"
               "/unban <user_id>\n"
+              "/ban_many [ids | shop=… role=… lang=…] | CSV\n"
+              "/unban_many [ids | shop=… role=… lang=…] | CSV\n"
+              "/profile [seconds]\n"
               "/set_digest <text>\n\n"
               "Materials (Training/FAQ):\n"
               "/faq_list\n"
@@ -338,11 +355,18 @@ TRANSLATIONS: dict[str, dict[str, str]] = {
         "UZ": "👑 Admin:\n\n"
               "/stats\n"
               "/users\n"
+              "/export_users [csv|ndjson] [gz]\n"
+              "/export_feedback [csv|ndjson] [gz]\n"
+              "/find phone|username\n"
               "/edit_user <id> <role/shop/lang/phone> <value>\n"
-              "/broadcast <text>\n"
+              "/edit_users [field] [value] [ids | shop=… role=… lang=…] | CSV\n"
+              "/broadcast [shop=… role=… lang=…] matn\n"
               "/cleanup\n"
               "/ban <user_id>\n"
               "/unban <user_id>\n"
+              "/ban_many [ids | shop=… role=… lang=…] | CSV\n"
+              "/unban_many [ids | shop=… role=… lang=…] | CSV\n"
+              "/profile [seconds]\n"
               "/set_digest <text>\n\n"
               "Materiallar (O‘quv/FAQ):\n"
               "/faq_list\n"
@@ -352,11 +376,18 @@ TRANSLATIONS: dict[str, dict[str, str]] = {
         "TJ": "👑 Admin:\n\n"
               "/stats\n"
               "/users\n"
+              "/export_users [csv|ndjson] [gz]\n"
+              "/export_feedback [csv|ndjson] [gz]\n"
+              "/find phone|username\n"
               "/edit_user <id> <role/shop/lang/phone> <value>\n"
-              "/broadcast <text>\n"
+              "/edit_users [field] [value] [ids | shop=… role=… lang=…] | CSV\n"
+              "/broadcast [shop=… role=… lang=…] матн\n"
               "/cleanup\n"
               "/ban <user_id>\n"
               "/unban <user_id>\n"
+              "/ban_many [ids | shop=… role=… lang=…] | CSV\n"
+              "/unban_many [ids | shop=… role=… lang=…] | CSV\n"
+              "/profile [seconds]\n"
               "/set_digest <text>\n\n"
               "Мавод (Омӯзиш/FAQ):\n"
               "/faq_list\n"
@@ -366,11 +397,18 @@ TRANSLATIONS: dict[str, dict[str, str]] = {
         "KG": "👑 Admin:\n\n"
               "/stats\n"
               "/users\n"
+              "/export_users [csv|ndjson] [gz]\n"
+              "/export_feedback [csv|ndjson] [gz]\n"
+              "/find phone|username\n"
               "/edit_user <id> <role/shop/lang/phone> <value>\n"
-              "/broadcast <text>\n"
+              "/edit_users [field] [value] [ids | shop=… role=… lang=…] | CSV\n"
+              "/broadcast [shop=… role=… lang=…] текст\n"
               "/cleanup\n"
               "/ban <user_id>\n"
               "/unban <user_id>\n"
+              "/ban_many [ids | shop=… role=… lang=…] | CSV\n"
+              "/unban_many [ids | shop=… role=… lang=…] | CSV\n"
+              "/profile [seconds]\n"
               "/set_digest <text>\n\n"
               "Материалдар (Окутуу/FAQ):\n"
               "/faq_list\n"
@@ -379,11 +417,11 @@ TRANSLATIONS: dict[str, dict[str, str]] = {
               "/faq_edit <id> || title || body || tags\n",
     },
     "admin_format_broadcast": {
-        "RU": "Формат: /broadcast <text>",
-        "EN": "Format: /broadcast <text>",
-        "UZ": "Format: /broadcast <text>",
-        "TJ": "Формат: /broadcast <text>",
-        "KG": "Format: /broadcast <text>",
+        "RU": "Формат: /broadcast [shop=точка] [role=courier|picker] [lang=RU|EN|UZ|TJ|KG] текст",
+        "EN": "Format: /broadcast [shop=shop] [role=courier|picker] [lang=RU|EN|UZ|TJ|KG] text",
+        "UZ": "Format: /broadcast [shop=nuqta] [role=courier|picker] [lang=RU|EN|UZ|TJ|KG] matn",
+        "TJ": "Формат: /broadcast [shop=нуқта] [role=courier|picker] [lang=RU|EN|UZ|TJ|KG] матн",
+        "KG": "Формат: /broadcast [shop=түйүн] [role=courier|picker] [lang=RU|EN|UZ|TJ|KG] текст",
     },
     "admin_sent": {
         "RU": "✅ Sent: {sent}",
@@ -487,11 +525,11 @@ TRANSLATIONS: dict[str, dict[str, str]] = {
         "KG": "Эскертмелер боюнча аракетти тандаңыз:",
     },
     "reminder_ask_minutes": {
-        "RU": "Через сколько минут напомнить? (число)",
-        "EN": "In how many minutes? (number)",
-        "UZ": "Necha daqiqadan so‘ng eslatsin? (raqam)",
-        "TJ": "Баъд аз чанд дақиқа ёдрас кунам? (рақам)",
-        "KG": "Канча мүнөттөн кийин эскертейин? (сан)",
+        "RU": "Через сколько минут напомнить? (число)\nИли повтор: daily 08:00 · weekdays 08:00 · every 4h · cron 0 8,20 * * 1-5",
+        "EN": "In how many minutes? (number)\nOr repeat: daily 08:00 · weekdays 08:00 · every 4h · cron 0 8,20 * * 1-5",
+        "UZ": "Necha daqiqadan so‘ng eslatsin? (raqam)\nYoki takror: daily 08:00 · weekdays 08:00 · every 4h · cron 0 8,20 * * 1-5",
+        "TJ": "Баъд аз чанд дақиқа ёдрас кунам? (рақам)\nЁ такрор: daily 08:00 · weekdays 08:00 · every 4h · cron 0 8,20 * * 1-5",
+        "KG": "Канча мүнөттөн кийин эскертейин? (сан)\nЖе кайталоо: daily 08:00 · weekdays 08:00 · every 4h · cron 0 8,20 * * 1-5",
     },
     "reminder_ask_text": {
         "RU": "Что напомнить? (текст одним сообщением)",
@@ -573,6 +611,202 @@ TRANSLATIONS: dict[str, dict[str, str]] = {
         "TJ": "⏰ Ёдрас:\n{text}",
         "KG": "⏰ Эскертме:\n{text}",
     },
+    "admin_format_profile": {
+        "RU": "Формат: /profile N (секунд, 1–{max})",
+        "EN": "Format: /profile N (seconds, 1–{max})",
+        "UZ": "Format: /profile N (soniya, 1–{max})",
+        "TJ": "Формат: /profile N (сония, 1–{max})",
+        "KG": "Format: /profile N (секунд, 1–{max})",
+    },
+    "admin_profile_busy": {
+        "RU": "⏳ Профилирование уже идёт, дождитесь результата",
+        "EN": "⏳ Profiling is already running, wait for the result",
+        "UZ": "⏳ Profillash allaqachon ketmoqda, natijani kuting",
+        "TJ": "⏳ Профилкунӣ аллакай идома дорад, натиҷаро интизор шавед",
+        "KG": "⏳ Профилдөө жүрүп жатат, жыйынтыкты күтүңүз",
+    },
+    "admin_profile_started": {
+        "RU": "🔬 Профилирую {seconds} с...",
+        "EN": "🔬 Profiling for {seconds} s...",
+        "UZ": "🔬 {seconds} soniya profillanmoqda...",
+        "TJ": "🔬 {seconds} сония профилкунӣ...",
+        "KG": "🔬 {seconds} сек профилдөө...",
+    },
+    "admin_profile_done": {
+        "RU": "🔬 Профиль за {seconds} с, сэмплов: {samples}",
+        "EN": "🔬 Profile for {seconds} s, samples: {samples}",
+        "UZ": "🔬 {seconds} soniyalik profil, namunalar: {samples}",
+        "TJ": "🔬 Профил барои {seconds} сония, намунаҳо: {samples}",
+        "KG": "🔬 {seconds} сек профили, үлгүлөр: {samples}",
+    },
+    "admin_stats_loop": {
+        "RU": "⏱ Лаг event loop, мс: p50 {p50} / p95 {p95} / p99 {p99}, макс {max}\n🧊 Зависаний: {stalls}",
+        "EN": "⏱ Event loop lag, ms: p50 {p50} / p95 {p95} / p99 {p99}, max {max}\n🧊 Stalls: {stalls}",
+        "UZ": "⏱ Event loop kechikishi, ms: p50 {p50} / p95 {p95} / p99 {p99}, maks {max}\n🧊 Qotishlar: {stalls}",
+        "TJ": "⏱ Таъхири event loop, мс: p50 {p50} / p95 {p95} / p99 {p99}, ҳадди аксар {max}\n🧊 Овезишҳо: {stalls}",
+        "KG": "⏱ Event loop кечигүүсү, мс: p50 {p50} / p95 {p95} / p99 {p99}, макс {max}\n🧊 Тоңуулар: {stalls}",
+    },
+    "admin_stats_more": {
+        "RU": "🗞 Подписаны на дайджест: {digest}\n⏰ Напоминаний в очереди: {reminders}\n🚫 Недоступны (заблокировали бота): {inactive}",
+        "EN": "🗞 Digest subscribers: {digest}\n⏰ Pending reminders: {reminders}\n🚫 Unreachable (blocked the bot): {inactive}",
+        "UZ": "🗞 Dayjestga obunachilar: {digest}\n⏰ Navbatdagi eslatmalar: {reminders}\n🚫 Yetib bo‘lmaydi (botni bloklagan): {inactive}",
+        "TJ": "🗞 Обуначиёни дайджест: {digest}\n⏰ Ёдраскуниҳои навбатӣ: {reminders}\n🚫 Дастнорас (ботро манъ кардаанд): {inactive}",
+        "KG": "🗞 Дайджестке жазылгандар: {digest}\n⏰ Кезектеги эскертмелер: {reminders}\n🚫 Жеткиликсиз (ботту бөгөттөгөн): {inactive}",
+    },
+    "admin_stats_segments": {
+        "RU": "🏬 По точкам: {shops}\n👷 По ролям: {roles}\n🌐 По языкам: {langs}",
+        "EN": "🏬 By shop: {shops}\n👷 By role: {roles}\n🌐 By language: {langs}",
+        "UZ": "🏬 Nuqtalar bo‘yicha: {shops}\n👷 Rollar bo‘yicha: {roles}\n🌐 Tillar bo‘yicha: {langs}",
+        "TJ": "🏬 Аз рӯи нуқтаҳо: {shops}\n👷 Аз рӯи нақшҳо: {roles}\n🌐 Аз рӯи забонҳо: {langs}",
+        "KG": "🏬 Түйүндөр боюнча: {shops}\n👷 Ролдор боюнча: {roles}\n🌐 Тилдер боюнча: {langs}",
+    },
+    "digest_push": {
+        "RU": "🗞 Дайджест:\n{text}",
+        "EN": "🗞 Digest:\n{text}",
+        "UZ": "🗞 Dayjest:\n{text}",
+        "TJ": "🗞 Дайджест:\n{text}",
+        "KG": "🗞 Дайджест:\n{text}",
+    },
+    "daily_time_ask": {
+        "RU": "Сейчас дайджест приходит в {current}.\nНапишите время ЧЧ:ММ и, если нужно, часовой пояс, например: 08:30 или 07:00 Asia/Tashkent",
+        "EN": "Your digest now arrives at {current}.\nSend a time HH:MM and optionally a timezone, e.g. 08:30 or 07:00 Asia/Tashkent",
+        "UZ": "Hozir dayjest {current} da keladi.\nVaqtni SS:DD ko‘rinishida, kerak bo‘lsa vaqt zonasi bilan yozing, masalan: 08:30 yoki 07:00 Asia/Tashkent",
+        "TJ": "Ҳоло дайджест соати {current} меояд.\nВақтро ба шакли СС:ДД ва агар лозим бошад минтақаи вақтро нависед, масалан: 08:30 ё 07:00 Asia/Dushanbe",
+        "KG": "Азыр дайджест {current} келет.\nУбакытты СС:ММ түрүндө, керек болсо убакыт алкагы менен жазыңыз, мисалы: 08:30 же 07:00 Asia/Bishkek",
+    },
+    "daily_time_bad": {
+        "RU": "Не понял. Пример: 08:30 или 07:00 Asia/Tashkent (пояс — как в списке IANA: Europe/Moscow, Asia/Almaty…)",
+        "EN": "Didn't get that. Example: 08:30 or 07:00 Asia/Tashkent (IANA timezone: Europe/Moscow, Asia/Almaty…)",
+        "UZ": "Tushunmadim. Misol: 08:30 yoki 07:00 Asia/Tashkent (IANA zonasi: Europe/Moscow, Asia/Almaty…)",
+        "TJ": "Нафаҳмидам. Мисол: 08:30 ё 07:00 Asia/Dushanbe (минтақаи IANA: Europe/Moscow, Asia/Almaty…)",
+        "KG": "Түшүнгөн жокмун. Мисал: 08:30 же 07:00 Asia/Bishkek (IANA алкагы: Europe/Moscow, Asia/Almaty…)",
+    },
+    "daily_time_set": {
+        "RU": "Готово ✅ Дайджест будет приходить в {time} ({tz}).",
+        "EN": "Done ✅ The digest will arrive at {time} ({tz}).",
+        "UZ": "Tayyor ✅ Dayjest {time} da keladi ({tz}).",
+        "TJ": "Тайёр ✅ Дайджест соати {time} меояд ({tz}).",
+        "KG": "Даяр ✅ Дайджест {time} келет ({tz}).",
+    },
+    "reminder_set_recurring": {
+        "RU": "Ок! Повторяющееся напоминание ({rule}) ✅ Ближайшее: {when}",
+        "EN": "Ok! Recurring reminder ({rule}) ✅ Next: {when}",
+        "UZ": "OK! Takroriy eslatma ({rule}) ✅ Keyingisi: {when}",
+        "TJ": "Ок! Ёдраскунии такрорӣ ({rule}) ✅ Навбатӣ: {when}",
+        "KG": "Ок! Кайталанма эскертме ({rule}) ✅ Кийинкиси: {when}",
+    },
+    "reminder_recurring_stopped": {
+        "RU": "Повторяющиеся напоминания удалены: {n}",
+        "EN": "Recurring reminders removed: {n}",
+        "UZ": "Takroriy eslatmalar o‘chirildi: {n}",
+        "TJ": "Ёдраскуниҳои такрорӣ нест карда шуданд: {n}",
+        "KG": "Кайталанма эскертмелер өчүрүлдү: {n}",
+    },
+    "reminder_push_many": {
+        "RU": "⏰ Напоминания ({n}):\n{text}",
+        "EN": "⏰ Reminders ({n}):\n{text}",
+        "UZ": "⏰ Eslatmalar ({n}):\n{text}",
+        "TJ": "⏰ Ёдрасҳо ({n}):\n{text}",
+        "KG": "⏰ Эскертмелер ({n}):\n{text}",
+    },
+    "admin_format_export": {
+        "RU": "Формат: /export_users [csv|ndjson] [gz] или /export_feedback [csv|ndjson] [gz]",
+        "EN": "Format: /export_users [csv|ndjson] [gz] or /export_feedback [csv|ndjson] [gz]",
+        "UZ": "Format: /export_users [csv|ndjson] [gz] yoki /export_feedback [csv|ndjson] [gz]",
+        "TJ": "Формат: /export_users [csv|ndjson] [gz] ё /export_feedback [csv|ndjson] [gz]",
+        "KG": "Формат: /export_users [csv|ndjson] [gz] же /export_feedback [csv|ndjson] [gz]",
+    },
+    "admin_export_started": {
+        "RU": "📦 Готовлю выгрузку, пришлю файлом…",
+        "EN": "📦 Preparing the export, will send it as a file…",
+        "UZ": "📦 Eksport tayyorlanmoqda, fayl qilib yuboraman…",
+        "TJ": "📦 Содиротро омода мекунам, ҳамчун файл мефиристам…",
+        "KG": "📦 Экспорт даярдалууда, файл катары жөнөтөм…",
+    },
+    "admin_export_done": {
+        "RU": "📦 {kind}: {rows} строк",
+        "EN": "📦 {kind}: {rows} rows",
+        "UZ": "📦 {kind}: {rows} qator",
+        "TJ": "📦 {kind}: {rows} сатр",
+        "KG": "📦 {kind}: {rows} сап",
+    },
+    "admin_export_too_big": {
+        "RU": "Файл больше 50 МБ — Telegram его не примет. Попробуйте с gz.",
+        "EN": "The file is over 50 MB and Telegram won't accept it. Try with gz.",
+        "UZ": "Fayl 50 MB dan katta — Telegram qabul qilmaydi. gz bilan urinib ko‘ring.",
+        "TJ": "Файл аз 50 МБ калон аст — Telegram онро қабул намекунад. Бо gz кӯшиш кунед.",
+        "KG": "Файл 50 МБдан чоң — Telegram кабыл албайт. gz менен аракет кылыңыз.",
+    },
+    "admin_page_empty": {
+        "RU": "Здесь больше ничего нет",
+        "EN": "Nothing more here",
+        "UZ": "Bu yerda boshqa hech narsa yo‘q",
+        "TJ": "Дигар чизе нест",
+        "KG": "Мында башка эч нерсе жок",
+    },
+    "admin_format_find": {
+        "RU": "Формат: /find начало телефона или username (например /find +7999 или /find ivan)",
+        "EN": "Format: /find phone or username prefix (e.g. /find +7999 or /find ivan)",
+        "UZ": "Format: /find telefon yoki username boshi (masalan /find +7999 yoki /find ivan)",
+        "TJ": "Формат: /find ибтидои телефон ё username (масалан /find +7999 ё /find ivan)",
+        "KG": "Формат: /find телефондун же username'дин башы (мисалы /find +7999 же /find ivan)",
+    },
+    "admin_format_bulk": {
+        "RU": "Формат: /ban_many (или /unban_many) [id id …] | shop=… role=… lang=…\nИли пришлите CSV-файл с этой командой в подписи (колонка user_id или id в первой колонке).",
+        "EN": "Format: /ban_many (or /unban_many) [id id …] | shop=… role=… lang=…\nOr send a CSV file with the command as its caption (a user_id column or ids in the first column).",
+        "UZ": "Format: /ban_many (yoki /unban_many) [id id …] | shop=… role=… lang=…\nYoki izohida shu buyruq bilan CSV fayl yuboring (user_id ustuni yoki birinchi ustunda id).",
+        "TJ": "Формат: /ban_many (ё /unban_many) [id id …] | shop=… role=… lang=…\nЁ файли CSV-ро бо ҳамин фармон дар тавзеҳ фиристед (сутуни user_id ё id дар сутуни аввал).",
+        "KG": "Формат: /ban_many (же /unban_many) [id id …] | shop=… role=… lang=…\nЖе ушул буйрук жазылган CSV файлды жөнөтүңүз (user_id тилкеси же биринчи тилкеде id).",
+    },
+    "admin_format_edit_users": {
+        "RU": "Формат: /edit_users [role/shop/lang/phone] [value] [id id …] | shop=… role=… lang=…\nИли пришлите CSV-файл с подписью /edit_users: колонка user_id и нужные из role, shop, lang, phone.",
+        "EN": "Format: /edit_users [role/shop/lang/phone] [value] [id id …] | shop=… role=… lang=…\nOr send a CSV file captioned /edit_users: a user_id column plus any of role, shop, lang, phone.",
+        "UZ": "Format: /edit_users [role/shop/lang/phone] [value] [id id …] | shop=… role=… lang=…\nYoki /edit_users izohli CSV fayl yuboring: user_id ustuni va role, shop, lang, phone dan keraklilari.",
+        "TJ": "Формат: /edit_users [role/shop/lang/phone] [value] [id id …] | shop=… role=… lang=…\nЁ файли CSV бо тавзеҳи /edit_users фиристед: сутуни user_id ва аз role, shop, lang, phone лозимаш.",
+        "KG": "Формат: /edit_users [role/shop/lang/phone] [value] [id id …] | shop=… role=… lang=…\nЖе /edit_users деп жазылган CSV файлды жөнөтүңүз: user_id тилкеси жана role, shop, lang, phone ичинен керектүүлөрү.",
+    },
+    "admin_bulk_too_big": {
+        "RU": "⚠️ Файл больше {mb} МБ",
+        "EN": "⚠️ The file is larger than {mb} MB",
+        "UZ": "⚠️ Fayl {mb} MB dan katta",
+        "TJ": "⚠️ Файл аз {mb} МБ калонтар аст",
+        "KG": "⚠️ Файл {mb} МБдан чоң",
+    },
+    "admin_bulk_done": {
+        "RU": "✅ Готово: изменено {changed} из {total}",
+        "EN": "✅ Done: {changed} of {total} changed",
+        "UZ": "✅ Tayyor: {total} tadan {changed} tasi o‘zgardi",
+        "TJ": "✅ Тайёр: аз {total} {changed} тағйир ёфт",
+        "KG": "✅ Даяр: {total} ичинен {changed} өзгөрдү",
+    },
+    "admin_bulk_missing": {
+        "RU": "Не найдены: {ids}",
+        "EN": "Not found: {ids}",
+        "UZ": "Topilmadi: {ids}",
+        "TJ": "Ёфт нашуд: {ids}",
+        "KG": "Табылган жок: {ids}",
+    },
+    "admin_broadcast_started": {
+        "RU": "📣 Рассылка запущена: получателей {total}. Итог пришлю, когда закончится.",
+        "EN": "📣 Broadcast started: {total} recipients. I'll report when it's done.",
+        "UZ": "📣 Xabar yuborish boshlandi: {total} ta qabul qiluvchi. Tugagach natijani yuboraman.",
+        "TJ": "📣 Фиристодан оғоз шуд: {total} гиранда. Пас аз анҷом натиҷаро мефиристам.",
+        "KG": "📣 Таратуу башталды: {total} алуучу. Бүткөндө жыйынтыгын жиберем.",
+    },
+    "admin_bad_lang": {
+        "RU": "Язык должен быть одним из: {langs}",
+        "EN": "Language must be one of: {langs}",
+        "UZ": "Til quyidagilardan biri bo‘lishi kerak: {langs}",
+        "TJ": "Забон бояд яке аз инҳо бошад: {langs}",
+        "KG": "Тил булардын бири болушу керек: {langs}",
+    },
+    "admin_bulk_bad_csv": {
+        "RU": "⚠️ Не удалось прочитать файл. Нужен CSV в кодировке UTF-8 (в Excel: «Сохранить как» → «CSV UTF-8»).",
+        "EN": "⚠️ Could not read the file. Send a CSV in UTF-8 (in Excel: Save As → CSV UTF-8).",
+        "UZ": "⚠️ Faylni o‘qib bo‘lmadi. UTF-8 kodlashdagi CSV kerak (Excel: Save As → CSV UTF-8).",
+        "TJ": "⚠️ Файлро хондан нашуд. CSV бо рамзгузории UTF-8 лозим аст (Excel: Save As → CSV UTF-8).",
+        "KG": "⚠️ Файлды окуу мүмкүн болгон жок. UTF-8 коддогу CSV керек (Excel: Save As → CSV UTF-8).",
+    },
 }
 
 def get_user_lang(user_id: int) -> str:
@@ -581,13 +815,51 @@ def get_user_lang(user_id: int) -> str:
         return user[4]
     return "RU"
 
-def tr(key: str, user_id: int | None = None, **kwargs) -> str:
-    lang = "RU"
-    if user_id is not None:
-        lang = get_user_lang(user_id)
+def tr_lang(key: str, lang: str, **kwargs) -> str:
     table = TRANSLATIONS.get(key, {})
     template = table.get(lang) or table.get("RU") or key
     try:
         return template.format(**kwargs)
     except Exception:
         return template
+
+def tr(key: str, user_id: int | None = None, **kwargs) -> str:
+    lang = "RU"
+    if user_id is not None:
+        lang = get_user_lang(user_id)
+    return tr_lang(key, lang, **kwargs)
+
+# ----- Рассылки: рендер один раз на язык, а не на получателя -----
+def group_by_lang(user_ids: Iterable[int]) -> dict[str, list[int]]:
+    groups: dict[str, list[int]] = {}
+    for uid in user_ids:
+        groups.setdefault(get_user_lang(uid), []).append(uid)
+    return groups
+
+_VARIANT_RE = re.compile(r"^(RU|EN|UZ|TJ|KG):\s?(.*)$")
+
+def parse_lang_variants(text: str) -> dict[str, str]:
+    """Текст рассылки/дайджеста с вариантами по языкам:
+
+        RU: Привет
+        UZ: Salom
+
+    -> {"RU": "Привет", "UZ": "Salom"}. Строки без префикса продолжают текущий вариант;
+    текст до первого префикса (или весь текст без префиксов) — общий вариант под ключом "".
+    """
+    variants: dict[str, list[str]] = {}
+    current = ""
+    for line in text.splitlines():
+        m = _VARIANT_RE.match(line)
+        if m:
+            current = m.group(1)
+            line = m.group(2)
+        variants.setdefault(current, []).append(line)
+    return {k: "\n".join(v).strip() for k, v in variants.items() if "\n".join(v).strip()}
+
+def pick_variant(variants: dict[str, str], lang: str) -> str:
+    """Вариант для языка; иначе общий, иначе русский, иначе любой."""
+    for k in (lang, "", "RU"):
+        if variants.get(k):
+            return variants[k]
+    return next(iter(variants.values()), "")